@@ -1,9 +1,9 @@
-import asyncio
 import concurrent.futures
 import sys
 import yaml
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from typing import List
 
 import aztk.models as models
 import azure.batch.models as batch_models
@@ -12,19 +12,28 @@ import aztk.utils.azure_api as azure_api
 import aztk.utils.constants as constants
 import aztk.utils.get_ssh_key as get_ssh_key
 import aztk.utils.helpers as helpers
-import aztk.utils.ssh as ssh_lib
+import aztk.utils.metrics as metrics
+import aztk.utils.tracing as tracing
 import azure.batch.models as batch_models
 from azure.batch.models import batch_error
-from Crypto.PublicKey import RSA
-from aztk.internal import cluster_data
+from aztk.internal import cache, cluster_data
 
 class Client:
     def __init__(self, secrets_config: models.SecretsConfiguration):
         self.secrets_config = secrets_config
 
         azure_api.validate_secrets(secrets_config)
-        self.batch_client = azure_api.make_batch_client(secrets_config)
-        self.blob_client = azure_api.make_blob_client(secrets_config)
+        self._metrics = metrics.MetricsRegistry(parent=metrics.default_registry)
+        self.batch_client = azure_api.make_batch_client(secrets_config, self._metrics)
+        self.blob_client = azure_api.make_blob_client(secrets_config, self._metrics)
+        self._remote_login_settings_cache = cache.TTLCache(ttl=constants.REMOTE_LOGIN_SETTINGS_CACHE_TTL)
+
+    def metrics(self) -> dict:
+        """
+        Snapshot of the metrics of the Batch and Storage calls made by this client.
+        Use aztk.utils.metrics.export to format it.
+        """
+        return self._metrics.snapshot()
 
     def get_cluster_config(self, cluster_id: str) -> models.ClusterConfiguration:
         return self._get_cluster_data(cluster_id).read_cluster_config()
@@ -68,6 +77,7 @@ class Client:
 
         return job_exists or pool_exists
 
+    @tracing.traced("create pool and job")
     def __create_pool_and_job(self, cluster_conf: models.ClusterConfiguration, software_metadata_key: str, start_task, VmImageModel):
         """
             Create a pool and job
@@ -136,7 +146,10 @@ class Client:
             :return pool: CloudPool, nodes: ComputeNodePaged
         """
         pool = self.batch_client.pool.get(cluster_id)
-        nodes = self.batch_client.compute_node.list(pool_id=cluster_id)
+        nodes = self.batch_client.compute_node.list(
+            pool_id=cluster_id,
+            compute_node_list_options=batch_models.ComputeNodeListOptions(
+                select="id,state,ipAddress,isDedicated,affinityId"))
         return pool, nodes
 
     def __list_clusters(self, software_metadata_key):
@@ -156,6 +169,19 @@ class Client:
                 aztk_pools.append(pool)
         return aztk_pools
 
+    def __get_cluster_node_counts(self, pool_ids: List[str]):
+        """
+            Count the nodes of many pools in each state, the pools are queried concurrently
+            :param pool_ids: ids of the pools
+            :returns dict pool_id -> aztk.models.NodeCounts
+        """
+        if not pool_ids:
+            return {}
+        max_workers = min(len(pool_ids), constants.NODE_COUNTS_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            counts = executor.map(lambda pool_id: helpers.get_cluster_node_counts(pool_id, self.batch_client), pool_ids)
+            return dict(zip(pool_ids, counts))
+
     def __create_user(self, pool_id: str, node_id: str, username: str, password: str = None, ssh_key: str = None) -> str:
         """
             Create a pool user
@@ -199,6 +225,33 @@ class Client:
             pool_id, node_id)
         return models.RemoteLogin(ip_address=result.remote_login_ip_address, port=str(result.remote_login_port))
 
+    def __get_remote_login_settings_for_cluster(self, pool_id: str, nodes=None):
+        """
+        Get the remote_login_settings of all the nodes of a pool, fetched concurrently.
+        The result is kept for a short time so consecutive operations on a cluster don't fetch it again.
+        :param pool_id
+        :param nodes: the nodes of the pool if already listed
+        :returns dict node_id -> aztk.models.RemoteLogin
+        """
+        cached = self._remote_login_settings_cache.get(pool_id)
+        if cached is not None and (nodes is None or all(node.id in cached for node in nodes)):
+            return cached
+
+        if nodes is None:
+            nodes = self.batch_client.compute_node.list(
+                pool_id, batch_models.ComputeNodeListOptions(select="id"))
+        node_ids = [node.id for node in nodes]
+        if not node_ids:
+            return {}
+
+        max_workers = min(len(node_ids), constants.REMOTE_LOGIN_SETTINGS_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            settings = executor.map(lambda node_id: self.__get_remote_login_settings(pool_id, node_id), node_ids)
+            remote_login_settings = dict(zip(node_ids, settings))
+
+        self._remote_login_settings_cache.set(pool_id, remote_login_settings)
+        return remote_login_settings
+
     def __create_user_on_node(self, username, pool_id, node_id, ssh_key):
         try:
             self.__create_user(pool_id=pool_id, node_id=node_id, username=username, ssh_key=ssh_key)
@@ -212,6 +265,7 @@ class Client:
         return ssh_key
 
     def __create_user_on_pool(self, username, pool_id, nodes):
+        from Crypto.PublicKey import RSA
         ssh_key = RSA.generate(2048)
         ssh_pub_key = ssh_key.publickey().exportKey('OpenSSH').decode('utf-8')
         with concurrent.futures.ThreadPoolExecutor() as executor:
@@ -229,38 +283,55 @@ class Client:
             concurrent.futures.wait(futures)
 
 
-    def __cluster_run(self, cluster_id, container_name, command):
+    def __cluster_run(self, cluster_id, container_name, command, max_concurrency=constants.SSH_MAX_CONCURRENCY,
+                      timeout=constants.SSH_CONNECT_TIMEOUT, output_callback=None,
+                      command_timeout=constants.SSH_COMMAND_TIMEOUT):
         pool, nodes = self.__get_pool_details(cluster_id)
         nodes = [node for node in nodes]
-        cluster_nodes = [self.__get_remote_login_settings(pool.id, node.id) for node in nodes]
+        remote_login_settings = self.__get_remote_login_settings_for_cluster(pool.id, nodes)
+        cluster_nodes = [(node.id, remote_login_settings[node.id]) for node in nodes]
+        import aztk.utils.ssh as ssh_lib
         try:
             ssh_key = self.__create_user_on_pool('aztk', pool.id, nodes)
-            asyncio.get_event_loop().run_until_complete(ssh_lib.clus_exec_command(command,
-                                                                                  container_name,
-                                                                                  'aztk',
-                                                                                  cluster_nodes,
-                                                                                  ssh_key=ssh_key.exportKey().decode('utf-8')))
+            return helpers.run_coroutine(ssh_lib.clus_exec_command(command,
+                                                                   container_name,
+                                                                   'aztk',
+                                                                   cluster_nodes,
+                                                                   ssh_key=ssh_key.exportKey().decode('utf-8'),
+                                                                   max_concurrency=max_concurrency,
+                                                                   timeout=timeout,
+                                                                   output_callback=output_callback,
+                                                                   command_timeout=command_timeout))
         except OSError as exc:
             raise exc
         finally:
             self.__delete_user_on_pool('aztk', pool.id, nodes)
 
-    def __cluster_copy(self, cluster_id, container_name, source_path, destination_path):
+    def __cluster_copy(self, cluster_id, container_name, source_path, destination_path,
+                       max_concurrency=constants.SSH_MAX_CONCURRENCY, timeout=constants.SSH_CONNECT_TIMEOUT,
+                       command_timeout=constants.SSH_COMMAND_TIMEOUT):
         pool, nodes = self.__get_pool_details(cluster_id)
         nodes = [node for node in nodes]
-        cluster_nodes = [self.__get_remote_login_settings(pool.id, node.id) for node in nodes]
+        remote_login_settings = self.__get_remote_login_settings_for_cluster(pool.id, nodes)
+        cluster_nodes = [(node.id, remote_login_settings[node.id]) for node in nodes]
+        import aztk.utils.ssh as ssh_lib
         try:
             ssh_key = self.__create_user_on_pool('aztk', pool.id, nodes)
-            asyncio.get_event_loop().run_until_complete(ssh_lib.clus_copy(container_name=container_name,
-                                                                          username='aztk',
-                                                                          nodes=cluster_nodes,
-                                                                          source_path=source_path,
-                                                                          destination_path=destination_path,
-                                                                          ssh_key=ssh_key.exportKey().decode('utf-8')))
+            results = helpers.run_coroutine(ssh_lib.clus_copy(container_name=container_name,
+                                                              username='aztk',
+                                                              nodes=cluster_nodes,
+                                                              source_path=source_path,
+                                                              destination_path=destination_path,
+                                                              ssh_key=ssh_key.exportKey().decode('utf-8'),
+                                                              max_concurrency=max_concurrency,
+                                                              timeout=timeout,
+                                                              command_timeout=command_timeout))
             self.__delete_user_on_pool('aztk', pool.id, nodes)
+            return results
         except (OSError, batch_error.BatchErrorException) as exc:
             raise exc
 
+    @tracing.traced("create job schedule")
     def __submit_job(self,
                      job_configuration,
                      start_task,
@@ -376,10 +447,19 @@ class Client:
     def get_remote_login_settings(self, cluster_id, node_id):
         raise NotImplementedError()
 
-    def cluster_run(self, cluster_id, command):
+    def get_remote_login_settings_for_cluster(self, cluster_id):
+        raise NotImplementedError()
+
+    def get_cluster_node_counts(self, cluster_id):
+        raise NotImplementedError()
+
+    def cluster_run(self, cluster_id, command, max_concurrency=constants.SSH_MAX_CONCURRENCY,
+                    timeout=constants.SSH_CONNECT_TIMEOUT, output_callback=None,
+                    command_timeout=constants.SSH_COMMAND_TIMEOUT):
         raise NotImplementedError()
 
-    def cluster_copy(self, cluster_id, source_path, destination_path):
+    def cluster_copy(self, cluster_id, source_path, destination_path, max_concurrency=constants.SSH_MAX_CONCURRENCY,
+                     timeout=constants.SSH_CONNECT_TIMEOUT, command_timeout=constants.SSH_COMMAND_TIMEOUT):
         raise NotImplementedError()
 
     def submit_job(self, job):
@@ -15,6 +15,9 @@ class ClusterNotReadyError(AztkError):
 class AzureApiInitError(AztkError):
     pass
 
+class WaitTimeoutError(AztkError):
+    pass
+
 class InvalidPluginConfigurationError(AztkError):
     pass
 
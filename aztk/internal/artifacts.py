@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+import azure.batch.models as batch_models
+from azure.storage.blob import BlockBlobService
+from aztk.utils import constants, helpers, tracing
+from .cache import DiskCache, TTLCache
+from .cluster_data.blob_data import BlobData
+
+"""
+    sha256 of local files keyed by path, modification time and size
+"""
+file_hash_cache = DiskCache("file-hashes", ttl=constants.FILE_HASH_CACHE_TTL)
+
+
+def file_sha256(path: str) -> str:
+    """
+    sha256 of the file, read from the hash cache when the file didn't change since it was last hashed
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = file_hash_cache.get(key)
+    if digest is None:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(constants.FILE_HASH_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        file_hash_cache.set(key, digest)
+    return digest
+
+
+class UploadProgress:
+    """
+    Aggregate the progress of many uploads and report it as (uploaded bytes, total bytes)
+    """
+    def __init__(self, total: int, callback: Callable[[int, int], None] = None):
+        self.total = total
+        self.callback = callback
+        self._uploaded = {}
+        self._lock = threading.Lock()
+
+    @property
+    def uploaded(self) -> int:
+        return sum(self._uploaded.values())
+
+    def file_callback(self, key):
+        """
+        :returns: progress_callback for the upload of one file
+        """
+        def callback(current, _):
+            with self._lock:
+                self._uploaded[key] = current
+                uploaded = self.uploaded
+            if self.callback:
+                self.callback(uploaded, self.total)
+        return callback
+
+
+class ArtifactStore:
+    """
+    Content addressed store of the files used by applications.
+    Every file is stored once per storage account under artifacts/<sha256> in a container shared by all the
+    clusters and jobs, so a file used by many applications is only uploaded once.
+    :param max_workers: number of files uploaded at the same time
+    :param max_connections: number of blocks of a large file uploaded at the same time
+    """
+    CONTAINER = constants.SHARED_CONTAINER
+    PREFIX = "artifacts/"
+
+    # Artifacts known to exist, per storage account
+    _known = TTLCache(ttl=constants.ARTIFACT_EXISTS_CACHE_TTL)
+
+    def __init__(self, blob_client: BlockBlobService,
+                 max_workers: int = constants.ARTIFACT_UPLOAD_MAX_WORKERS,
+                 max_connections: int = constants.BLOB_UPLOAD_MAX_CONNECTIONS):
+        self.blob_client = blob_client
+        self.max_workers = max_workers
+        self.max_connections = max_connections
+
+    def blob_name(self, digest: str) -> str:
+        return self.PREFIX + digest
+
+    def exists(self, digest: str) -> bool:
+        key = (self.blob_client.account_name, digest)
+        if self._known.get(key):
+            return True
+        exists = self.blob_client.exists(self.CONTAINER, self.blob_name(digest))
+        if exists:
+            self._known.set(key, True)
+        return exists
+
+    def __upload_blob(self, digest: str, local_path: str, progress_callback=None):
+        helpers.upload_blob_resumable(self.CONTAINER, self.blob_name(digest), local_path, self.blob_client,
+                                      max_connections=self.max_connections, progress_callback=progress_callback)
+        self._known.set((self.blob_client.account_name, digest), True)
+
+    def __blob_data(self, digest: str, local_path: str) -> BlobData:
+        blob_data = BlobData(self.blob_client, self.CONTAINER, self.blob_name(digest))
+        blob_data.dest = os.path.basename(local_path)
+        return blob_data
+
+    def upload(self, local_path: str) -> BlobData:
+        """
+        Upload the file unless the same content is already stored
+        :returns: BlobData of the artifact, its destination is the name of the local file
+        """
+        return self.upload_all([local_path])[0]
+
+    @tracing.traced("upload artifacts")
+    def upload_all(self, local_paths: List[str], progress_callback: Callable[[int, int], None] = None) \
+            -> List[BlobData]:
+        """
+        Upload the files whose content isn't stored yet, concurrently. Files with the same content are uploaded once.
+        The container is created once, only when something has to be uploaded.
+        :param progress_callback: called with (uploaded bytes, total bytes) while the missing files are uploaded
+        :returns: BlobData of the artifacts, in the order of local_paths
+        """
+        if not local_paths:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(local_paths))) as executor:
+            digests = list(executor.map(tracing.propagate(file_sha256), local_paths))
+            unique = dict(zip(digests, local_paths))
+            existing = dict(zip(unique, executor.map(tracing.propagate(self.exists), unique)))
+            missing = {digest: path for digest, path in unique.items() if not existing[digest]}
+
+            if missing:
+                progress = UploadProgress(sum(os.path.getsize(path) for path in missing.values()), progress_callback)
+                uploads = [
+                    executor.submit(tracing.propagate(helpers.in_container), self.CONTAINER, self.blob_client,
+                                    self.__upload_blob, digest, path, progress.file_callback(digest))
+                    for digest, path in missing.items()
+                ]
+                for upload in uploads:
+                    upload.result()
+
+        return [self.__blob_data(digest, path) for digest, path in zip(digests, local_paths)]
+
+    def upload_resource_file(self, local_path: str, node_path: str = None) -> batch_models.ResourceFile:
+        return self.upload(local_path).to_resource_file(
+            node_path, expiry_days=constants.ARTIFACT_SAS_EXPIRY_DAYS, container_token=True)
+
+    def upload_resource_files(self, local_paths: List[str], progress_callback: Callable[[int, int], None] = None) \
+            -> List[batch_models.ResourceFile]:
+        return [
+            blob_data.to_resource_file(expiry_days=constants.ARTIFACT_SAS_EXPIRY_DAYS, container_token=True)
+            for blob_data in self.upload_all(local_paths, progress_callback)
+        ]
@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Thread safe in memory cache whose entries expire after a time to live
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(key) -> str:
+        if isinstance(key, (tuple, list)):
+            return "|".join(str(part) for part in key)
+        return str(key)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(self._key(key))
+            if entry is None or entry[0] <= time.time():
+                return default
+            return entry[1]
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            self._entries[self._key(key)] = (time.time() + (self.ttl if ttl is None else ttl), value)
+
+    def get_or_set(self, key, factory, ttl: float = None):
+        """
+        Return the cached value or compute it with factory() and cache it
+        """
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key=None):
+        """
+        Drop the given entry, or every entry when no key is given
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(key), None)
+
+
+class DiskCache(TTLCache):
+    """
+    TTLCache persisted as a json file so it is shared between processes.
+    Values must be json serializable. Any error reading or writing the file is logged and
+    the cache keeps working in memory.
+    :param name: name of the cache file in the cache directory
+    :param ttl: default time to live of the entries in seconds
+    :param directory: where to store the cache, defaults to ~/.aztk/cache
+    :param private: only let the current user read the file
+    """
+
+    def __init__(self, name: str, ttl: float, directory: str = None, private: bool = False):
+        super().__init__(ttl)
+        if directory is None:
+            # aztk.utils builds caches when it is imported, importing it at the top would be circular
+            from aztk.utils import constants
+            directory = constants.CACHE_DIRECTORY
+        self.path = os.path.join(directory, name + ".json")
+        self.private = private
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, encoding="UTF-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.debug("Ignoring unreadable cache %s: %s", self.path, e)
+            return
+        now = time.time()
+        for key, (expiry, value) in entries.items():
+            if expiry > now and key not in self._entries:
+                self._entries[key] = (expiry, value)
+
+    def _save(self):
+        try:
+            directory = os.path.dirname(self.path)
+            os.makedirs(directory, 0o700 if self.private else 0o777, exist_ok=True)
+            if self.private:
+                # makedirs leaves the mode of an existing directory as it is
+                os.chmod(directory, 0o700)
+            tmp_path = "{0}.{1}.{2}.tmp".format(self.path, os.getpid(), threading.get_ident())
+            flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+            fd = os.open(tmp_path, flags, 0o600 if self.private else 0o666)
+            with os.fdopen(fd, "w", encoding="UTF-8") as f:
+                json.dump({key: list(entry) for key, entry in self._entries.items()}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.debug("Could not persist cache %s: %s", self.path, e)
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._load()
+            return super().get(key, default)
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            self._load()
+            super().set(key, value, ttl)
+            self._save()
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._load()
+            super().invalidate(key)
+            self._save()
@@ -1,3 +1,4 @@
 from .blob_data import *
 from .node_data import *
+from .node_scripts_bundle import NodeScriptsBundle
 from .cluster_data import *
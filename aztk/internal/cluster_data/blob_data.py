@@ -1,6 +1,6 @@
 import azure.batch.models as batch_models
-import datetime
-from azure.storage.blob import BlockBlobService, BlobPermissions
+from azure.storage.blob import BlockBlobService
+from aztk.internal import sas
 
 class BlobData:
     """
@@ -13,14 +13,15 @@ class BlobData:
         self.blob_client = blob_client
 
 
-    def to_resource_file(self, dest: str = None) -> batch_models.ResourceFile:
-        sas_token = self.blob_client.generate_blob_shared_access_signature(
-            self.container,
-            self.blob,
-            permission=BlobPermissions.READ,
-            expiry=datetime.datetime.utcnow() + datetime.timedelta(days=365))
-
-        sas_url = self.blob_client.make_blob_url(
-            self.container, self.blob, sas_token=sas_token)
+    def to_resource_file(self, dest: str = None, expiry_days: int = 365,
+                         container_token: bool = False) -> batch_models.ResourceFile:
+        """
+        :param container_token: sign the url with the reused token of the whole container instead of a token for
+            this blob only
+        """
+        if container_token:
+            sas_url = sas.sas_provider.blob_url(self.blob_client, self.container, self.blob, expiry_days=expiry_days)
+        else:
+            sas_url = sas.signed_blob_url(self.blob_client, self.container, self.blob, expiry_days=expiry_days)
 
         return batch_models.ResourceFile(file_path=dest or self.dest, blob_source=sas_url)
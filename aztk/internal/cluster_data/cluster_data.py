@@ -2,6 +2,7 @@ import yaml
 import logging
 import azure.common
 from azure.storage.blob import BlockBlobService
+from aztk.utils import helpers, tracing
 from .node_data import NodeData
 from .blob_data import BlobData
 
@@ -24,7 +25,8 @@ class ClusterData:
         blob_path = self.CLUSTER_DIR + "/" + self.CLUSTER_CONFIG_FILE
         content = yaml.dump(cluster_config)
         container_name = cluster_config.cluster_id
-        self.blob_client.create_blob_from_text(container_name, blob_path, content)
+        helpers.in_container(container_name, self.blob_client, self.blob_client.create_blob_from_text, container_name,
+                             blob_path, content)
 
     def read_cluster_config(self):
         blob_path = self.CLUSTER_DIR + "/" + self.CLUSTER_CONFIG_FILE
@@ -37,7 +39,8 @@ class ClusterData:
             logging.warn("Cluster %s contains invalid cluster configuration in blob", self.cluster_id)
 
     def upload_file(self, blob_path: str, local_path: str) -> BlobData:
-        self.blob_client.create_blob_from_path(self.cluster_id, blob_path, local_path)
+        helpers.in_container(self.cluster_id, self.blob_client, helpers.upload_blob_resumable, self.cluster_id,
+                             blob_path, local_path, self.blob_client)
         return BlobData(self.blob_client, self.cluster_id, blob_path)
 
     def upload_cluster_file(self, blob_path: str, local_path: str) -> BlobData:
@@ -50,11 +53,20 @@ class ClusterData:
         blob_data.dest = blob_path
         return blob_data
 
+    def upload_bytes(self, blob_path: str, content: bytes) -> BlobData:
+        helpers.in_container(self.cluster_id, self.blob_client, self.blob_client.create_blob_from_bytes,
+                             self.cluster_id, blob_path, content)
+        return BlobData(self.blob_client, self.cluster_id, blob_path)
+
+    @tracing.traced("upload node data")
     def upload_node_data(self, node_data: NodeData) -> BlobData:
-        return self.upload_cluster_file("node-scripts.zip", node_data.zip_path)
+        blob_data = self.upload_bytes(self.CLUSTER_DIR + "/node-scripts.zip", node_data.getvalue())
+        blob_data.dest = "node-scripts.zip"
+        return blob_data
 
     def _ensure_container(self):
-        self.blob_client.create_container(self.cluster_id, fail_on_exist=False)
+        helpers.ensure_container(self.cluster_id, self.blob_client)
 
     def delete_container(self, container_name: str):
         self.blob_client.delete_container(container_name)
+        helpers.forget_container(container_name, self.blob_client)
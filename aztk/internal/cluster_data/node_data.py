@@ -6,8 +6,8 @@ import yaml
 import zipfile
 from pathlib import Path
 from typing import List
-from aztk.spark import models
-from aztk.utils import constants, file_utils, secure_utils
+from aztk import models
+from aztk.utils import constants, secure_utils
 from aztk.error import InvalidCustomScriptError
 
 ROOT_PATH = constants.ROOT_PATH
@@ -25,13 +25,15 @@ class NodeData:
     """
 
     def __init__(self, cluster_config: models.ClusterConfiguration):
-        self.zip_path = os.path.join(ROOT_PATH, "tmp/node-scripts.zip")
+        # The zip is built in memory so concurrent cluster creations don't share any file
         self.cluster_config = cluster_config
-        file_utils.ensure_dir(self.zip_path)
-        self.zipf = zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED)
+        self.buffer = io.BytesIO()
+        self.zipf = zipfile.ZipFile(self.buffer, "w", zipfile.ZIP_DEFLATED)
 
     def add_core(self):
-        self._add_node_scripts()
+        """
+        Add the per cluster data. The node scripts are shipped separately in the NodeScriptsBundle
+        """
         self._add_custom_scripts()
         self._add_plugins()
         self._add_spark_configuration()
@@ -42,6 +44,12 @@ class NodeData:
         self.zipf.close()
         return self
 
+    def getvalue(self) -> bytes:
+        """
+        Content of the zip, once done
+        """
+        return self.buffer.getvalue()
+
     def add_file(self, file: str, zip_dir: str, binary: bool = True):
         if not file:
             return
@@ -153,9 +161,6 @@ class NodeData:
         self.zipf.writestr(os.path.join('plugins', 'plugins-manifest.yaml'), yaml.dump(data))
         return zipf
 
-    def _add_node_scripts(self):
-        self.add_dir(os.path.join(ROOT_PATH, NODE_SCRIPT_FOLDER), NODE_SCRIPT_FOLDER, exclude=['*.pyc*'])
-
     def _includeFile(self, filename: str, exclude: List[str] = []) -> bool:
         for pattern in exclude:
             if fnmatch.fnmatch(filename, pattern):
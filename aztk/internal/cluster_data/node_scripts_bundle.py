@@ -0,0 +1,120 @@
+import fnmatch
+import hashlib
+import io
+import os
+import threading
+import zipfile
+from typing import List, Tuple
+from azure.storage.blob import BlockBlobService
+from aztk.internal.cache import DiskCache, TTLCache
+from aztk.utils import constants, helpers, tracing
+from aztk.version import __version__
+from .blob_data import BlobData
+
+NODE_SCRIPT_FOLDER = "aztk"
+EXCLUDE = ["*.pyc*"]
+
+# Fixed timestamp of the zip entries so the same scripts always give the same zip
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+"""
+    Content hash of the node scripts keyed by the path, modification time and size of their files
+"""
+node_scripts_digest_cache = DiskCache("node-scripts", ttl=constants.NODE_SCRIPTS_DIGEST_CACHE_TTL)
+
+
+class NodeScriptsBundle:
+    """
+    Zip of the node scripts, the part of the node data shared by every cluster and job.
+    It is built once per content hash in the local cache directory and uploaded once per storage account to
+    <hash>.zip in its own container, as pools keep a long lived token to read it.
+    """
+    CONTAINER = constants.NODE_SCRIPTS_CONTAINER
+    PREFIX = ""
+    FILE_NAME = "node-scripts-static.zip"
+
+    # Bundles known to exist, per storage account
+    _known = TTLCache(ttl=constants.ARTIFACT_EXISTS_CACHE_TTL)
+
+    def __init__(self, source_path: str = os.path.join(constants.ROOT_PATH, NODE_SCRIPT_FOLDER),
+                 cache_directory: str = os.path.join(constants.CACHE_DIRECTORY, "node-scripts")):
+        self.source_path = source_path
+        self.cache_directory = cache_directory
+        self._digest = None
+
+    def _files(self) -> List[Tuple[str, str]]:
+        """
+        :returns: sorted (path in the zip, local path) of the files of the bundle
+        """
+        files = []
+        for base, _, names in os.walk(self.source_path):
+            relative_folder = os.path.relpath(base, self.source_path)
+            for name in names:
+                if any(fnmatch.fnmatch(name, pattern) for pattern in EXCLUDE):
+                    continue
+                files.append((os.path.normpath(os.path.join(NODE_SCRIPT_FOLDER, relative_folder, name)),
+                              os.path.join(base, name)))
+        return sorted(files)
+
+    @staticmethod
+    def _read(local_path: str) -> str:
+        with io.open(local_path, 'r', encoding='UTF-8') as f:
+            return f.read().replace('\r\n', '\n')
+
+    @property
+    def digest(self) -> str:
+        """
+        sha256 of the content of the node scripts, only recomputed when a file changed
+        """
+        if self._digest is None:
+            files = self._files()
+            stamp = hashlib.sha256(__version__.encode())
+            for name, local_path in files:
+                stat = os.stat(local_path)
+                stamp.update("{0}|{1}|{2}\n".format(name, stat.st_mtime_ns, stat.st_size).encode())
+            digest = node_scripts_digest_cache.get(stamp.hexdigest())
+            if digest is None:
+                sha256 = hashlib.sha256()
+                for name, local_path in files:
+                    sha256.update(name.encode() + b"\0" + self._read(local_path).encode("UTF-8") + b"\0")
+                digest = sha256.hexdigest()
+                node_scripts_digest_cache.set(stamp.hexdigest(), digest)
+            self._digest = digest
+        return self._digest
+
+    @property
+    def local_path(self) -> str:
+        return os.path.join(self.cache_directory, self.digest + ".zip")
+
+    def build(self) -> str:
+        """
+        Zip the node scripts unless this version is already in the local cache
+        :returns: path of the zip
+        """
+        path = self.local_path
+        if os.path.exists(path):
+            return path
+        os.makedirs(self.cache_directory, exist_ok=True)
+        tmp_path = "{0}.{1}.{2}.tmp".format(path, os.getpid(), threading.get_ident())
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for name, local_path in self._files():
+                info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+                info.external_attr = 0o600 << 16
+                zipf.writestr(info, self._read(local_path), compress_type=zipfile.ZIP_DEFLATED)
+        os.replace(tmp_path, path)
+        return path
+
+    @tracing.traced("upload node scripts")
+    def upload(self, blob_client: BlockBlobService) -> BlobData:
+        """
+        Upload the bundle unless this version is already stored in the storage account
+        """
+        blob_name = self.PREFIX + self.digest + ".zip"
+        key = (blob_client.account_name, blob_name)
+        if not self._known.get(key) and not blob_client.exists(self.CONTAINER, blob_name):
+            helpers.in_container(self.CONTAINER, blob_client, helpers.upload_blob_resumable, self.CONTAINER, blob_name,
+                                 self.build(), blob_client)
+        self._known.set(key, True)
+        blob_data = BlobData(blob_client, self.CONTAINER, blob_name)
+        blob_data.dest = self.FILE_NAME
+        return blob_data
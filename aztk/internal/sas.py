@@ -0,0 +1,54 @@
+import datetime
+from azure.storage.blob import BlobPermissions, BlockBlobService
+from aztk.utils import constants
+from .cache import TTLCache
+
+
+class SasProvider:
+    """
+    Sign container shared access signatures once per container, permission and validity and reuse them.
+    A container token reads every blob of the container, only use it for containers which hold nothing else
+    than what the token is handed out for, like the application artifacts of the shared container.
+    Tokens are signed valid for the requested number of days plus the reuse window and are only reused during
+    that window, so every url handed out stays valid at least for the requested number of days.
+    :param reuse_window: number of seconds a token is reused
+    """
+
+    def __init__(self, reuse_window: float = constants.SAS_REUSE_WINDOW):
+        self.reuse_window = reuse_window
+        self._tokens = TTLCache(ttl=reuse_window)
+
+    def container_sas(self, blob_client: BlockBlobService, container_name: str,
+                      permission: BlobPermissions = BlobPermissions.READ, expiry_days: int = 7) -> str:
+        key = (blob_client.account_name, container_name, str(permission), expiry_days)
+        return self._tokens.get_or_set(key, lambda: blob_client.generate_container_shared_access_signature(
+            container_name,
+            permission=permission,
+            expiry=datetime.datetime.utcnow() + datetime.timedelta(days=expiry_days, seconds=self.reuse_window)))
+
+    def blob_url(self, blob_client: BlockBlobService, container_name: str, blob_name: str,
+                 permission: BlobPermissions = BlobPermissions.READ, expiry_days: int = 7) -> str:
+        """
+        :returns: url of the blob signed with the container sas
+        """
+        sas_token = self.container_sas(blob_client, container_name, permission, expiry_days)
+        return blob_client.make_blob_url(container_name, blob_name, sas_token=sas_token)
+
+
+def signed_blob_url(blob_client: BlockBlobService, container_name: str, blob_name: str,
+                    permission: BlobPermissions = BlobPermissions.READ, expiry_days: int = 7) -> str:
+    """
+    :returns: url of the blob signed with a token granting access to this blob only
+    """
+    sas_token = blob_client.generate_blob_shared_access_signature(
+        container_name,
+        blob_name,
+        permission=permission,
+        expiry=datetime.datetime.utcnow() + datetime.timedelta(days=expiry_days))
+    return blob_client.make_blob_url(container_name, blob_name, sas_token=sas_token)
+
+
+"""
+    Provider of the whole process
+"""
+sas_provider = SasProvider()
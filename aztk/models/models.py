@@ -257,13 +257,115 @@ class VmImage:
         self.sku = sku
 
 
+class Node:
+    """
+    Compact record of a compute node of a cluster
+    """
+    __slots__ = ("id", "state", "ip", "is_dedicated", "affinity_id")
+
+    def __init__(self,
+                 id: str,
+                 state: batch_models.ComputeNodeState = None,
+                 ip: str = None,
+                 is_dedicated: bool = None,
+                 affinity_id: str = None):
+        self.id = id
+        self.state = state
+        self.ip = ip
+        self.is_dedicated = is_dedicated
+        self.affinity_id = affinity_id
+
+    @classmethod
+    def from_compute_node(cls, node: batch_models.ComputeNode):
+        return cls(
+            id=node.id,
+            state=node.state,
+            ip=node.ip_address,
+            is_dedicated=node.is_dedicated,
+            affinity_id=node.affinity_id)
+
+    @property
+    def ip_address(self) -> str:
+        """
+        Alias of ip, the name of the field on azure.batch.models.ComputeNode
+        """
+        return self.ip
+
+    def __repr__(self):
+        return "<Node id={0} state={1}>".format(self.id, self.state.value if self.state else None)
+
+
+class NodeCounts:
+    """
+    Number of nodes of a cluster in each state, split between dedicated and low priority nodes
+    :param dedicated: dict of ComputeNodeState to the number of dedicated nodes in that state
+    :param low_priority: dict of ComputeNodeState to the number of low priority nodes in that state
+    """
+    starting_states = (
+        batch_models.ComputeNodeState.creating,
+        batch_models.ComputeNodeState.starting,
+        batch_models.ComputeNodeState.waiting_for_start_task,
+        batch_models.ComputeNodeState.rebooting,
+        batch_models.ComputeNodeState.reimaging,
+    )
+    failed_states = (
+        batch_models.ComputeNodeState.start_task_failed,
+        batch_models.ComputeNodeState.unusable,
+    )
+
+    def __init__(self, cluster_id: str, dedicated: dict = None, low_priority: dict = None):
+        self.cluster_id = cluster_id
+        self.dedicated = dedicated or {}
+        self.low_priority = low_priority or {}
+
+    @classmethod
+    def from_nodes(cls, cluster_id: str, nodes):
+        counts = cls(cluster_id)
+        for node in nodes:
+            by_state = counts.dedicated if node.is_dedicated else counts.low_priority
+            by_state[node.state] = by_state.get(node.state, 0) + 1
+        return counts
+
+    def count(self, *states) -> int:
+        """
+            :returns: the number of nodes in any of the given states
+        """
+        return sum(self.dedicated.get(state, 0) + self.low_priority.get(state, 0) for state in states)
+
+    @property
+    def idle(self) -> int:
+        return self.count(batch_models.ComputeNodeState.idle)
+
+    @property
+    def running(self) -> int:
+        return self.count(batch_models.ComputeNodeState.running)
+
+    @property
+    def starting(self) -> int:
+        return self.count(*self.starting_states)
+
+    @property
+    def failed(self) -> int:
+        return self.count(*self.failed_states)
+
+    @property
+    def total(self) -> int:
+        return sum(self.dedicated.values()) + sum(self.low_priority.values())
+
+
 class Cluster:
     def __init__(self,
                  pool: batch_models.CloudPool,
                  nodes: batch_models.ComputeNodePaged = None):
         self.id = pool.id
         self.pool = pool
-        self.nodes = nodes
+        self.master_node_id = None
+        self.node_counts = None
+        self._node_source = nodes
+        self._nodes = None
+        self._nodes_by_id = None
+        self._nodes_by_state = None
+        self._dedicated_node_count = 0
         self.vm_size = pool.vm_size
         if pool.state.value is batch_models.PoolState.active:
             self.visible_state = pool.allocation_state.value
@@ -278,11 +380,72 @@ class Cluster:
         self.target_dedicated_nodes = pool.target_dedicated_nodes
         self.target_low_pri_nodes = pool.target_low_priority_nodes
 
+    def __materialize_nodes(self):
+        """
+            Read the nodes the cluster was created with exactly once and index them
+        """
+        if self._nodes is not None:
+            return
+        self._nodes = [node if isinstance(node, Node) else Node.from_compute_node(node)
+                       for node in (self._node_source or [])]
+        self._node_source = None
+        self._nodes_by_id = {node.id: node for node in self._nodes}
+        self._nodes_by_state = {}
+        for node in self._nodes:
+            self._nodes_by_state.setdefault(node.state, []).append(node)
+        self._dedicated_node_count = sum(1 for node in self._nodes if node.is_dedicated)
+
+    @property
+    def nodes(self) -> List[Node]:
+        self.__materialize_nodes()
+        return self._nodes
+
+    @property
+    def nodes_by_state(self) -> dict:
+        """
+            :returns: dict of ComputeNodeState to the list of nodes in that state
+        """
+        self.__materialize_nodes()
+        return self._nodes_by_state
+
+    def get_node(self, node_id: str) -> Node:
+        self.__materialize_nodes()
+        return self._nodes_by_id.get(node_id)
+
+    @property
+    def master_node(self) -> Node:
+        return self.get_node(self.master_node_id) if self.master_node_id else None
+
+    @property
+    def dedicated_node_count(self) -> int:
+        self.__materialize_nodes()
+        return self._dedicated_node_count
+
+    @property
+    def low_pri_node_count(self) -> int:
+        self.__materialize_nodes()
+        return len(self._nodes) - self._dedicated_node_count
+
 
 class SSHLog():
-    def __init__(self, output, node_id):
+    """
+    Result of a command run on a node
+    :param output: output of the command
+    :param exit_code: exit status of the command, None if it couldn't be run
+    :param duration: seconds from connecting to the node to the end of the command
+    :param error: why the command couldn't be run on the node
+    """
+
+    def __init__(self, output, node_id, exit_code: int = None, duration: float = None, error: str = None):
         self.output = output
         self.node_id = node_id
+        self.exit_code = exit_code
+        self.duration = duration
+        self.error = error
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None or self.exit_code != 0
 
 
 class Software:
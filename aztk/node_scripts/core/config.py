@@ -1,6 +1,9 @@
+import fcntl
+import json
 import os
 import re
 import logging
+import threading
 import azure.batch.batch_service_client as batch
 import azure.storage.blob as blob
 import azure.batch.batch_auth as batchauth
@@ -37,6 +40,72 @@ storage_account_name = os.environ["STORAGE_ACCOUNT_NAME"]
 storage_account_key = os.environ["STORAGE_ACCOUNT_KEY"]
 storage_account_suffix = os.environ["STORAGE_ACCOUNT_SUFFIX"]
 
+# Batch endpoint and storage key resolved through ARM by the first process of the node (the setup),
+# so the other processes don't call the management plane again
+resolved_config_path = os.path.join(os.environ["DOCKER_WORKING_DIR"], ".resolved-config.json") \
+    if os.environ.get("DOCKER_WORKING_DIR") else None
+
+
+def read_resolved_config() -> dict:
+    if not resolved_config_path:
+        return {}
+    try:
+        with open(resolved_config_path, encoding="UTF-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_resolved_config(key: str, value: str):
+    if not resolved_config_path:
+        return
+    try:
+        # other processes of the node may save another value at the same time
+        with open(resolved_config_path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            values = read_resolved_config()
+            values[key] = value
+            tmp_path = "{0}.{1}.{2}.tmp".format(resolved_config_path, os.getpid(), threading.get_ident())
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="UTF-8") as f:
+                json.dump(values, f)
+            os.replace(tmp_path, resolved_config_path)
+    except OSError as e:
+        logging.warning("Could not save the resolved configuration: %s", e)
+
+
+def get_arm_credentials():
+    return ServicePrincipalCredentials(
+        client_id=client_id,
+        secret=credential,
+        tenant=tenant_id,
+        resource='https://management.core.windows.net/')
+
+
+def get_storage_account_key(resource_id: str) -> str:
+    key = read_resolved_config().get(resource_id)
+    if key:
+        return key
+    m = RESOURCE_ID_PATTERN.match(resource_id)
+    mgmt_client = StorageManagementClient(get_arm_credentials(), m.group('subscription'))
+    key = mgmt_client.storage_accounts.list_keys(resource_group_name=m.group('resourcegroup'),
+                                                 account_name=m.group('account')).keys[0].value
+    save_resolved_config(resource_id, key)
+    return key
+
+
+def get_batch_service_url(resource_id: str) -> str:
+    base_url = read_resolved_config().get(resource_id)
+    if base_url:
+        return base_url
+    m = RESOURCE_ID_PATTERN.match(resource_id)
+    batch_client = BatchManagementClient(get_arm_credentials(), m.group('subscription'))
+    account = batch_client.batch_account.get(m.group('resourcegroup'), m.group('account'))
+    base_url = 'https://%s/' % account.account_endpoint
+    save_resolved_config(resource_id, base_url)
+    return base_url
+
+
 def get_blob_client() -> blob.BlockBlobService:
     if not storage_resource_id:
         return blob.BlockBlobService(
@@ -44,21 +113,21 @@ def get_blob_client() -> blob.BlockBlobService:
             account_key=storage_account_key,
             endpoint_suffix=storage_account_suffix)
     else:
-        credentials = ServicePrincipalCredentials(
-            client_id=client_id,
-            secret=credential,
-            tenant=tenant_id,
-            resource='https://management.core.windows.net/')
         m = RESOURCE_ID_PATTERN.match(storage_resource_id)
-        accountname = m.group('account')
-        subscription = m.group('subscription')
-        resourcegroup = m.group('resourcegroup')
-        mgmt_client = StorageManagementClient(credentials, subscription)
-        key = mgmt_client.storage_accounts.list_keys(resource_group_name=resourcegroup,
-                                                     account_name=accountname).keys[0].value
-        storage_client = CloudStorageAccount(accountname, key)
+        storage_client = CloudStorageAccount(m.group('account'), get_storage_account_key(storage_resource_id))
         return storage_client.create_block_blob_service()
 
+def get_append_blob_client() -> blob.AppendBlobService:
+    if not storage_resource_id:
+        return blob.AppendBlobService(
+            account_name=storage_account_name,
+            account_key=storage_account_key,
+            endpoint_suffix=storage_account_suffix)
+    else:
+        m = RESOURCE_ID_PATTERN.match(storage_resource_id)
+        storage_client = CloudStorageAccount(m.group('account'), get_storage_account_key(storage_resource_id))
+        return storage_client.create_append_blob_service()
+
 def get_batch_client() -> batch.BatchServiceClient:
     if not batch_resource_id:
         base_url = batch_service_url
@@ -66,15 +135,7 @@ def get_batch_client() -> batch.BatchServiceClient:
             batch_account_name,
             batch_account_key)
     else:
-        credentials = ServicePrincipalCredentials(
-            client_id=client_id,
-            secret=credential,
-            tenant=tenant_id,
-            resource='https://management.core.windows.net/')
-        m = RESOURCE_ID_PATTERN.match(batch_resource_id)
-        batch_client = BatchManagementClient(credentials, m.group('subscription'))
-        account = batch_client.batch_account.get(m.group('resourcegroup'), m.group('account'))
-        base_url = 'https://%s/' % account.account_endpoint
+        base_url = get_batch_service_url(batch_resource_id)
         credentials = ServicePrincipalCredentials(
             client_id=client_id,
             secret=credential,
@@ -0,0 +1,75 @@
+import logging
+import os
+import threading
+import azure.common
+from aztk.utils import constants
+
+
+class LogShipper(threading.Thread):
+    """
+    Append the new bytes of a log file to an append blob every few seconds, so the log can be read from storage
+    while the application runs and isn't lost when the node goes away.
+    The blob always holds the first `offset` bytes of the file.
+    """
+
+    def __init__(self, append_blob_client, container_name: str, blob_name: str, file_path: str,
+                 interval: float = constants.LOG_SHIP_INTERVAL):
+        super().__init__(daemon=True)
+        self.append_blob_client = append_blob_client
+        self.container_name = container_name
+        self.blob_name = blob_name
+        self.file_path = file_path
+        self.interval = interval
+        self.offset = 0
+        self._stop_event = threading.Event()
+
+    def start(self):
+        self.append_blob_client.create_container(self.container_name, fail_on_exist=False)
+        self.append_blob_client.create_blob(self.container_name, self.blob_name)
+        super().start()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.ship()
+            except Exception as e:
+                logging.warning("Failed to ship %s: %s", self.file_path, e)
+
+    def ship(self):
+        """
+        Append the bytes written to the file since the last call
+        """
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, "rb") as f:
+            f.seek(self.offset)
+            while True:
+                block = f.read(constants.APPEND_BLOB_MAX_BLOCK_SIZE)
+                if not block:
+                    return
+                try:
+                    self.append_blob_client.append_block(
+                        self.container_name, self.blob_name, block, appendpos_condition=self.offset)
+                except azure.common.AzureHttpError as e:
+                    if e.status_code != 412:
+                        raise
+                    # An append went through but its response was lost, continue from the end of the blob
+                    self.offset = self.append_blob_client.get_blob_properties(
+                        self.container_name, self.blob_name).properties.content_length
+                    f.seek(self.offset)
+                    continue
+                self.offset += len(block)
+
+    def stop(self):
+        """
+        Stop shipping and append the last bytes of the file
+        """
+        self._stop_event.set()
+        self.join()
+        self.ship()
+
+    def delete(self):
+        """
+        Delete the append blob, a block blob can't be uploaded in its place
+        """
+        self.append_blob_client.delete_blob(self.container_name, self.blob_name)
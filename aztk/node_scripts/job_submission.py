@@ -6,16 +6,24 @@ from typing import List
 import azure.batch.models as batch_models
 import azure.storage.blob as blob
 import yaml
+from aztk.utils import helpers
 from aztk.utils.command_builder import CommandBuilder
 from core import config
 from install.pick_master import get_master_node_id
 
 
-def affinitize_task_to_master(batch_client, cluster_id, task):
-    pool = batch_client.pool.get(config.pool_id)
+def get_master_affinity(batch_client, cluster_id):
+    pool = batch_client.pool.get(config.pool_id, batch_models.PoolGetOptions(select="id,metadata"))
     master_node_id = get_master_node_id(pool)
-    master_node = batch_client.compute_node.get(pool_id=cluster_id, node_id=master_node_id)
-    task.affinity_info = batch_models.AffinityInformation(affinity_id=master_node.affinity_id)
+    master_node = batch_client.compute_node.get(
+        pool_id=cluster_id,
+        node_id=master_node_id,
+        compute_node_get_options=batch_models.ComputeNodeGetOptions(select="id,affinityId"))
+    return batch_models.AffinityInformation(affinity_id=master_node.affinity_id)
+
+
+def affinitize_task_to_master(batch_client, cluster_id, task):
+    task.affinity_info = get_master_affinity(batch_client, cluster_id)
     return task
 
 
@@ -24,19 +32,25 @@ def schedule_tasks(tasks_path):
         Handle the request to submit a task
     '''
     batch_client = config.batch_client
-    blob_client = config.blob_client
 
+    tasks = []
     for task_definition in tasks_path:
         with open(task_definition, 'r', encoding='UTF-8') as stream:
             try:
-                task = yaml.load(stream)
+                tasks.append(yaml.load(stream))
             except yaml.YAMLError as exc:
                 print(exc)
 
-        # affinitize task to master
-        task = affinitize_task_to_master(batch_client, os.environ["AZ_BATCH_POOL_ID"], task)
-        # schedule the task
-        batch_client.task.add(job_id=os.environ['AZ_BATCH_JOB_ID'], task=task)
+    if not tasks:
+        return
+
+    # affinitize tasks to master
+    affinity = get_master_affinity(batch_client, os.environ["AZ_BATCH_POOL_ID"])
+    for task in tasks:
+        task.affinity_info = affinity
+
+    # schedule the tasks
+    helpers.add_task_collection(os.environ['AZ_BATCH_JOB_ID'], tasks, batch_client)
 
 
 if __name__ == "__main__":
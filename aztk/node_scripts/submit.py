@@ -9,6 +9,7 @@ import azure.storage.blob as blob
 import azure.batch.models as batch_models
 from aztk.utils.command_builder import CommandBuilder
 from core import config
+from core.log_shipper import LogShipper
 
 # limit azure.storage logging
 logging.getLogger("azure.storage").setLevel(logging.CRITICAL)
@@ -145,6 +146,41 @@ def upload_log(blob_client, application):
         use_full_path=False)
 
 
+def start_log_shipper(application):
+    '''
+        ship output.log to an append blob while the application runs
+    '''
+    log_file = os.path.join(os.environ['AZ_BATCH_TASK_WORKING_DIR'], os.environ['SPARK_SUBMIT_LOGS_FILE'])
+    shipper = LogShipper(
+        config.get_append_blob_client(),
+        container_name=os.environ['STORAGE_LOGS_CONTAINER'],
+        blob_name=application['name'] + '/' + os.environ['SPARK_SUBMIT_LOGS_FILE'],
+        file_path=log_file)
+    try:
+        shipper.start()
+    except Exception as e:
+        logging.warning("Could not ship the log while the application runs: %s", e)
+        return None
+    return shipper
+
+
+def stop_log_shipper(shipper, blob_client, application):
+    '''
+        ship the end of output.log, upload the whole file if the shipper failed
+    '''
+    if shipper:
+        try:
+            shipper.stop()
+            return
+        except Exception as e:
+            logging.warning("Failed to ship the end of the log: %s", e)
+        try:
+            shipper.delete()
+        except Exception as e:
+            logging.warning("Failed to delete the partially shipped log: %s", e)
+    upload_log(blob_client, application)
+
+
 def recieve_submit_request(application_file_path):
 
     '''
@@ -170,8 +206,11 @@ def recieve_submit_request(application_file_path):
         driver_cores=application['driver_cores'],
         executor_cores=application['executor_cores'])
 
-    return_code = subprocess.call(cmd.to_str(), shell=True)
-    upload_log(blob_client, application)
+    shipper = start_log_shipper(application)
+    try:
+        return_code = subprocess.call(cmd.to_str(), shell=True)
+    finally:
+        stop_log_shipper(shipper, blob_client, application)
     return return_code
 
 
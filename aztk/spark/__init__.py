@@ -1,2 +1,3 @@
 from .models import *
 from .client import Client
+from .async_client import AsyncClient
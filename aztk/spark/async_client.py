@@ -0,0 +1,243 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import azure.batch.models as batch_models
+import azure.batch.models.batch_error as batch_error
+from aztk import error
+from aztk.spark import models
+from aztk.spark.client import Client
+from aztk.spark.helpers import job_submission as job_submit_helper
+from aztk.spark.utils import util
+from aztk.utils import constants, helpers
+
+
+class AsyncClient:
+    """
+    asyncio flavour of aztk.spark.Client.
+    Every method of the synchronous client is exposed as a coroutine. Blocking Batch and Storage calls
+    are dispatched to a bounded thread pool so any number of operations can be awaited at the same time
+    while at most `max_concurrency` requests hit the service at once. Waits poll with asyncio.sleep and
+    don't hold on to a worker thread between polls.
+    asyncio is imported by the methods, aztk.spark exports this class and the CLI doesn't need asyncio.
+    """
+
+    def __init__(self, secrets_config: models.SecretsConfiguration,
+                 max_concurrency: int = constants.ASYNC_CLIENT_MAX_CONCURRENCY):
+        self.client = Client(secrets_config)
+        self.secrets_config = secrets_config
+        self.batch_client = self.client.batch_client
+        self.blob_client = self.client.blob_client
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        self.close()
+
+    def close(self):
+        """
+        Release the worker threads. Pending calls are allowed to finish.
+        """
+        self._executor.shutdown(wait=False)
+
+    def metrics(self) -> dict:
+        """
+        Snapshot of the metrics of the Batch and Storage calls made by this client
+        """
+        return self.client.metrics()
+
+    async def _run(self, func, *args, **kwargs):
+        import asyncio
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def _run_batch(self, func, *args, **kwargs):
+        try:
+            return await self._run(func, *args, **kwargs)
+        except batch_error.BatchErrorException as e:
+            raise error.AztkError(helpers.format_batch_exception(e))
+
+    '''
+    Spark async client public interface
+    '''
+    async def create_cluster(self, cluster_conf: models.ClusterConfiguration, wait: bool = False):
+        cluster = await self._run(self.client.create_cluster, cluster_conf, False)
+        if wait:
+            cluster = await self.wait_until_cluster_is_ready(cluster.id)
+        return cluster
+
+    async def create_clusters_in_parallel(self, cluster_confs, wait: bool = False):
+        import asyncio
+
+        async def create(cluster_conf):
+            result = models.ClusterCreationResult(cluster_conf.cluster_id)
+            try:
+                result.cluster = await self.create_cluster(cluster_conf)
+            except Exception as e:
+                result.error = e
+            return result
+
+        results = await asyncio.gather(*[create(cluster_conf) for cluster_conf in cluster_confs])
+        if not wait:
+            return results
+
+        created = [result for result in results if result.succeeded]
+        waiter = util.masters_waiter(self.client, [result.cluster_id for result in created], fail_fast=False)
+        try:
+            await self._wait(waiter)
+        except Exception as e:
+            for cluster_id in waiter.pending:
+                waiter.failures[cluster_id] = e
+
+        async def refresh(result):
+            try:
+                result.error = waiter.failures.get(result.cluster_id)
+                if result.succeeded:
+                    result.cluster = await self.get_cluster(result.cluster_id)
+            except Exception as e:
+                result.error = e
+
+        await asyncio.gather(*[refresh(result) for result in created])
+        return results
+
+    async def delete_cluster(self, cluster_id: str, keep_logs: bool = False):
+        return await self._run(self.client.delete_cluster, cluster_id, keep_logs)
+
+    async def get_cluster(self, cluster_id: str):
+        return await self._run(self.client.get_cluster, cluster_id)
+
+    async def get_cluster_config(self, cluster_id: str):
+        return await self._run(self.client.get_cluster_config, cluster_id)
+
+    async def list_clusters(self, with_node_counts: bool = False):
+        return await self._run(self.client.list_clusters, with_node_counts)
+
+    async def get_cluster_node_counts(self, cluster_id: str):
+        return await self._run(self.client.get_cluster_node_counts, cluster_id)
+
+    async def get_remote_login_settings(self, cluster_id: str, node_id: str):
+        return await self._run(self.client.get_remote_login_settings, cluster_id, node_id)
+
+    async def get_remote_login_settings_for_cluster(self, cluster_id: str):
+        return await self._run(self.client.get_remote_login_settings_for_cluster, cluster_id)
+
+    async def submit(self, cluster_id: str, application: models.ApplicationConfiguration, wait: bool = False,
+                     progress_callback=None):
+        await self._run(self.client.submit, cluster_id, application, False, progress_callback)
+        if wait:
+            await self.wait_until_application_done(cluster_id, application.name)
+
+    async def submit_all_applications(self, cluster_id: str, applications, wait: bool = False,
+                                      progress_callback=None):
+        await self._run(self.client.submit_all_applications, cluster_id, applications, False, progress_callback)
+        if wait:
+            await self._wait(helpers.Waiter([application.name for application in applications],
+                                            self.__poll_applications(cluster_id)))
+
+    def __poll_applications(self, cluster_id: str):
+        list_options = batch_models.TaskListOptions(select="id,state")
+
+        def poll(pending):
+            return {
+                task.id: True if task.state == batch_models.TaskState.completed else None
+                for task in self.batch_client.task.list(cluster_id, list_options) if task.id in pending
+            }
+        return poll
+
+    async def _wait(self, waiter: helpers.Waiter):
+        import asyncio
+        while not await self._run_batch(waiter.poll):
+            await asyncio.sleep(waiter.next_delay())
+        return waiter.failures
+
+    async def wait_until_application_done(self, cluster_id: str, task_id: str):
+        def poll(_):
+            task = self.batch_client.task.get(job_id=cluster_id, task_id=task_id)
+            return {task_id: True if task.state == batch_models.TaskState.completed else None}
+
+        await self._wait(helpers.Waiter([task_id], poll))
+
+    async def wait_until_applications_done(self, cluster_id: str):
+        def poll(_):
+            tasks = self.batch_client.task.list(cluster_id, batch_models.TaskListOptions(select="id,state"))
+            return {None: True if all(task.state == batch_models.TaskState.completed for task in tasks) else None}
+
+        await self._wait(helpers.Waiter([None], poll))
+
+    async def wait_until_cluster_is_ready(self, cluster_id: str):
+        import asyncio
+        try:
+            await self._wait(util.masters_waiter(self.client, [cluster_id]))
+        except error.WaitTimeoutError:
+            raise util.MasterInvalidStateError("Master didn't become ready before timeout.")
+        await asyncio.sleep(5)
+        return await self.get_cluster(cluster_id)
+
+    async def wait_until_all_clusters_are_ready(self, clusters: List[str],
+                                                timeout: float = constants.WAIT_FOR_MASTER_TIMEOUT):
+        await self._wait(util.masters_waiter(self.client, clusters, timeout))
+
+    async def create_user(self, cluster_id: str, username: str, password: str = None, ssh_key: str = None) -> str:
+        return await self._run(self.client.create_user, cluster_id, username, password, ssh_key)
+
+    async def get_application_log(self, cluster_id: str, application_name: str, tail=False, current_bytes: int = 0):
+        return await self._run(self.client.get_application_log, cluster_id, application_name, tail, current_bytes)
+
+    async def get_all_application_logs(self, cluster_id: str, dest_dir: str):
+        return await self._run(self.client.get_all_application_logs, cluster_id, dest_dir)
+
+    async def get_application_status(self, cluster_id: str, app_name: str):
+        return await self._run(self.client.get_application_status, cluster_id, app_name)
+
+    async def cluster_run(self, cluster_id: str, command: str, max_concurrency: int = constants.SSH_MAX_CONCURRENCY,
+                          timeout: float = constants.SSH_CONNECT_TIMEOUT, output_callback=None,
+                          command_timeout: float = constants.SSH_COMMAND_TIMEOUT):
+        return await self._run(self.client.cluster_run, cluster_id, command, max_concurrency, timeout,
+                               output_callback, command_timeout)
+
+    async def cluster_copy(self, cluster_id: str, source_path: str, destination_path: str,
+                           max_concurrency: int = constants.SSH_MAX_CONCURRENCY,
+                           timeout: float = constants.SSH_CONNECT_TIMEOUT,
+                           command_timeout: float = constants.SSH_COMMAND_TIMEOUT):
+        return await self._run(self.client.cluster_copy, cluster_id, source_path, destination_path, max_concurrency,
+                               timeout, command_timeout)
+
+    '''
+        job submission
+    '''
+    async def submit_job(self, job_configuration):
+        return await self._run(self.client.submit_job, job_configuration)
+
+    async def list_jobs(self):
+        return await self._run(self.client.list_jobs)
+
+    async def list_applications(self, job_id):
+        return await self._run(self.client.list_applications, job_id)
+
+    async def get_job(self, job_id):
+        return await self._run(self.client.get_job, job_id)
+
+    async def stop_job(self, job_id):
+        return await self._run(self.client.stop_job, job_id)
+
+    async def delete_job(self, job_id: str, keep_logs: bool = False):
+        return await self._run(self.client.delete_job, job_id, keep_logs)
+
+    async def get_application(self, job_id, application_name):
+        return await self._run(self.client.get_application, job_id, application_name)
+
+    async def get_job_application_log(self, job_id, application_name):
+        return await self._run(self.client.get_job_application_log, job_id, application_name)
+
+    async def get_all_job_application_logs(self, job_id: str, dest_dir: str):
+        return await self._run(self.client.get_all_job_application_logs, job_id, dest_dir)
+
+    async def stop_job_app(self, job_id, application_name):
+        return await self._run(self.client.stop_job_app, job_id, application_name)
+
+    async def wait_until_job_finished(self, job_id):
+        await self.wait_until_all_jobs_finished([job_id])
+
+    async def wait_until_all_jobs_finished(self, jobs, timeout: float = None):
+        await self._wait(job_submit_helper.jobs_waiter(self.client, jobs, timeout))
@@ -1,16 +1,19 @@
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 import azure.batch.models.batch_error as batch_error
 import aztk
 from aztk import error
 from aztk.client import Client as BaseClient
 from aztk.spark import models
-from aztk.utils import helpers
+from aztk.utils import constants, helpers, tracing
 from aztk.spark.helpers import create_cluster as create_cluster_helper
 from aztk.spark.helpers import submit as cluster_submit_helper
 from aztk.spark.helpers import job_submission as job_submit_helper
 from aztk.spark.helpers import get_log as get_log_helper
 from aztk.spark.utils import util
-from aztk.internal.cluster_data import NodeData
+from aztk.internal import artifacts
+from aztk.internal.cluster_data import NodeData, NodeScriptsBundle
 import yaml
 
 
@@ -21,13 +24,15 @@ class Client(BaseClient):
     '''
     Spark client public interface
     '''
+    @tracing.traced("create_cluster")
     def create_cluster(self, cluster_conf: models.ClusterConfiguration, wait: bool = False):
         cluster_conf.validate()
         cluster_data = self._get_cluster_data(cluster_conf.cluster_id)
         try:
-            zip_resource_files = None
-            node_data = NodeData(cluster_conf).add_core().done()
+            with tracing.span("zip node data"):
+                node_data = NodeData(cluster_conf).add_core().done()
             zip_resource_files = cluster_data.upload_node_data(node_data).to_resource_file()
+            node_scripts_resource_file = NodeScriptsBundle().upload(self.blob_client).to_resource_file()
 
             start_task = create_cluster_helper.generate_cluster_start_task(self,
                                                                            zip_resource_files,
@@ -36,7 +41,8 @@ class Client(BaseClient):
                                                                            cluster_conf.file_shares,
                                                                            cluster_conf.plugins,
                                                                            cluster_conf.mixed_mode(),
-                                                                           cluster_conf.worker_on_master)
+                                                                           cluster_conf.worker_on_master,
+                                                                           node_scripts_resource_file)
 
             software_metadata_key = "spark"
 
@@ -58,9 +64,56 @@ class Client(BaseClient):
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
-    def create_clusters_in_parallel(self, cluster_confs):
-        for cluster_conf in cluster_confs:
-            self.create_cluster(cluster_conf)
+    def create_clusters_in_parallel(self,
+                                    cluster_confs: List[models.ClusterConfiguration],
+                                    max_workers: int = constants.CREATE_CLUSTERS_MAX_WORKERS,
+                                    wait: bool = False) -> List[models.ClusterCreationResult]:
+        """
+        Create the given clusters concurrently.
+        A failure to create one cluster doesn't stop the others, check the result returned for each cluster.
+        :param cluster_confs: the configurations of the clusters to create
+        :param max_workers: maximum number of clusters being created at the same time
+        :param wait: if True, also wait for all the created clusters to be ready
+        :returns: one ClusterCreationResult per cluster configuration, in the same order
+        """
+        results = [models.ClusterCreationResult(cluster_conf.cluster_id) for cluster_conf in cluster_confs]
+
+        def create(result, cluster_conf):
+            try:
+                result.cluster = self.create_cluster(cluster_conf)
+            except Exception as e:
+                result.error = e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(create, result, cluster_conf)
+                       for result, cluster_conf in zip(results, cluster_confs)]
+            concurrent.futures.wait(futures)
+
+        if wait:
+            self.__wait_until_created_clusters_are_ready([result for result in results if result.succeeded])
+
+        return results
+
+    def __wait_until_created_clusters_are_ready(self, results: List[models.ClusterCreationResult]):
+        waiter = util.masters_waiter(self, [result.cluster_id for result in results], fail_fast=False)
+        try:
+            waiter.wait()
+        except Exception as e:
+            # Timed out or the service failed, anything still pending didn't make it
+            for cluster_id in waiter.pending:
+                waiter.failures[cluster_id] = e
+
+        def refresh(result):
+            if result.cluster_id in waiter.failures:
+                result.error = waiter.failures[result.cluster_id]
+                return
+            try:
+                result.cluster = self.get_cluster(result.cluster_id)
+            except Exception as e:
+                result.error = e
+
+        with ThreadPoolExecutor(max_workers=constants.WAIT_POLL_MAX_WORKERS) as executor:
+            concurrent.futures.wait([executor.submit(refresh, result) for result in results])
 
     def delete_cluster(self, cluster_id: str, keep_logs: bool = False):
         try:
@@ -75,9 +128,20 @@ class Client(BaseClient):
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
-    def list_clusters(self):
+    def list_clusters(self, with_node_counts: bool = False):
+        try:
+            clusters = [models.Cluster(pool) for pool in self.__list_clusters(aztk.models.Software.spark)]
+            if with_node_counts:
+                node_counts = self.__get_cluster_node_counts([cluster.id for cluster in clusters])
+                for cluster in clusters:
+                    cluster.node_counts = node_counts[cluster.id]
+            return clusters
+        except batch_error.BatchErrorException as e:
+            raise error.AztkError(helpers.format_batch_exception(e))
+
+    def get_cluster_node_counts(self, cluster_id: str):
         try:
-            return [models.Cluster(pool) for pool in self.__list_clusters(aztk.models.Software.spark)]
+            return self.__get_cluster_node_counts([cluster_id])[cluster_id]
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
@@ -87,15 +151,27 @@ class Client(BaseClient):
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
-    def submit(self, cluster_id: str, application: models.ApplicationConfiguration, wait: bool = False):
+    def get_remote_login_settings_for_cluster(self, cluster_id: str):
         try:
-            cluster_submit_helper.submit_application(self, cluster_id, application, wait)
+            return self.__get_remote_login_settings_for_cluster(cluster_id)
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
-    def submit_all_applications(self, cluster_id: str, applications):
-        for application in applications:
-            self.submit(cluster_id, application)
+    @tracing.traced("submit")
+    def submit(self, cluster_id: str, application: models.ApplicationConfiguration, wait: bool = False,
+               progress_callback=None):
+        try:
+            cluster_submit_helper.submit_application(self, cluster_id, application, wait, progress_callback)
+        except batch_error.BatchErrorException as e:
+            raise error.AztkError(helpers.format_batch_exception(e))
+
+    @tracing.traced("submit_all_applications")
+    def submit_all_applications(self, cluster_id: str, applications, wait: bool = False, progress_callback=None):
+        try:
+            cluster_submit_helper.submit_applications(self, cluster_id, applications, wait,
+                                                      progress_callback=progress_callback)
+        except batch_error.BatchErrorException as e:
+            raise error.AztkError(helpers.format_batch_exception(e))
 
     def wait_until_application_done(self, cluster_id: str, task_id: str):
         try:
@@ -109,6 +185,7 @@ class Client(BaseClient):
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
+    @tracing.traced("wait_until_cluster_is_ready")
     def wait_until_cluster_is_ready(self, cluster_id: str):
         try:
             util.wait_for_master_to_be_ready(self, cluster_id)
@@ -118,9 +195,11 @@ class Client(BaseClient):
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
-    def wait_until_all_clusters_are_ready(self, clusters: List[str]):
-        for cluster_id in clusters:
-            self.wait_until_cluster_is_ready(cluster_id)
+    def wait_until_all_clusters_are_ready(self, clusters: List[str], timeout: float = constants.WAIT_FOR_MASTER_TIMEOUT):
+        try:
+            util.wait_for_masters_to_be_ready(self, clusters, timeout)
+        except batch_error.BatchErrorException as e:
+            raise error.AztkError(helpers.format_batch_exception(e))
 
     def create_user(self, cluster_id: str, username: str, password: str = None, ssh_key: str = None) -> str:
         try:
@@ -139,6 +218,37 @@ class Client(BaseClient):
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
+    def stream_application_log(self, cluster_id: str, application_name: str, start: int = 0, tail_bytes: int = None):
+        """
+        Generator of the decoded chunks of the log of an application, read with constant memory
+        """
+        try:
+            yield from get_log_helper.stream_log(self.batch_client, self.blob_client, cluster_id, application_name,
+                                                 start, tail_bytes)
+        except batch_error.BatchErrorException as e:
+            raise error.AztkError(helpers.format_batch_exception(e))
+
+    def follow_application_logs(self, cluster_id: str, application_names: List[str] = None):
+        """
+        Generator of (application name, new text of its log) until all the applications completed
+        :param application_names: applications to follow, None to follow all the applications of the cluster
+        """
+        try:
+            yield from get_log_helper.LogFollower(self.batch_client, self.blob_client, cluster_id,
+                                                  application_names).follow()
+        except batch_error.BatchErrorException as e:
+            raise error.AztkError(helpers.format_batch_exception(e))
+
+    def get_all_application_logs(self, cluster_id: str, dest_dir: str):
+        """
+        Download the logs of all the applications of the cluster to dest_dir, logs already downloaded are skipped
+        :returns: dict of the application names to the paths of their logs
+        """
+        try:
+            return get_log_helper.download_logs(self.batch_client, self.blob_client, cluster_id, dest_dir)
+        except batch_error.BatchErrorException as e:
+            raise error.AztkError(helpers.format_batch_exception(e))
+
     def get_application_status(self, cluster_id: str, app_name: str):
         try:
             task = self.batch_client.task.get(cluster_id, app_name)
@@ -146,40 +256,71 @@ class Client(BaseClient):
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
-    def cluster_run(self, cluster_id: str, command: str):
+    def cluster_run(self, cluster_id: str, command: str, max_concurrency: int = constants.SSH_MAX_CONCURRENCY,
+                    timeout: float = constants.SSH_CONNECT_TIMEOUT, output_callback=None,
+                    command_timeout: float = constants.SSH_COMMAND_TIMEOUT):
+        """
+        Run a command in the spark container of all the nodes of the cluster
+        :param max_concurrency: maximum number of nodes connected to at once
+        :param timeout: seconds to wait when connecting to a node
+        :param output_callback: function(node_id, line) called with every line of the output as it is written
+        :param command_timeout: seconds the command may run on a node once connected, None to wait forever
+        :returns: list of aztk.models.SSHLog, one per node
+        """
         try:
-            return self.__cluster_run(cluster_id, 'spark', command)
+            return self.__cluster_run(cluster_id, 'spark', command, max_concurrency, timeout, output_callback,
+                                      command_timeout)
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
-    def cluster_copy(self, cluster_id: str, source_path: str, destination_path: str):
+    def cluster_copy(self, cluster_id: str, source_path: str, destination_path: str,
+                     max_concurrency: int = constants.SSH_MAX_CONCURRENCY,
+                     timeout: float = constants.SSH_CONNECT_TIMEOUT,
+                     command_timeout: float = constants.SSH_COMMAND_TIMEOUT):
+        """
+        Copy a file to the spark container of all the nodes of the cluster
+        :param max_concurrency: maximum number of nodes connected to at once
+        :param timeout: seconds to wait when connecting to a node
+        :param command_timeout: seconds the copy may take on a node once connected, None to wait forever
+        :returns: list of aztk.models.SSHLog, one per node
+        """
         try:
-            return self.__cluster_copy(cluster_id, 'spark', source_path, destination_path)
+            return self.__cluster_copy(cluster_id, 'spark', source_path, destination_path, max_concurrency, timeout,
+                                       command_timeout)
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
     '''
         job submission
     '''
+    @tracing.traced("submit_job")
     def submit_job(self, job_configuration):
         try:
             job_configuration.validate()
             cluster_data = self._get_cluster_data(job_configuration.id)
-            node_data =  NodeData(job_configuration.to_cluster_config()).add_core().done()
+            with tracing.span("zip node data"):
+                node_data = NodeData(job_configuration.to_cluster_config()).add_core().done()
             zip_resource_files = cluster_data.upload_node_data(node_data).to_resource_file()
-
-            start_task = create_cluster_helper.generate_cluster_start_task(self,
-                                                                           zip_resource_files,
-                                                                           job_configuration.gpu_enabled,
-                                                                           job_configuration.docker_repo,
-                                                                           mixed_mode=job_configuration.mixed_mode(),
-                                                                           worker_on_master=job_configuration.worker_on_master)
-
-            application_tasks = []
-            for application in job_configuration.applications:
-                application_tasks.append(
-                    (application, cluster_submit_helper.generate_task(self, job_configuration.id, application))
-                )
+            node_scripts_resource_file = NodeScriptsBundle().upload(self.blob_client).to_resource_file()
+
+            start_task = create_cluster_helper.generate_cluster_start_task(
+                self,
+                zip_resource_files,
+                job_configuration.gpu_enabled,
+                job_configuration.docker_repo,
+                mixed_mode=job_configuration.mixed_mode(),
+                worker_on_master=job_configuration.worker_on_master,
+                node_scripts_resource_file=node_scripts_resource_file)
+
+            artifacts.ArtifactStore(self.blob_client).upload_all([
+                file_path for application in job_configuration.applications
+                for file_path in cluster_submit_helper.application_files(application)
+            ])
+            with ThreadPoolExecutor(max_workers=constants.SUBMIT_APPLICATIONS_MAX_WORKERS) as executor:
+                application_tasks = list(executor.map(
+                    tracing.propagate(lambda application: (
+                        application, cluster_submit_helper.generate_task(self, job_configuration.id, application))),
+                    job_configuration.applications))
 
             job_manager_task = job_submit_helper.generate_task(self, job_configuration, application_tasks)
 
@@ -257,6 +398,26 @@ class Client(BaseClient):
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
+    def get_all_job_application_logs(self, job_id: str, dest_dir: str):
+        """
+        Download the logs of all the applications of the job to dest_dir, logs already downloaded are skipped
+        :returns: dict of the application names to the paths of their logs
+        """
+        try:
+            return job_submit_helper.download_application_logs(self, job_id, dest_dir)
+        except batch_error.BatchErrorException as e:
+            raise error.AztkError(helpers.format_batch_exception(e))
+
+    def follow_job_application_logs(self, job_id: str, application_names: List[str] = None):
+        """
+        Generator of (application name, new text of its log) until all the applications of the job completed
+        :param application_names: applications to follow, None to follow all the applications of the job
+        """
+        try:
+            yield from job_submit_helper.log_follower(self, job_id, application_names).follow()
+        except batch_error.BatchErrorException as e:
+            raise error.AztkError(helpers.format_batch_exception(e))
+
     def stop_job_app(self, job_id, application_name):
         try:
             return job_submit_helper.stop_app(self, job_id, application_name)
@@ -269,6 +430,8 @@ class Client(BaseClient):
         except batch_error.BatchErrorException as e:
             raise error.AztkError(helpers.format_batch_exception(e))
 
-    def wait_until_all_jobs_finished(self, jobs):
-        for job in jobs:
-            self.wait_until_job_finished(job)
+    def wait_until_all_jobs_finished(self, jobs, timeout: float = None):
+        try:
+            job_submit_helper.wait_until_jobs_finished(self, jobs, timeout)
+        except batch_error.BatchErrorException as e:
+            raise error.AztkError(helpers.format_batch_exception(e))
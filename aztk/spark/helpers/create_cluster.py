@@ -2,6 +2,7 @@ from typing import List
 from aztk.utils.command_builder import CommandBuilder
 from aztk.utils import helpers
 from aztk.utils import constants
+from aztk.utils import tracing
 from aztk import models as aztk_models
 from aztk.spark.models import ClusterConfiguration
 import azure.batch.models as batch_models
@@ -126,7 +127,7 @@ def __get_secrets_env(spark_client):
         ]
 
 
-def __cluster_install_cmd(zip_resource_file: batch_models.ResourceFile,
+def __cluster_install_cmd(zip_resource_files: List[batch_models.ResourceFile],
                           gpu_enabled: bool,
                           docker_repo: str = None,
                           plugins = None,
@@ -160,8 +161,10 @@ def __cluster_install_cmd(zip_resource_file: batch_models.ResourceFile,
         'apt-get -y update',
         'apt-get install --fix-missing',
         'apt-get -y install unzip',
-        'unzip $AZ_BATCH_TASK_WORKING_DIR/{0}'.format(
-            zip_resource_file.file_path),
+    ] + [
+        'unzip -o $AZ_BATCH_TASK_WORKING_DIR/{0}'.format(zip_resource_file.file_path)
+        for zip_resource_file in zip_resource_files
+    ] + [
         'chmod 777 $AZ_BATCH_TASK_WORKING_DIR/aztk/node_scripts/setup_node.sh',
         '/bin/bash $AZ_BATCH_TASK_WORKING_DIR/aztk/node_scripts/setup_node.sh {0} {1} {2} "{3}"'.format(
             constants.DOCKER_SPARK_CONTAINER_NAME,
@@ -173,6 +176,7 @@ def __cluster_install_cmd(zip_resource_file: batch_models.ResourceFile,
     commands = shares + setup
     return commands
 
+@tracing.traced("generate start task")
 def generate_cluster_start_task(
         spark_client,
         zip_resource_file: batch_models.ResourceFile,
@@ -181,14 +185,18 @@ def generate_cluster_start_task(
         file_shares: List[aztk_models.FileShare] = None,
         plugins: List[aztk_models.PluginConfiguration] = None,
         mixed_mode: bool = False,
-        worker_on_master: bool = True):
+        worker_on_master: bool = True,
+        node_scripts_resource_file: batch_models.ResourceFile = None):
     """
         This will return the start task object for the pool to be created.
         :param cluster_id str: Id of the cluster(Used for uploading the resource files)
         :param zip_resource_file: Resource file object pointing to the zip file containing scripts to run on the node
+        :param node_scripts_resource_file: Resource file object pointing to the zip of the node scripts shared
+            by all the clusters, unzipped before zip_resource_file
     """
 
-    resource_files = [zip_resource_file]
+    resource_files = [node_scripts_resource_file, zip_resource_file] if node_scripts_resource_file \
+        else [zip_resource_file]
     spark_web_ui_port = constants.DOCKER_SPARK_WEB_UI_PORT
     spark_worker_ui_port = constants.DOCKER_SPARK_WORKER_UI_PORT
     spark_job_ui_port = constants.DOCKER_SPARK_JOB_UI_PORT
@@ -211,7 +219,7 @@ def generate_cluster_start_task(
     ] + __get_docker_credentials(spark_client)
 
     # start task command
-    command = __cluster_install_cmd(zip_resource_file, gpu_enabled, docker_repo, plugins, worker_on_master, file_shares, mixed_mode)
+    command = __cluster_install_cmd(resource_files, gpu_enabled, docker_repo, plugins, worker_on_master, file_shares, mixed_mode)
 
     return batch_models.StartTask(
         command_line=helpers.wrap_commands_in_shell(command),
@@ -1,4 +1,8 @@
+import codecs
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Tuple
 import azure.batch.models as batch_models
 import azure
 import azure.batch.models.batch_error as batch_error
@@ -48,9 +52,24 @@ def __get_output_file_properties(batch_client, cluster_id: str, application_name
                 raise e
 
 
-def get_log_from_storage(blob_client, container_name, application_name, task):
+def get_log_from_storage(blob_client, container_name, application_name, task, tail=False, current_bytes: int = 0):
+    """
+    Read the log shipped to storage. The log is appended to while the application runs, so with tail only the
+    bytes after current_bytes are downloaded.
+    """
+    blob_name = application_name + '/' + constants.SPARK_SUBMIT_LOGS_FILE
     try:
-        blob = blob_client.get_blob_to_text(container_name, application_name + '/' + constants.SPARK_SUBMIT_LOGS_FILE)
+        if tail and current_bytes:
+            total_bytes = blob_client.get_blob_properties(container_name, blob_name).properties.content_length
+            if total_bytes <= current_bytes:
+                content = ''
+            else:
+                blob = blob_client.get_blob_to_bytes(container_name, blob_name, start_range=current_bytes)
+                content = blob.content.decode('utf-8', errors='replace')
+        else:
+            blob = blob_client.get_blob_to_text(container_name, blob_name)
+            content = blob.content
+            total_bytes = blob.properties.content_length
     except azure.common.AzureMissingResourceHttpError:
         raise error.AztkError("Logs not found in your storage account. They were either deleted or never existed.")
 
@@ -58,9 +77,9 @@ def get_log_from_storage(blob_client, container_name, application_name, task):
         name=application_name,
         cluster_id=container_name,
         application_state=task.state._value_,
-        log=blob.content,
-        total_bytes=blob.properties.content_length,
-        exit_code = task.execution_info.exit_code)
+        log=content,
+        total_bytes=total_bytes,
+        exit_code=task.execution_info.exit_code)
 
 
 def get_log(batch_client, blob_client, cluster_id: str, application_name: str, tail=False, current_bytes: int = 0):
@@ -70,7 +89,7 @@ def get_log(batch_client, blob_client, cluster_id: str, application_name: str, t
     task = __wait_for_app_to_be_running(batch_client, cluster_id, application_name)
 
     if not __check_task_node_exist(batch_client, cluster_id, task):
-        return get_log_from_storage(blob_client, cluster_id, application_name, task)
+        return get_log_from_storage(blob_client, cluster_id, application_name, task, tail, current_bytes)
 
     file = __get_output_file_properties(batch_client, cluster_id, application_name)
     target_bytes = file.content_length
@@ -101,3 +120,298 @@ def get_log(batch_client, blob_client, cluster_id: str, application_name: str, t
             log='',
             total_bytes=target_bytes,
             exit_code=task.execution_info.exit_code)
+
+
+def __read_node_log(batch_client, cluster_id: str, application_name: str, start: int, end: int):
+    return batch_client.file.get_from_task(
+        cluster_id, application_name, output_file,
+        batch_models.FileGetFromTaskOptions(ocp_range="bytes={0}-{1}".format(start, end - 1)))
+
+
+def __read_storage_log(blob_client, container_name: str, application_name: str, start: int, end: int,
+                       chunk_size: int):
+    blob_name = application_name + '/' + constants.SPARK_SUBMIT_LOGS_FILE
+    for offset in range(start, end, chunk_size):
+        yield blob_client.get_blob_to_bytes(
+            container_name, blob_name, start_range=offset, end_range=min(offset + chunk_size, end) - 1).content
+
+
+def stream_log(batch_client, blob_client, cluster_id: str, application_name: str, start: int = 0,
+               tail_bytes: int = None, chunk_size: int = constants.LOG_STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Read the log chunk by chunk from the node, or from storage once the node is gone. Memory use doesn't depend
+    on the size of the log.
+    :param start: offset in bytes to read the log from
+    :param tail_bytes: only read the last tail_bytes bytes of the log
+    :returns: generator of the decoded chunks of the log
+    """
+    task = __wait_for_app_to_be_running(batch_client, cluster_id, application_name)
+
+    if __check_task_node_exist(batch_client, cluster_id, task):
+        total_bytes = __get_output_file_properties(batch_client, cluster_id, application_name).content_length
+        read = lambda start, end: __read_node_log(batch_client, cluster_id, application_name, start, end)
+    else:
+        try:
+            total_bytes = blob_client.get_blob_properties(
+                cluster_id, application_name + '/' + constants.SPARK_SUBMIT_LOGS_FILE).properties.content_length
+        except azure.common.AzureMissingResourceHttpError:
+            raise error.AztkError("Logs not found in your storage account. They were either deleted or never existed.")
+        read = lambda start, end: __read_storage_log(blob_client, cluster_id, application_name, start, end,
+                                                     chunk_size)
+
+    if tail_bytes is not None:
+        start = max(total_bytes - tail_bytes, 0)
+    if start >= total_bytes:
+        return
+    yield from helpers.iter_decoded(read(start, total_bytes), errors="replace")
+
+
+class _FollowedLog:
+    """
+    State of the log of an application between two ticks of a LogFollower
+    """
+
+    def __init__(self, application_name: str, min_interval: float):
+        self.application_name = application_name
+        self.state = None
+        self.node_gone = False
+        self.offset = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.interval = min_interval
+        self.next_poll = 0
+        self.done = False
+
+    @property
+    def started(self) -> bool:
+        return self.state in (batch_models.TaskState.running, batch_models.TaskState.completed)
+
+
+class LogFollower:
+    """
+    Follow the logs of many applications of a cluster or job at once.
+    The state of all the applications is listed with a single call, and refreshed less often once they run. While
+    an application runs a tick costs a single ranged read of the new bytes of its log from the node, or from storage
+    once the node is gone. Logs that didn't grow are polled less and less often.
+    :param job_id: id of the batch job running the applications
+    :param application_names: applications to follow, None to follow all the applications of the job
+    :param storage_container: container the logs are shipped to, defaults to the job id
+    :param exclude: ids of the tasks of the job which aren't applications
+    """
+
+    def __init__(self,
+                 batch_client,
+                 blob_client,
+                 job_id: str,
+                 application_names: List[str] = None,
+                 storage_container: str = None,
+                 exclude: List[str] = (),
+                 min_interval: float = constants.LOG_FOLLOW_MIN_INTERVAL,
+                 max_interval: float = constants.LOG_FOLLOW_MAX_INTERVAL,
+                 backoff_factor: float = constants.LOG_FOLLOW_BACKOFF_FACTOR,
+                 state_refresh_interval: float = constants.LOG_FOLLOW_STATE_REFRESH_INTERVAL,
+                 chunk_size: int = constants.LOG_STREAM_CHUNK_SIZE):
+        self.batch_client = batch_client
+        self.blob_client = blob_client
+        self.job_id = job_id
+        self.storage_container = storage_container or job_id
+        self.follow_all = application_names is None
+        self.exclude = set(exclude)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.state_refresh_interval = state_refresh_interval
+        self.chunk_size = chunk_size
+        self.logs = {name: _FollowedLog(name, min_interval) for name in application_names or []}
+        self._listed = False
+        self._refresh_interval = min_interval
+        self._next_refresh = 0
+
+    @property
+    def done(self) -> bool:
+        return self._listed and all(log.done for log in self.logs.values())
+
+    def _refresh_states(self):
+        tasks = list(self.batch_client.task.list(
+            self.job_id, task_list_options=batch_models.TaskListOptions(select="id,state")))
+        if not self._listed and not self.follow_all:
+            task_ids = {task.id for task in tasks}
+            missing = sorted(name for name in self.logs if name not in task_ids)
+            if missing:
+                raise error.AztkError("The application {0} does not exist".format(", ".join(missing)))
+        for task in tasks:
+            if task.id in self.exclude:
+                continue
+            log = self.logs.get(task.id)
+            if log is None:
+                if not self.follow_all:
+                    continue
+                log = self.logs[task.id] = _FollowedLog(task.id, self.min_interval)
+            log.state = task.state
+        self._listed = True
+
+        if all(log.started for log in self.logs.values() if not log.done):
+            self._refresh_interval = self.state_refresh_interval
+        else:
+            self._refresh_interval = min(self._refresh_interval * self.backoff_factor, self.max_interval)
+        self._next_refresh = time.monotonic() + self._refresh_interval
+
+    def _read_node(self, log: _FollowedLog) -> bytes:
+        try:
+            stream = self.batch_client.file.get_from_task(
+                self.job_id, log.application_name, output_file,
+                batch_models.FileGetFromTaskOptions(
+                    ocp_range="bytes={0}-{1}".format(log.offset, log.offset + self.chunk_size - 1)))
+            return b"".join(stream)
+        except batch_error.BatchErrorException as e:
+            if e.response.status_code == 416:
+                # nothing was written after the offset
+                return b""
+            if log.state is batch_models.TaskState.completed:
+                # the node or the working directory of the task is gone, the log is in storage
+                log.node_gone = True
+                return self._read_storage(log)
+            if e.response.status_code in (404, 409):
+                # the log isn't created yet or the node is busy
+                return b""
+            raise
+
+    def _read_storage(self, log: _FollowedLog) -> bytes:
+        blob_name = log.application_name + '/' + constants.SPARK_SUBMIT_LOGS_FILE
+        try:
+            total_bytes = self.blob_client.get_blob_properties(
+                self.storage_container, blob_name).properties.content_length
+            if total_bytes <= log.offset:
+                return b""
+            return self.blob_client.get_blob_to_bytes(
+                self.storage_container, blob_name, start_range=log.offset,
+                end_range=min(log.offset + self.chunk_size, total_bytes) - 1).content
+        except azure.common.AzureMissingResourceHttpError:
+            raise error.AztkError("Logs of {0} not found in your storage account. They were either deleted or never "
+                                  "existed.".format(log.application_name))
+
+    def _poll_log(self, log: _FollowedLog, now: float) -> str:
+        data = self._read_storage(log) if log.node_gone else self._read_node(log)
+        log.offset += len(data)
+        text = log.decoder.decode(data)
+
+        if len(data) == self.chunk_size:
+            # more is already written, read it on the next tick
+            log.interval = 0
+        elif data:
+            log.interval = self.min_interval
+        elif log.state is batch_models.TaskState.completed:
+            log.done = True
+            return text + log.decoder.decode(b"", final=True)
+        else:
+            log.interval = min(max(log.interval, self.min_interval) * self.backoff_factor, self.max_interval)
+        log.next_poll = now + log.interval
+        return text
+
+    def poll(self) -> List[Tuple[str, str]]:
+        """
+        Run one tick
+        :returns: list of (application name, new text of its log)
+        """
+        now = time.monotonic()
+        if now >= self._next_refresh:
+            self._refresh_states()
+        output = []
+        for log in self.logs.values():
+            if log.done or not log.started or log.next_poll > now:
+                continue
+            text = self._poll_log(log, now)
+            if text:
+                output.append((log.application_name, text))
+        return output
+
+    def next_delay(self) -> float:
+        """
+        Seconds to sleep before the next tick
+        """
+        # the logs of applications waiting to run are only polled once a state refresh saw them start
+        next_tick = min([self._next_refresh] +
+                        [log.next_poll for log in self.logs.values() if log.started and not log.done])
+        return max(next_tick - time.monotonic(), 0)
+
+    def follow(self) -> Iterator[Tuple[str, str]]:
+        """
+        Generator of (application name, new text of its log) until all the applications completed
+        """
+        while True:
+            yield from self.poll()
+            if self.done:
+                return
+            time.sleep(self.next_delay())
+
+
+def __download_log(batch_client, blob_client, job_id: str, storage_container: str, task: batch_models.CloudTask,
+                   dest_dir: str) -> str:
+    complete = task.state is batch_models.TaskState.completed
+    path = os.path.join(dest_dir, task.id + ".log")
+    if complete and os.path.exists(path):
+        return path
+    if not complete:
+        path += ".partial"
+
+    tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as f:
+            try:
+                for data in batch_client.file.get_from_task(job_id, task.id, output_file):
+                    f.write(data)
+            except batch_error.BatchErrorException:
+                # the node of the task is gone, the log is in storage
+                f.seek(0)
+                f.truncate()
+                blob_client.get_blob_to_stream(
+                    storage_container, task.id + '/' + constants.SPARK_SUBMIT_LOGS_FILE, f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if complete and os.path.exists(path + ".partial"):
+        os.remove(path + ".partial")
+    return path
+
+
+def download_logs(batch_client, blob_client, job_id: str, dest_dir: str, storage_container: str = None,
+                  exclude: List[str] = (), max_workers: int = constants.LOG_DOWNLOAD_MAX_WORKERS) -> Dict[str, str]:
+    """
+    Download the logs of all the applications of a job at once. The tasks are listed once and the logs are read
+    from the nodes, or from storage once the node is gone, a few at a time.
+    The log of a completed application is written to <dest_dir>/<application>.log and isn't downloaded again,
+    the log of a running application to <dest_dir>/<application>.log.partial.
+    :param job_id: id of the batch job running the applications
+    :param storage_container: container the logs are shipped to, defaults to the job id
+    :param exclude: ids of the tasks of the job which aren't applications
+    :returns: dict of the application names to the paths of their logs
+    """
+    storage_container = storage_container or job_id
+    list_options = batch_models.TaskListOptions(select="id,state")
+    tasks = [
+        task for task in batch_client.task.list(job_id, task_list_options=list_options)
+        if task.id not in exclude and task.state in (batch_models.TaskState.running, batch_models.TaskState.completed)
+    ]
+    if not tasks:
+        return {}
+
+    os.makedirs(dest_dir, exist_ok=True)
+    paths = {}
+    missing = []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+        futures = {
+            task.id: executor.submit(__download_log, batch_client, blob_client, job_id, storage_container, task,
+                                     dest_dir)
+            for task in tasks
+        }
+        for application_name, future in futures.items():
+            try:
+                paths[application_name] = future.result()
+            except azure.common.AzureMissingResourceHttpError:
+                missing.append(application_name)
+
+    if missing:
+        raise error.AztkError("Logs of {0} not found in your storage account. They were either deleted or never "
+                              "existed.".format(", ".join(sorted(missing))))
+    return paths
@@ -1,13 +1,13 @@
 import datetime
 import os
-import time
 from typing import List
 
 import azure.batch.models as batch_models
 import yaml
 
 import aztk.error as error
-from aztk.utils import constants, helpers
+from aztk.spark.helpers import get_log
+from aztk.utils import constants, helpers, tracing
 from aztk.utils.command_builder import CommandBuilder
 
 
@@ -25,6 +25,7 @@ def __app_cmd():
     return docker_exec.to_str()
 
 
+@tracing.traced("generate job manager task")
 def generate_task(spark_client, job, application_tasks):
     resource_files = []
     for application, task in application_tasks:
@@ -180,6 +181,21 @@ def get_application_log(spark_client, job_id, application_name):
         return spark_client.get_application_log(job_id, application_name)
 
 
+def log_follower(spark_client, job_id, application_names=None):
+    """
+        Follower of the logs of the applications of the most recent run of the job
+    """
+    recent_run_job = __get_recent_job(spark_client, job_id)
+    return get_log.LogFollower(spark_client.batch_client, spark_client.blob_client, recent_run_job.id,
+                               application_names, storage_container=job_id, exclude=[job_id])
+
+
+def download_application_logs(spark_client, job_id, dest_dir):
+    recent_run_job = __get_recent_job(spark_client, job_id)
+    return get_log.download_logs(spark_client.batch_client, spark_client.blob_client, recent_run_job.id, dest_dir,
+                                 storage_container=job_id, exclude=[job_id])
+
+
 def stop_app(spark_client, job_id, application_name):
     recent_run_job = __get_recent_job(spark_client, job_id)
 
@@ -190,9 +206,36 @@ def stop_app(spark_client, job_id, application_name):
     except batch_models.batch_error.BatchErrorException:
         return False
 
-def wait_until_job_finished(spark_client, job_id):
-    job_state = spark_client.batch_client.job_schedule.get(job_id).state
+def poll_jobs(spark_client, job_ids):
+    """
+        Check the state of many jobs with a single job schedule listing
+    """
+    job_schedules = {
+        job_schedule.id: job_schedule
+        for job_schedule in spark_client.batch_client.job_schedule.list(
+            batch_models.JobScheduleListOptions(select="id,state"))
+    }
+    results = {}
+    for job_id in job_ids:
+        job_schedule = job_schedules.get(job_id)
+        if job_schedule is None:
+            results[job_id] = error.AztkError("The job {0} does not exist.".format(job_id))
+        else:
+            results[job_id] = True if job_schedule.state == batch_models.JobScheduleState.completed else None
+    return results
 
-    while job_state != batch_models.JobScheduleState.completed:
-        time.sleep(3)
+
+def jobs_waiter(spark_client, job_ids, timeout=None):
+    return helpers.Waiter(job_ids, lambda pending: poll_jobs(spark_client, pending), timeout=timeout)
+
+
+def wait_until_jobs_finished(spark_client, job_ids, timeout=None):
+    jobs_waiter(spark_client, job_ids, timeout).wait()
+
+
+def wait_until_job_finished(spark_client, job_id):
+    def poll(_):
         job_state = spark_client.batch_client.job_schedule.get(job_id).state
+        return {job_id: True if job_state == batch_models.JobScheduleState.completed else None}
+
+    helpers.Waiter([job_id], poll).wait()
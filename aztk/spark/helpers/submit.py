@@ -1,9 +1,11 @@
 import datetime
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 import yaml
 import azure.batch.models as batch_models
-from aztk.utils import constants, helpers
+from aztk.internal import artifacts
+from aztk.utils import constants, helpers, tracing
 from aztk.utils.command_builder import CommandBuilder
 
 
@@ -16,51 +18,18 @@ def __get_node(spark_client, node_id: str, cluster_id: str) -> batch_models.Comp
     return spark_client.batch_client.compute_node.get(cluster_id, node_id)
 
 
-def generate_task(spark_client, container_id, application):
-    resource_files = []
-
-    app_resource_file = helpers.upload_file_to_container(container_name=container_id,
-                                                         application_name=application.name,
-                                                         file_path=application.application,
-                                                         blob_client=spark_client.blob_client,
-                                                         use_full_path=False)
-
-    # Upload application file
-    resource_files.append(app_resource_file)
-
-    # Upload dependent JARS
-    jar_resource_file_paths = []
-    for jar in application.jars:
-        current_jar_resource_file_path = helpers.upload_file_to_container(container_name=container_id,
-                                                                          application_name=application.name,
-                                                                          file_path=jar,
-                                                                          blob_client=spark_client.blob_client,
-                                                                          use_full_path=False)
-        jar_resource_file_paths.append(current_jar_resource_file_path)
-        resource_files.append(current_jar_resource_file_path)
-
-    # Upload dependent python files
-    py_files_resource_file_paths = []
-    for py_file in application.py_files:
-        current_py_files_resource_file_path = helpers.upload_file_to_container(container_name=container_id,
-                                                                               application_name=application.name,
-                                                                               file_path=py_file,
-                                                                               blob_client=spark_client.blob_client,
-                                                                               use_full_path=False)
-        py_files_resource_file_paths.append(
-            current_py_files_resource_file_path)
-        resource_files.append(current_py_files_resource_file_path)
-
-    # Upload other dependent files
-    files_resource_file_paths = []
-    for file in application.files:
-        files_resource_file_path = helpers.upload_file_to_container(container_name=container_id,
-                                                                    application_name=application.name,
-                                                                    file_path=file,
-                                                                    blob_client=spark_client.blob_client,
-                                                                    use_full_path=False)
-        files_resource_file_paths.append(files_resource_file_path)
-        resource_files.append(files_resource_file_path)
+def application_files(application) -> List[str]:
+    """
+    Local files of the application: the application file, dependent jars, python files and other files
+    """
+    return [application.application] + application.jars + application.py_files + application.files
+
+
+@tracing.traced("generate application task")
+def generate_task(spark_client, container_id, application, progress_callback=None):
+    # Upload the application files unless already stored
+    artifact_store = artifacts.ArtifactStore(spark_client.blob_client)
+    resource_files = artifact_store.upload_resource_files(application_files(application), progress_callback)
 
     # Upload application definition
     application.application = os.path.basename(application.application)
@@ -102,24 +71,57 @@ def generate_task(spark_client, container_id, application):
     return task
 
 
-def affinitize_task_to_master(spark_client, cluster_id, task):
+@tracing.traced("get master affinity")
+def get_master_affinity(spark_client, cluster_id) -> batch_models.AffinityInformation:
     cluster = spark_client.get_cluster(cluster_id)
-    master_node = spark_client.batch_client.compute_node.get(pool_id=cluster_id, node_id=cluster.master_node_id)
-    task.affinity_info = batch_models.AffinityInformation(affinity_id=master_node.affinity_id)
+    master_node = spark_client.batch_client.compute_node.get(
+        pool_id=cluster_id,
+        node_id=cluster.master_node_id,
+        compute_node_get_options=batch_models.ComputeNodeGetOptions(select="id,affinityId"))
+    return batch_models.AffinityInformation(affinity_id=master_node.affinity_id)
+
+
+def affinitize_task_to_master(spark_client, cluster_id, task):
+    task.affinity_info = get_master_affinity(spark_client, cluster_id)
     return task
 
 
-def submit_application(spark_client, cluster_id, application, wait: bool = False):
+def submit_application(spark_client, cluster_id, application, wait: bool = False, progress_callback=None):
     """
     Submit a spark app
     """
-    task = generate_task(spark_client, cluster_id, application)
-    task = affinitize_task_to_master(spark_client, cluster_id, task)
+    submit_applications(spark_client, cluster_id, [application], wait, progress_callback=progress_callback)
 
 
-    # Add task to batch job (which has the same name as cluster_id)
+def submit_applications(spark_client, cluster_id, applications, wait: bool = False,
+                        max_workers: int = constants.SUBMIT_APPLICATIONS_MAX_WORKERS, progress_callback=None):
+    """
+    Submit many spark apps at once.
+    The master affinity is resolved once, the files of all the applications are uploaded in a single batch
+    and the tasks are added with as few add_collection requests as possible.
+    :param progress_callback: called with (uploaded bytes, total bytes) while the files are uploaded
+    """
+    if not applications:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(applications))) as executor:
+        affinity = executor.submit(tracing.propagate(get_master_affinity), spark_client, cluster_id)
+        artifacts.ArtifactStore(spark_client.blob_client).upload_all(
+            [file_path for application in applications for file_path in application_files(application)],
+            progress_callback)
+        # The files are now known to be stored, generating the tasks doesn't upload them again
+        tasks = list(executor.map(tracing.propagate(lambda application: generate_task(spark_client, cluster_id,
+                                                                                      application)),
+                                  applications))
+        affinity = affinity.result()
+
+    for task in tasks:
+        task.affinity_info = affinity
+
+    # Add tasks to batch job (which has the same name as cluster_id)
     job_id = cluster_id
-    spark_client.batch_client.task.add(job_id=job_id, task=task)
+    helpers.add_task_collection(job_id, tasks, spark_client.batch_client)
 
     if wait:
-        helpers.wait_for_task_to_complete(job_id=job_id, task_id=task.id, batch_client=spark_client.batch_client)
+        helpers.wait_for_tasks_to_complete(job_id=job_id,
+                                           batch_client=spark_client.batch_client,
+                                           task_ids=[task.id for task in tasks])
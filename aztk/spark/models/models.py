@@ -1,5 +1,4 @@
 import io
-from Crypto.PublicKey import RSA
 from typing import List
 import aztk.models
 from aztk import error
@@ -37,6 +36,20 @@ class Cluster(aztk.models.Cluster):
         return None
 
 
+class ClusterCreationResult:
+    """
+    Outcome of creating one cluster with create_clusters_in_parallel
+    """
+    def __init__(self, cluster_id: str, cluster: Cluster = None, error: Exception = None):
+        self.cluster_id = cluster_id
+        self.cluster = cluster
+        self.error = error
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
 class RemoteLogin(aztk.models.RemoteLogin):
     pass
 
@@ -54,6 +67,7 @@ class SparkConfiguration():
         self.ssh_key_pair = self.__generate_ssh_key_pair()
 
     def __generate_ssh_key_pair(self):
+        from Crypto.PublicKey import RSA
         key = RSA.generate(2048)
         priv_key = key.exportKey('PEM')
         pub_key = key.publickey().exportKey('OpenSSH')
@@ -1,14 +1,14 @@
 from __future__ import print_function
-import datetime
 import io
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 import azure.batch.batch_service_client as batch
 import azure.batch.batch_auth as batch_auth
 import azure.batch.models as batch_models
 import azure.storage.blob as blob
 from aztk.version import __version__
-from aztk.utils import constants
+from aztk.utils import constants, helpers, tracing
 from aztk import error
 import aztk.models
 
@@ -17,32 +17,88 @@ class MasterInvalidStateError(Exception):
     pass
 
 
-def wait_for_master_to_be_ready(client, cluster_id: str):
+def get_master_node_id(pool: batch_models.CloudPool):
+    """
+        :returns: the id of the node that is the assigned master of this pool
+    """
+    if pool.metadata is None:
+        return None
+
+    for metadata in pool.metadata:
+        if metadata.name == constants.MASTER_NODE_METADATA_KEY:
+            return metadata.value
+
+    return None
+
 
-    master_node_id = None
-    start_time = datetime.datetime.now()
-    while True:
-        if not master_node_id:
-            master_node_id = client.get_cluster(cluster_id).master_node_id
-            if not master_node_id:
-                time.sleep(5)
-                continue
-
-        master_node = client.batch_client.compute_node.get(cluster_id, master_node_id)
-
-        if master_node.state in [batch_models.ComputeNodeState.idle,  batch_models.ComputeNodeState.running]:
-            break
-        elif master_node.state is batch_models.ComputeNodeState.start_task_failed:
-            raise MasterInvalidStateError("Start task failed on master")
-        elif master_node.state in [batch_models.ComputeNodeState.unknown, batch_models.ComputeNodeState.unusable]:
-            raise MasterInvalidStateError("Master is in an invalid state")
+def master_state_result(state):
+    """
+        Translate the state of a master node into a Waiter result
+    """
+    if state is batch_models.ComputeNodeState.start_task_failed:
+        return MasterInvalidStateError("Start task failed on master")
+    elif state in [batch_models.ComputeNodeState.unknown, batch_models.ComputeNodeState.unusable]:
+        return MasterInvalidStateError("Master is in an invalid state")
+    elif state in [batch_models.ComputeNodeState.idle, batch_models.ComputeNodeState.running]:
+        return True
+    return None
+
+
+def poll_masters(client, cluster_ids):
+    """
+        Check the masters of many clusters with a single pool listing, filtered on their ids.
+        Only the masters that have already been picked are fetched, concurrently.
+        :returns: dict cluster_id -> True (ready), None (pending) or an exception (failed)
+    """
+    pool_filter = " or ".join("id eq '{0}'".format(cluster_id) for cluster_id in cluster_ids)
+    pools = {
+        pool.id: pool
+        for pool in client.batch_client.pool.list(
+            batch_models.PoolListOptions(filter=pool_filter, select="id,metadata"))
+    }
+    results = {}
+    masters = {}
+    for cluster_id in cluster_ids:
+        pool = pools.get(cluster_id)
+        if pool is None:
+            results[cluster_id] = error.AztkError("Cluster {0} does not exist.".format(cluster_id))
+            continue
+        master_node_id = get_master_node_id(pool)
+        if master_node_id:
+            masters[cluster_id] = master_node_id
         else:
-            now = datetime.datetime.now()
+            results[cluster_id] = None
+
+    def get_master_state(cluster_id):
+        node = client.batch_client.compute_node.get(
+            cluster_id, masters[cluster_id], batch_models.ComputeNodeGetOptions(select="id,state"))
+        return cluster_id, master_state_result(node.state)
 
-            delta = now - start_time
-            if delta.total_seconds() > constants.WAIT_FOR_MASTER_TIMEOUT:
-                raise MasterInvalidStateError(
-                    "Master didn't become ready before timeout.")
+    if masters:
+        with ThreadPoolExecutor(max_workers=min(len(masters), constants.WAIT_POLL_MAX_WORKERS)) as executor:
+            results.update(executor.map(get_master_state, masters))
 
-            time.sleep(10)
+    return results
+
+
+def masters_waiter(client, cluster_ids, timeout=constants.WAIT_FOR_MASTER_TIMEOUT, fail_fast: bool = True):
+    return helpers.Waiter(
+        cluster_ids, lambda pending: poll_masters(client, pending), timeout=timeout, fail_fast=fail_fast)
+
+
+def wait_for_masters_to_be_ready(client, cluster_ids, timeout=constants.WAIT_FOR_MASTER_TIMEOUT,
+                                 fail_fast: bool = True):
+    """
+        Wait until the masters of all the given clusters are ready
+        :returns: dict cluster_id -> error for the clusters that failed (only when fail_fast is False)
+    """
+    return masters_waiter(client, cluster_ids, timeout, fail_fast).wait()
+
+
+@tracing.traced("wait for master")
+def wait_for_master_to_be_ready(client, cluster_id: str):
+    try:
+        wait_for_masters_to_be_ready(client, [cluster_id])
+    except error.WaitTimeoutError:
+        raise MasterInvalidStateError("Master didn't become ready before timeout.")
     time.sleep(5)
@@ -2,6 +2,8 @@ from . import azure_api
 from . import command_builder
 from . import constants
 from . import helpers
+from . import metrics
+from . import tracing
 from . import file_utils
 from . import get_ssh_key
 from . import secure_utils
@@ -1,13 +1,16 @@
+import logging
 import re
+import threading
+import time
 import azure.batch.batch_service_client as batch
 import azure.batch.batch_auth as batch_auth
 import azure.storage.blob as blob
+from azure.storage.common._auth import _StorageSharedKeyAuthentication
+from msrest.authentication import BasicTokenAuthentication
 from aztk import error
+from aztk.internal import cache
+from aztk.utils import constants, metrics
 from aztk.version import __version__
-from azure.common.credentials import ServicePrincipalCredentials
-from azure.mgmt.batch import BatchManagementClient
-from azure.mgmt.storage import StorageManagementClient
-from azure.storage.common import CloudStorageAccount
 from typing import Optional
 
 
@@ -17,6 +20,190 @@ RESOURCE_ID_PATTERN = re.compile('^/subscriptions/(?P<subscription>[^/]+)'
                                  '/[^/]+Accounts/(?P<account>[^/]+)$')
 
 
+ARM_RESOURCE = 'https://management.core.windows.net/'
+BATCH_RESOURCE = 'https://batch.core.windows.net/'
+
+# Statuses of the requests rejected because of an expired or revoked token or a regenerated key
+AUTH_FAILURE_STATUS_CODES = (401, 403)
+
+"""
+    Tokens, batch account endpoints and storage account keys resolved with service principal auth.
+    Only readable by the current user.
+"""
+auth_cache = cache.DiskCache("azure-auth", ttl=constants.AUTH_CACHE_TTL, private=True)
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def clear_auth_cache():
+    auth_cache.invalidate()
+
+
+def _fetch_and_cache(key, fetch, ttl: float, store: cache.TTLCache):
+    value = fetch()
+    store.set(key, {"value": value, "time": time.time()}, ttl)
+    return value
+
+
+def _refresh_in_background(key, fetch, ttl: float, store: cache.TTLCache):
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def refresh():
+        try:
+            _fetch_and_cache(key, fetch, ttl, store)
+        except Exception as e:
+            logging.debug("Failed to refresh %s: %s", key, e)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def cached_resolve(key, fetch, ttl: float = constants.AUTH_CACHE_TTL, store: cache.TTLCache = None):
+    """
+    Return the value cached under key or resolve it with fetch().
+    Values older than AUTH_CACHE_REFRESH_AFTER are returned right away and refreshed in the background.
+    """
+    store = store if store is not None else auth_cache
+    entry = store.get(key)
+    if entry is None:
+        return _fetch_and_cache(key, fetch, ttl, store)
+    if time.time() - entry["time"] > constants.AUTH_CACHE_REFRESH_AFTER:
+        _refresh_in_background(key, fetch, ttl, store)
+    return entry["value"]
+
+
+class CachedServicePrincipalCredentials(BasicTokenAuthentication):
+    """
+    Service principal credentials whose token is shared between processes through the auth cache.
+    A new token is requested from AAD only when the cached one is about to expire, or once
+    when a request is rejected with it, e.g. because the token was revoked.
+    """
+
+    def __init__(self, client_id: str, secret: str, tenant: str, resource: str, store: cache.TTLCache = None):
+        self.client_id = client_id
+        self.secret = secret
+        self.tenant = tenant
+        self.resource = resource
+        self.store = store if store is not None else auth_cache
+        self._key = ("token", tenant, client_id, resource)
+        self._lock = threading.Lock()
+        super().__init__(self.store.get(self._key) or self.__fetch_token())
+
+    def __fetch_token(self):
+        from azure.common.credentials import ServicePrincipalCredentials
+        token = dict(ServicePrincipalCredentials(
+            client_id=self.client_id,
+            secret=self.secret,
+            tenant=self.tenant,
+            resource=self.resource).token)
+        expires_at = float(token.get("expires_at") or token.get("expires_on") or time.time() + 3600)
+        token["expires_at"] = expires_at
+        self.store.set(self._key, token, ttl=max(expires_at - time.time() - constants.AUTH_TOKEN_EXPIRY_MARGIN, 0))
+        return token
+
+    def __retry_unauthorized(self, response, **kwargs):
+        if response.status_code not in AUTH_FAILURE_STATUS_CODES or getattr(response.request, "aztk_retried", False):
+            return response
+        with self._lock:
+            if self.token["access_token"] in response.request.headers.get("Authorization", ""):
+                self.store.invalidate(self._key)
+                self.token = self.__fetch_token()
+        request = response.request.copy()
+        request.headers["Authorization"] = "Bearer {0}".format(self.token["access_token"])
+        request.aztk_retried = True
+        response.close()
+        retried = response.connection.send(request, **kwargs)
+        retried.history.append(response)
+        retried.request = request
+        return retried
+
+    def signed_session(self, session=None):
+        with self._lock:
+            if self.token["expires_at"] - time.time() < constants.AUTH_TOKEN_EXPIRY_MARGIN:
+                self.token = self.store.get(self._key) or self.__fetch_token()
+        session = super().signed_session(session)
+        if self.__retry_unauthorized not in session.hooks["response"]:
+            session.hooks["response"].append(self.__retry_unauthorized)
+        return session
+
+
+def make_service_principal_credentials(service_principal, resource: str, store: cache.TTLCache = None):
+    return CachedServicePrincipalCredentials(
+        client_id=service_principal.client_id,
+        secret=service_principal.credential,
+        tenant=service_principal.tenant_id,
+        resource=resource,
+        store=store)
+
+
+def resolve_batch_service_url(service_principal, store: cache.TTLCache = None) -> str:
+    """
+    Batch account endpoint of the batch_account_resource_id, cached
+    """
+    def fetch():
+        from azure.mgmt.batch import BatchManagementClient
+        arm_credentials = make_service_principal_credentials(service_principal, ARM_RESOURCE, store)
+        m = RESOURCE_ID_PATTERN.match(service_principal.batch_account_resource_id)
+        arm_batch_client = BatchManagementClient(arm_credentials, m.group('subscription'))
+        account = arm_batch_client.batch_account.get(m.group('resourcegroup'), m.group('account'))
+        return 'https://{0}/'.format(account.account_endpoint)
+
+    key = ("batch-endpoint", service_principal.client_id, service_principal.batch_account_resource_id)
+    return cached_resolve(key, fetch, constants.AUTH_CACHE_TTL, store)
+
+
+def _storage_key_cache_key(service_principal):
+    return ("storage-key", service_principal.client_id, service_principal.storage_account_resource_id)
+
+
+def resolve_storage_account_key(service_principal, store: cache.TTLCache = None) -> str:
+    """
+    First key of the storage_account_resource_id, cached
+    """
+    def fetch():
+        from azure.mgmt.storage import StorageManagementClient
+        arm_credentials = make_service_principal_credentials(service_principal, ARM_RESOURCE, store)
+        m = RESOURCE_ID_PATTERN.match(service_principal.storage_account_resource_id)
+        mgmt_client = StorageManagementClient(arm_credentials, m.group('subscription'))
+        keys = mgmt_client.storage_accounts.list_keys(
+            resource_group_name=m.group('resourcegroup'), account_name=m.group('account')).keys
+        return keys[0].value
+
+    return cached_resolve(
+        _storage_key_cache_key(service_principal), fetch, constants.AUTH_CACHE_STORAGE_KEY_TTL, store)
+
+
+def retry_with_new_storage_key(blob_client, service_principal, store: cache.TTLCache = None):
+    """
+    Resolve the storage account key again and retry once when a request of blob_client is
+    rejected with the cached key, e.g. after the keys were regenerated
+    """
+    retry = blob_client.retry
+
+    def retry_policy(retry_context):
+        response = retry_context.response
+        if (response is not None and response.status in AUTH_FAILURE_STATUS_CODES
+                and not getattr(retry_context, "aztk_retried", False)):
+            retry_context.aztk_retried = True
+            # count it like the retries of the storage retry policies, the client logs the count of every retry
+            retry_context.count = getattr(retry_context, "count", 0) + 1
+            (store if store is not None else auth_cache).invalidate(_storage_key_cache_key(service_principal))
+            blob_client.account_key = resolve_storage_account_key(service_principal, store)
+            blob_client.authentication = _StorageSharedKeyAuthentication(
+                blob_client.account_name, blob_client.account_key)
+            return 0
+        return retry(retry_context)
+
+    blob_client.retry = retry_policy
+    return blob_client
+
+
 def validate_secrets(secrets):
     if secrets.service_principal:
         if not RESOURCE_ID_PATTERN.match(secrets.service_principal.batch_account_resource_id):
@@ -26,12 +213,13 @@ def validate_secrets(secrets):
             raise error.AzureApiInitError("ServicePrincipal storage_account_resource_id is not in expected format")
 
 
-def make_batch_client(secrets):
+def make_batch_client(secrets, registry: Optional[metrics.MetricsRegistry] = None):
     """
         Creates a batch client object
         :param str batch_account_key: batch account key
         :param str batch_account_name: batch account name
         :param str batch_service_url: batch service url
+        :param registry: if given, the client records the metrics of its calls to it
     """
     # Validate the given config
     credentials = None
@@ -44,20 +232,8 @@ def make_batch_client(secrets):
             secrets.shared_key.batch_account_key)
     else:
         # Set up ServicePrincipalCredentials
-        arm_credentials = ServicePrincipalCredentials(
-            client_id=secrets.service_principal.client_id,
-            secret=secrets.service_principal.credential,
-            tenant=secrets.service_principal.tenant_id,
-            resource='https://management.core.windows.net/')
-        m = RESOURCE_ID_PATTERN.match(secrets.service_principal.batch_account_resource_id)
-        arm_batch_client = BatchManagementClient(arm_credentials, m.group('subscription'))
-        account = arm_batch_client.batch_account.get(m.group('resourcegroup'), m.group('account'))
-        base_url = 'https://{0}/'.format(account.account_endpoint)
-        credentials = ServicePrincipalCredentials(
-            client_id=secrets.service_principal.client_id,
-            secret=secrets.service_principal.credential,
-            tenant=secrets.service_principal.tenant_id,
-            resource='https://batch.core.windows.net/')
+        base_url = resolve_batch_service_url(secrets.service_principal)
+        credentials = make_service_principal_credentials(secrets.service_principal, BATCH_RESOURCE)
 
     # Set up Batch Client
     batch_client = batch.BatchServiceClient(
@@ -68,15 +244,19 @@ def make_batch_client(secrets):
     batch_client.config.retry_policy.retries = 5
     batch_client.config.add_user_agent('aztk/{}'.format(__version__))
 
+    if registry is not None:
+        metrics.instrument_batch_client(batch_client, registry)
+
     return batch_client
 
 
-def make_blob_client(secrets):
+def make_blob_client(secrets, registry: Optional[metrics.MetricsRegistry] = None):
     """
         Creates a blob client object
         :param str storage_account_key: storage account key
         :param str storage_account_name: storage account name
         :param str storage_account_suffix: storage account suffix
+        :param registry: if given, the client records the metrics of its calls to it
     """
 
     if secrets.shared_key:
@@ -86,19 +266,20 @@ def make_blob_client(secrets):
             account_key=secrets.shared_key.storage_account_key,
             endpoint_suffix=secrets.shared_key.storage_account_suffix)
     else:
+        from azure.storage.common import CloudStorageAccount
+
         # Set up ServicePrincipalCredentials
-        arm_credentials = ServicePrincipalCredentials(
-            client_id=secrets.service_principal.client_id,
-            secret=secrets.service_principal.credential,
-            tenant=secrets.service_principal.tenant_id,
-            resource='https://management.core.windows.net/')
         m = RESOURCE_ID_PATTERN.match(secrets.service_principal.storage_account_resource_id)
-        accountname = m.group('account')
-        subscription = m.group('subscription')
-        resourcegroup = m.group('resourcegroup')
-        mgmt_client = StorageManagementClient(arm_credentials, subscription)
-        key = mgmt_client.storage_accounts.list_keys(resource_group_name=resourcegroup, account_name=accountname).keys[0].value
-        storage_client = CloudStorageAccount(accountname, key)
-        blob_client = storage_client.create_block_blob_service()
+        key = resolve_storage_account_key(secrets.service_principal)
+        storage_client = CloudStorageAccount(m.group('account'), key)
+        blob_client = retry_with_new_storage_key(
+            storage_client.create_block_blob_service(), secrets.service_principal)
+
+    # Files larger than the single put size are uploaded as blocks, max_connections blocks at a time
+    blob_client.MAX_SINGLE_PUT_SIZE = constants.BLOB_UPLOAD_SINGLE_PUT_SIZE
+    blob_client.MAX_BLOCK_SIZE = constants.BLOB_UPLOAD_BLOCK_SIZE
+
+    if registry is not None:
+        metrics.instrument_blob_client(blob_client, registry)
 
     return blob_client
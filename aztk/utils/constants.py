@@ -66,3 +66,168 @@ AZTK_CLUSTER_CONFIG_METADATA_KEY = "_aztk_cluster_config"
 
 TASK_WORKING_DIR = "wd"
 SPARK_SUBMIT_LOGS_FILE = "output.log"
+"""
+    Seconds between two appends of the new bytes of the application log to storage
+"""
+LOG_SHIP_INTERVAL = 5
+"""
+    Size of the ranges read from storage when streaming a log
+"""
+LOG_STREAM_CHUNK_SIZE = 4 * 1024 * 1024
+"""
+    Polling schedule used when following application logs (in seconds)
+    A log is polled again after the min interval when it grew, and less and less often up to the max interval
+    when it didn't. The state of running applications is refreshed every state refresh interval
+"""
+LOG_FOLLOW_MIN_INTERVAL = 1
+LOG_FOLLOW_MAX_INTERVAL = 15
+LOG_FOLLOW_BACKOFF_FACTOR = 1.5
+LOG_FOLLOW_STATE_REFRESH_INTERVAL = 15
+"""
+    Maximum number of application logs downloaded at the same time
+"""
+LOG_DOWNLOAD_MAX_WORKERS = 8
+"""
+    Maximum size of a block of an append blob
+"""
+APPEND_BLOB_MAX_BLOCK_SIZE = 4 * 1024 * 1024
+
+"""
+    Maximum number of blocking Batch/Storage calls the asyncio client runs at the same time
+"""
+ASYNC_CLIENT_MAX_CONCURRENCY = 32
+
+"""
+    Default number of clusters created at the same time by create_clusters_in_parallel
+"""
+CREATE_CLUSTERS_MAX_WORKERS = 8
+
+"""
+    Polling schedule used when waiting on clusters, jobs and applications (in seconds)
+    The interval grows by the backoff factor after every poll up to the max interval,
+    jitter is the fraction of the interval the delay is randomly moved by
+"""
+WAIT_POLL_INITIAL_INTERVAL = 1
+WAIT_POLL_MAX_INTERVAL = 15
+WAIT_POLL_BACKOFF_FACTOR = 1.5
+WAIT_POLL_JITTER = 0.2
+WAIT_POLL_MAX_WORKERS = 16
+
+"""
+    Maximum number of tasks Batch accepts in a single add_collection request
+"""
+TASK_ADD_COLLECTION_MAX_SIZE = 100
+
+"""
+    Number of applications whose files are uploaded at the same time by submit_all_applications
+"""
+SUBMIT_APPLICATIONS_MAX_WORKERS = 16
+
+"""
+    Container shared by every cluster and job of a storage account, holds content addressed application files
+"""
+SHARED_CONTAINER = "aztk-shared"
+"""
+    Container holding only the node scripts bundles. Pool start tasks keep a long lived read token on it, so it must
+    not hold anything else
+"""
+NODE_SCRIPTS_CONTAINER = "aztk-node-scripts"
+"""
+    Time to live in seconds of the knowledge that an artifact exists in the shared container
+"""
+ARTIFACT_EXISTS_CACHE_TTL = 60 * 60
+"""
+    Validity in days of the SAS tokens used by tasks to download artifacts
+"""
+ARTIFACT_SAS_EXPIRY_DAYS = 7
+"""
+    Number of seconds a container SAS token is reused for other blobs of the container
+"""
+SAS_REUSE_WINDOW = 60 * 60
+"""
+    Number of files uploaded at the same time
+"""
+ARTIFACT_UPLOAD_MAX_WORKERS = 8
+
+"""
+    Block uploads. Files larger than the single put size are uploaded in blocks of the block size,
+    max connections blocks of a file at a time
+"""
+BLOB_UPLOAD_SINGLE_PUT_SIZE = 32 * 1024 * 1024
+BLOB_UPLOAD_BLOCK_SIZE = 4 * 1024 * 1024
+BLOB_UPLOAD_MAX_CONNECTIONS = 4
+"""
+    Time to live in seconds of the blocks of interrupted uploads, the service discards uncommitted blocks after a week
+"""
+RESUMABLE_UPLOAD_STATE_TTL = 60 * 60 * 24 * 6
+"""
+    The uploaded blocks of a file are saved every time this many more blocks are uploaded, and when the upload fails
+"""
+RESUMABLE_UPLOAD_STATE_SAVE_EVERY = 16
+
+"""
+    Local caches
+"""
+CACHE_DIRECTORY = os.path.join(GLOBAL_CONFIG_PATH, 'cache')
+"""
+    Time to live in seconds of the cached VM image / node agent sku resolution
+    Value: 1 day
+"""
+NODE_AGENT_SKU_CACHE_TTL = 60 * 60 * 24
+"""
+    Time to live in seconds of the batch account endpoints resolved with service principal auth
+"""
+AUTH_CACHE_TTL = 60 * 60 * 24 * 7
+"""
+    Time to live in seconds of the storage account keys resolved with service principal auth
+"""
+AUTH_CACHE_STORAGE_KEY_TTL = 60 * 60 * 24
+"""
+    Cached endpoints and keys older than this many seconds are refreshed in the background
+"""
+AUTH_CACHE_REFRESH_AFTER = 60 * 60
+"""
+    Cached tokens are renewed when they expire in less than this many seconds
+"""
+AUTH_TOKEN_EXPIRY_MARGIN = 5 * 60
+"""
+    Time to live in seconds of the sha256 of local files, keyed by path, modification time and size
+    Value: 30 days
+"""
+FILE_HASH_CACHE_TTL = 60 * 60 * 24 * 30
+FILE_HASH_CHUNK_SIZE = 4 * 1024 * 1024
+"""
+    Time to live in seconds of the content hash of the node scripts
+    Value: 30 days
+"""
+NODE_SCRIPTS_DIGEST_CACHE_TTL = 60 * 60 * 24 * 30
+"""
+    Time to live in seconds of the remote login settings of a cluster's nodes
+"""
+REMOTE_LOGIN_SETTINGS_CACHE_TTL = 60
+"""
+    Maximum number of remote login settings requests made at the same time
+"""
+REMOTE_LOGIN_SETTINGS_MAX_WORKERS = 16
+"""
+    Maximum number of clusters whose node counts are fetched at the same time
+"""
+NODE_COUNTS_MAX_WORKERS = 16
+
+"""
+    SSH fan-out to the nodes of a cluster (cluster run and copy)
+    At most SSH_MAX_CONCURRENCY connections are open at once. Connecting to a node times out after
+    SSH_CONNECT_TIMEOUT seconds and transient failures are retried SSH_CONNECT_RETRIES times, waiting
+    SSH_CONNECT_RETRY_INTERVAL seconds doubled after every attempt. Once connected, a command or a copy is
+    given up on a node after SSH_COMMAND_TIMEOUT seconds
+"""
+SSH_MAX_CONCURRENCY = 32
+SSH_CONNECT_TIMEOUT = 30
+SSH_CONNECT_RETRIES = 3
+SSH_CONNECT_RETRY_INTERVAL = 1
+SSH_COMMAND_TIMEOUT = 60 * 60
+
+"""
+    Upper bounds in seconds of the latency histogram buckets of the service calls metrics
+"""
+METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
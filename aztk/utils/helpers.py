@@ -1,19 +1,29 @@
 from __future__ import print_function
+import base64
+import codecs
 import datetime
-import io
+import hashlib
 import os
+import random
 import time
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import azure.common
 import azure.batch.batch_service_client as batch
 import azure.batch.batch_auth as batch_auth
 import azure.batch.models as batch_models
+import azure.batch.models.batch_error as batch_error
 import azure.storage.blob as blob
+import azure.storage.blob.models as blob_models
 from aztk.version import __version__
-from aztk.utils import constants
+from aztk.utils import constants, tracing
 from aztk import error
+from aztk.internal import cache
+from aztk.internal import sas
 import aztk.models
 import yaml
+from typing import List
 import logging
 
 _STANDARD_OUT_FILE_NAME = 'stdout.txt'
@@ -31,23 +41,104 @@ def get_cluster(cluster_id, batch_client):
     return aztk.models.Cluster(pool, nodes)
 
 
-def wait_for_tasks_to_complete(job_id, batch_client):
+class Waiter:
+    """
+    Wait on many entities at once with a single polling schedule.
+    Every tick `poll` is called once with the ids still pending and returns a dict mapping ids to
+    True when done, to an exception when failed or to None when still pending.
+    Ticks are spaced with exponential backoff and jitter until everything is done, a target fails
+    or the global deadline is reached.
+    :param targets: ids of the entities to wait on
+    :param poll: function(pending: set) -> dict
+    :param timeout: global deadline in seconds, None to wait forever
+    :param fail_fast: if True raise the first failure, otherwise record it in `failures` and keep waiting on the others
+    """
+
+    def __init__(self,
+                 targets,
+                 poll,
+                 timeout: float = None,
+                 fail_fast: bool = True,
+                 initial_interval: float = constants.WAIT_POLL_INITIAL_INTERVAL,
+                 max_interval: float = constants.WAIT_POLL_MAX_INTERVAL,
+                 backoff_factor: float = constants.WAIT_POLL_BACKOFF_FACTOR,
+                 jitter: float = constants.WAIT_POLL_JITTER):
+        self.pending = set(targets)
+        self.failures = {}
+        self._poll = poll
+        self.fail_fast = fail_fast
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self._interval = initial_interval
+        self._deadline = time.monotonic() + timeout if timeout is not None else None
+
+    def poll(self) -> bool:
+        """
+        Run one tick
+        :returns: True when there is nothing left to wait on
+        """
+        if not self.pending:
+            return True
+
+        results = self._poll(frozenset(self.pending))
+        for target, result in results.items():
+            if target not in self.pending or result is None:
+                continue
+            if isinstance(result, Exception):
+                if self.fail_fast:
+                    raise result
+                self.failures[target] = result
+            self.pending.discard(target)
+
+        if not self.pending:
+            return True
+
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            raise error.WaitTimeoutError(
+                "Timed out waiting for {0}".format(", ".join(sorted(str(target) for target in self.pending))))
+        return False
+
+    def next_delay(self) -> float:
+        """
+        Seconds to sleep before the next tick
+        """
+        delay = min(self._interval, self.max_interval)
+        delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        self._interval *= self.backoff_factor
+        if self._deadline is not None:
+            delay = min(delay, max(self._deadline - time.monotonic(), 0))
+        return delay
+
+    def wait(self):
+        while not self.poll():
+            time.sleep(self.next_delay())
+        return self.failures
+
+
+def wait_for_tasks_to_complete(job_id, batch_client, task_ids=None, timeout=None):
     """
     Waits for all the tasks in a particular job to complete.
     :param batch_client: The batch client to use.
     :type batch_client: `batchserviceclient.BatchServiceClient`
     :param str job_id: The id of the job to monitor.
+    :param list task_ids: Only wait on these tasks. By default wait on all the tasks of the job.
+    :param float timeout: Maximum time to wait in seconds.
     """
-    while True:
-        tasks = batch_client.task.list(job_id)
+    list_options = batch_models.TaskListOptions(select="id,state")
 
-        incomplete_tasks = [
-            task for task in tasks
-            if task.state != batch_models.TaskState.completed
-        ]
-        if not incomplete_tasks:
-            return
-        time.sleep(5)
+    if task_ids is None:
+        def poll(_):
+            tasks = list(batch_client.task.list(job_id, task_list_options=list_options))
+            return {None: True if all(task.state == batch_models.TaskState.completed for task in tasks) else None}
+        Waiter([None], poll, timeout=timeout).wait()
+    else:
+        def poll(pending):
+            return {
+                task.id: True if task.state == batch_models.TaskState.completed else None
+                for task in batch_client.task.list(job_id, task_list_options=list_options) if task.id in pending
+            }
+        Waiter(task_ids, poll, timeout=timeout).wait()
 
 
 def wait_for_task_to_complete(job_id: str, task_id: str, batch_client):
@@ -58,14 +149,101 @@ def wait_for_task_to_complete(job_id: str, task_id: str, batch_client):
     :param str job_id: The id of the job to monitor.
     :param str job_id: The id of the task to monitor.
     """
-    while True:
+    def poll(_):
         task = batch_client.task.get(job_id=job_id, task_id=task_id)
-        if task.state != batch_models.TaskState.completed:
-            time.sleep(5)
-        else:
+        return {task_id: True if task.state == batch_models.TaskState.completed else None}
+
+    Waiter([task_id], poll).wait()
+
+
+@tracing.traced("add task collection")
+def add_task_collection(job_id: str, tasks, batch_client, chunk_size: int = constants.TASK_ADD_COLLECTION_MAX_SIZE):
+    """
+    Add tasks to a job with as few requests as possible.
+    Tasks are sent in chunks of at most chunk_size. A chunk too big for the service is split in half,
+    tasks that hit a server error are retried once.
+    :param str job_id: The id of the job to add the tasks to.
+    :param list tasks: List of TaskAddParameter.
+    :raises AztkError: if any of the tasks could not be added
+    """
+    failures = []
+    retries = []
+    for start in range(0, len(tasks), chunk_size):
+        __add_task_chunk(job_id, tasks[start:start + chunk_size], batch_client, failures, retries)
+    if retries:
+        __add_task_chunk(job_id, retries, batch_client, failures, None)
+    if failures:
+        raise error.AztkError("Failed to add {0} task(s) to job {1}:\n{2}".format(
+            len(failures), job_id, "\n".join(failures)))
+
+
+def __add_task_chunk(job_id, tasks, batch_client, failures, retries):
+    try:
+        result = batch_client.task.add_collection(job_id, tasks)
+    except batch_error.BatchErrorException as e:
+        if len(tasks) > 1 and e.error and e.error.code == "RequestBodyTooLarge":
+            middle = len(tasks) // 2
+            __add_task_chunk(job_id, tasks[:middle], batch_client, failures, retries)
+            __add_task_chunk(job_id, tasks[middle:], batch_client, failures, retries)
             return
+        raise
+
+    tasks_by_id = {task.id: task for task in tasks}
+    for task_result in result.value:
+        if task_result.status == batch_models.TaskAddStatus.success:
+            continue
+        if task_result.status == batch_models.TaskAddStatus.server_error and retries is not None:
+            retries.append(tasks_by_id[task_result.task_id])
+            continue
+        message = task_result.error.message.value if task_result.error and task_result.error.message else None
+        failures.append("{0}: {1}".format(task_result.task_id, message or task_result.status))
+
+
+"""
+    Containers created by this process, per storage account. A container deleted since, e.g. by another process,
+    is created again by in_container
+"""
+_created_containers = set()
+_created_containers_lock = threading.Lock()
+
+
+def ensure_container(container_name: str, blob_client):
+    """
+    Create the container unless this process already created it
+    """
+    key = (blob_client.account_name, container_name)
+    if key in _created_containers:
+        return
+    blob_client.create_container(container_name, fail_on_exist=False)
+    with _created_containers_lock:
+        _created_containers.add(key)
+
+
+def forget_container(container_name: str, blob_client):
+    """
+    Forget the container was created, to call when it is deleted
+    """
+    with _created_containers_lock:
+        _created_containers.discard((blob_client.account_name, container_name))
 
 
+def in_container(container_name: str, blob_client, func, *args, **kwargs):
+    """
+    Create the container unless this process already created it and return func(*args, **kwargs).
+    If the container was deleted since it was created, create it again and call func once more.
+    """
+    ensure_container(container_name, blob_client)
+    try:
+        return func(*args, **kwargs)
+    except azure.common.AzureMissingResourceHttpError as e:
+        if "ContainerNotFound" not in str(e):
+            raise
+        forget_container(container_name, blob_client)
+        ensure_container(container_name, blob_client)
+        return func(*args, **kwargs)
+
+
+@tracing.traced("upload text")
 def upload_text_to_container(container_name: str,
                              application_name: str,
                              content: str,
@@ -73,21 +251,14 @@ def upload_text_to_container(container_name: str,
                              blob_client=None) -> batch_models.ResourceFile:
     blob_name = file_path
     blob_path = application_name + '/' + blob_name  # + '/' + time_stamp + '/' + blob_name
-    blob_client.create_container(container_name, fail_on_exist=False)
-    blob_client.create_blob_from_text(container_name, blob_path, content)
+    in_container(container_name, blob_client, blob_client.create_blob_from_text, container_name, blob_path, content)
 
-    sas_token = blob_client.generate_blob_shared_access_signature(
-        container_name,
-        blob_path,
-        permission=blob.BlobPermissions.READ,
-        expiry=datetime.datetime.utcnow() + datetime.timedelta(days=365))
-
-    sas_url = blob_client.make_blob_url(
-        container_name, blob_path, sas_token=sas_token)
+    sas_url = sas.signed_blob_url(blob_client, container_name, blob_path, expiry_days=365)
 
     return batch_models.ResourceFile(file_path=blob_name, blob_source=sas_url)
 
 
+@tracing.traced("upload file")
 def upload_file_to_container(container_name,
                              application_name,
                              file_path,
@@ -116,22 +287,89 @@ def upload_file_to_container(container_name,
     if not node_path:
         node_path = blob_name
 
-    blob_client.create_container(container_name, fail_on_exist=False)
+    in_container(container_name, blob_client, upload_blob_resumable, container_name, blob_path, file_path, blob_client)
 
-    blob_client.create_blob_from_path(container_name, blob_path, file_path)
+    sas_url = sas.signed_blob_url(blob_client, container_name, blob_path, expiry_days=7)
 
-    sas_token = blob_client.generate_blob_shared_access_signature(
-        container_name,
-        blob_path,
-        permission=blob.BlobPermissions.READ,
-        expiry=datetime.datetime.utcnow() + datetime.timedelta(days=7))
+    return batch_models.ResourceFile(file_path=node_path, blob_source=sas_url)
 
-    sas_url = blob_client.make_blob_url(
-        container_name, blob_path, sas_token=sas_token)
 
-    return batch_models.ResourceFile(file_path=node_path, blob_source=sas_url)
+"""
+    Blocks of the interrupted uploads, to resume them
+"""
+upload_state_cache = cache.DiskCache("uploads", ttl=constants.RESUMABLE_UPLOAD_STATE_TTL)
+
+
+def __block_ids(file_path: str, block_count: int) -> List[str]:
+    """
+    Block ids identifying the file version, so blocks of another version of the file are never reused
+    """
+    stat = os.stat(file_path)
+    version = hashlib.sha256("{0}|{1}|{2}".format(
+        os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size).encode()).hexdigest()[:16]
+    return [base64.b64encode("{0}-{1:06d}".format(version, i).encode()).decode() for i in range(block_count)]
 
 
+@tracing.traced("upload blob")
+def upload_blob_resumable(container_name: str, blob_name: str, file_path: str, blob_client,
+                          max_connections: int = constants.BLOB_UPLOAD_MAX_CONNECTIONS, progress_callback=None):
+    """
+    Upload a local file to a block blob. Files larger than the single put size of the client are uploaded block
+    by block and the uploaded blocks are remembered, so when an upload is interrupted the next attempt only
+    uploads the missing blocks before committing the block list.
+    :param progress_callback: called with (uploaded bytes, total bytes)
+    """
+    size = os.path.getsize(file_path)
+    if size <= blob_client.MAX_SINGLE_PUT_SIZE:
+        blob_client.create_blob_from_path(container_name, blob_name, file_path,
+                                          max_connections=max_connections, progress_callback=progress_callback)
+        return
+
+    block_size = blob_client.MAX_BLOCK_SIZE
+    block_ids = __block_ids(file_path, (size + block_size - 1) // block_size)
+    key = (blob_client.account_name, container_name, blob_name, block_ids[0])
+    uploaded = set(upload_state_cache.get(key) or [])
+    if uploaded:
+        # Uncommitted blocks are discarded by the service when another block list is committed or after a week
+        try:
+            block_list = blob_client.get_block_list(container_name, blob_name,
+                                                    block_list_type=blob_models.BlockListType.Uncommitted)
+            uploaded &= {block.id for block in block_list.uncommitted_blocks}
+        except azure.common.AzureMissingResourceHttpError:
+            # the blob or its container was deleted since, start over
+            upload_state_cache.invalidate(key)
+            uploaded = set()
+    lock = threading.Lock()
+    progress = [min(len(uploaded) * block_size, size)]
+
+    def upload_block(index: int):
+        with open(file_path, "rb") as f:
+            f.seek(index * block_size)
+            block = f.read(block_size)
+        blob_client.put_block(container_name, blob_name, block, block_ids[index])
+        with lock:
+            uploaded.add(block_ids[index])
+            if len(uploaded) % constants.RESUMABLE_UPLOAD_STATE_SAVE_EVERY == 0:
+                upload_state_cache.set(key, sorted(uploaded))
+            progress[0] += len(block)
+            if progress_callback:
+                progress_callback(progress[0], size)
+
+    missing = [index for index, block_id in enumerate(block_ids) if block_id not in uploaded]
+    if missing:
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_connections, len(missing)))) as executor:
+                list(executor.map(tracing.propagate(upload_block), missing))
+        except BaseException:
+            # the executor waited for the other blocks, remember all of them for the next attempt
+            upload_state_cache.set(key, sorted(uploaded))
+            raise
+
+    blob_client.put_block_list(container_name, blob_name, [blob_models.BlobBlock(block_id) for block_id in block_ids])
+    upload_state_cache.invalidate(key)
+
+
+@tracing.traced("create pool")
 def create_pool_if_not_exist(pool, batch_client):
     """
     Creates the specified pool if it doesn't already exist
@@ -152,6 +390,28 @@ def create_pool_if_not_exist(pool, batch_client):
     return True
 
 
+def get_cluster_node_counts(pool_id: str, batch_client):
+    """
+    Count the nodes of a pool in each state.
+    Only the id, state and isDedicated fields of the nodes are transferred.
+    :param str pool_id: The id of the pool
+    :rtype: `aztk.models.NodeCounts`
+    """
+    nodes = batch_client.compute_node.list(
+        pool_id, batch_models.ComputeNodeListOptions(select="id,state,isDedicated"))
+    return aztk.models.NodeCounts.from_nodes(pool_id, nodes)
+
+
+def __get_start_task_failures(pool_id: str, batch_client):
+    """
+    Fetch the full node objects of the nodes whose start task failed, to diagnose the failure
+    :returns: dict of node id to start task failure info
+    """
+    nodes = batch_client.compute_node.list(
+        pool_id, batch_models.ComputeNodeListOptions(filter="state eq 'starttaskfailed'"))
+    return {node.id: node.start_task_info.failure_info if node.start_task_info else None for node in nodes}
+
+
 def wait_for_all_nodes_state(pool, node_state, batch_client):
     """
     Waits for all nodes in pool to reach any specified state in set
@@ -163,35 +423,60 @@ def wait_for_all_nodes_state(pool, node_state, batch_client):
     :rtype: list
     :return: list of `batchserviceclient.models.ComputeNode`
     """
-    while True:
+    pool_options = batch_models.PoolGetOptions(select="id,resizeErrors,targetDedicatedNodes,targetLowPriorityNodes")
+
+    def poll(_):
         # refresh pool to ensure that there is no resize error
-        pool = batch_client.pool.get(pool.id)
-        if pool.resize_errors is not None:
+        current_pool = batch_client.pool.get(pool.id, pool_options)
+        if current_pool.resize_errors is not None:
             raise RuntimeError(
                 'resize error encountered for pool {}: {!r}'.format(
-                    pool.id, pool.resize_errors))
-        nodes = list(batch_client.compute_node.list(pool.id))
+                    pool.id, current_pool.resize_errors))
+        counts = get_cluster_node_counts(pool.id, batch_client)
+        if counts.count(batch_models.ComputeNodeState.start_task_failed) and \
+                batch_models.ComputeNodeState.start_task_failed not in node_state:
+            raise RuntimeError(
+                'start task failed on nodes of pool {}: {!r}'.format(
+                    pool.id, __get_start_task_failures(pool.id, batch_client)))
+
+        total_nodes = current_pool.target_dedicated_nodes + current_pool.target_low_priority_nodes
+        return {pool.id: True if counts.total >= total_nodes and counts.count(*node_state) == counts.total else None}
+
+    Waiter([pool.id], poll).wait()
+    return list(batch_client.compute_node.list(pool.id))
 
-        totalNodes = pool.target_dedicated_nodes + pool.target_low_priority_nodes
-        if (len(nodes) >= totalNodes
-                and all(node.state in node_state for node in nodes)):
-            return nodes
-        time.sleep(1)
 
+node_agent_sku_cache = cache.DiskCache("node-agent-skus", ttl=constants.NODE_AGENT_SKU_CACHE_TTL)
 
+
+def invalidate_node_agent_sku_cache():
+    """
+    Forget all the cached VM image / node agent sku resolutions
+    """
+    node_agent_sku_cache.invalidate()
+
+
+@tracing.traced("select vm image and node agent sku")
 def select_latest_verified_vm_image_with_node_agent_sku(
-        publisher, offer, sku_starts_with, batch_client):
+        publisher, offer, sku_starts_with, batch_client, use_cache: bool = True):
     """
     Select the latest verified image that Azure Batch supports given
     a publisher, offer and sku (starts with filter).
+    The resolution is cached per account (see node_agent_sku_cache) as it rarely changes.
     :param batch_client: The batch client to use.
     :type batch_client: `batchserviceclient.BatchServiceClient`
     :param str publisher: vm image publisher
     :param str offer: vm image offer
     :param str sku_starts_with: vm sku starts with filter
+    :param bool use_cache: set to False to always ask the service
     :rtype: tuple
     :return: (node agent sku id to use, vm image ref to use)
     """
+    key = (batch_client.config.base_url, publisher.lower(), offer.lower(), sku_starts_with)
+    cached = node_agent_sku_cache.get(key) if use_cache else None
+    if cached:
+        return cached["node_agent_sku_id"], batch_models.ImageReference(**cached["image_reference"])
+
     # get verified vm image list and node agent sku ids from service
     node_agent_skus = batch_client.account.list_node_agent_skus()
 
@@ -206,9 +491,18 @@ def select_latest_verified_vm_image_with_node_agent_sku(
 
     # skus are listed in reverse order, pick first for latest
     sku_to_use, image_ref_to_use = skus_to_use[0]
+
+    node_agent_sku_cache.set(key, dict(
+        node_agent_sku_id=sku_to_use.id,
+        image_reference=dict(
+            publisher=image_ref_to_use.publisher,
+            offer=image_ref_to_use.offer,
+            sku=image_ref_to_use.sku,
+            version=image_ref_to_use.version)))
     return (sku_to_use.id, image_ref_to_use)
 
 
+@tracing.traced("create sas token")
 def create_sas_token(container_name,
                      blob_name,
                      permission,
@@ -257,9 +551,9 @@ def upload_blob_and_create_sas(container_name,
     :return: A SAS URL to the blob with the specified expiry time.
     :rtype: str
     """
-    blob_client.create_container(container_name, fail_on_exist=False)
+    ensure_container(container_name, blob_client)
 
-    blob_client.create_blob_from_path(container_name, blob_name, file_name)
+    upload_blob_resumable(container_name, blob_name, file_name, blob_client)
 
     sas_token = create_sas_token(
         container_name,
@@ -275,6 +569,22 @@ def upload_blob_and_create_sas(container_name,
     return sas_url
 
 
+def run_coroutine(coroutine):
+    """
+    Run a coroutine to completion on a private event loop.
+    Unlike get_event_loop().run_until_complete this works from worker threads
+    and does not touch an event loop the caller may already be running.
+    :param coroutine: the coroutine to run
+    :return: the result of the coroutine
+    """
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
 def wrap_commands_in_shell(commands):
     """
     Wrap commands in a shell
@@ -349,14 +659,24 @@ def read_stream_as_string(stream, encoding="utf-8"):
         :return: The file content.
         :rtype: str
     """
-    output = io.BytesIO()
-    try:
-        for data in stream:
-            output.write(data)
-        return output.getvalue().decode(encoding)
-    finally:
-        output.close()
-    raise RuntimeError('could not write data to stream or decode bytes')
+    return "".join(iter_decoded(stream, encoding))
+
+
+def iter_decoded(stream, encoding="utf-8", errors="strict"):
+    """
+        Decode a stream chunk by chunk, a character split between two chunks is decoded once complete
+        :param stream: input stream generator of bytes
+        :param str errors: how to handle invalid bytes, see codecs
+        :return: generator of the decoded chunks
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    for data in stream:
+        text = decoder.decode(data)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
 
 
 def format_batch_exception(batch_exception):
@@ -383,8 +703,7 @@ def save_cluster_config(cluster_config, blob_client):
     blob_path = "config.yaml"
     content = yaml.dump(cluster_config)
     container_name = cluster_config.cluster_id
-    blob_client.create_container(container_name, fail_on_exist=False)
-    blob_client.create_blob_from_text(container_name, blob_path, content)
+    in_container(container_name, blob_client, blob_client.create_blob_from_text, container_name, blob_path, content)
 
 
 def read_cluster_config(cluster_id: str, blob_client: blob.BlockBlobService):
@@ -0,0 +1,342 @@
+"""
+    Instrumentation of the Batch and Storage clients.
+    Every Batch operation and Storage method call is timed and every HTTP response is counted, so the cost of an
+    aztk operation can be inspected with Client.metrics() or exported with one of the exporters below.
+"""
+import bisect
+import functools
+import json
+import threading
+import time
+from msrest.paging import Paged
+from aztk.utils import constants, tracing
+
+THROTTLING_STATUS_CODES = (429, 503)
+
+# Storage methods that don't make any request
+BLOB_CLIENT_LOCAL_METHODS = ("extract_date_and_request_id", "retry", "set_proxy")
+
+
+class OperationStats:
+    """
+    Call count and latency histogram of one operation
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def observe(self, seconds: float, failed: bool = False):
+        self.count += 1
+        self.errors += 1 if failed else 0
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def to_dict(self):
+        cumulative = 0
+        histogram = {}
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.bucket_counts):
+            cumulative += count
+            histogram[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_seconds": self.total_seconds,
+            "max_seconds": self.max_seconds,
+            "histogram": histogram,
+        }
+
+
+class ServiceStats:
+    """
+    HTTP level counters of one service
+    """
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.status_codes = {}
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "status_codes": {str(status): count for status, count in sorted(self.status_codes.items())},
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread safe store of the metrics of the service calls.
+    :param parent: registry every measure is also recorded to
+    :param buckets: upper bounds in seconds of the latency histogram buckets
+    """
+    def __init__(self, parent=None, buckets=constants.METRICS_LATENCY_BUCKETS):
+        self.parent = parent
+        self.buckets = tuple(sorted(buckets))
+        self._operations = {}
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def _service(self, service: str) -> ServiceStats:
+        if service not in self._services:
+            self._services[service] = ServiceStats()
+        return self._services[service]
+
+    def observe_call(self, operation: str, seconds: float, failed: bool = False):
+        with self._lock:
+            if operation not in self._operations:
+                self._operations[operation] = OperationStats(self.buckets)
+            self._operations[operation].observe(seconds, failed)
+        if self.parent:
+            self.parent.observe_call(operation, seconds, failed)
+
+    def observe_response(self, service: str, status: int, bytes_sent: int = 0, bytes_received: int = 0,
+                         retries: int = 0, throttled: int = 0):
+        with self._lock:
+            stats = self._service(service)
+            stats.requests += 1
+            stats.retries += retries
+            stats.throttled += throttled + (1 if status in THROTTLING_STATUS_CODES else 0)
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            stats.status_codes[status] = stats.status_codes.get(status, 0) + 1
+        if self.parent:
+            self.parent.observe_response(service, status, bytes_sent, bytes_received, retries, throttled)
+
+    def observe_retry(self, service: str):
+        with self._lock:
+            self._service(service).retries += 1
+        if self.parent:
+            self.parent.observe_retry(service)
+
+    def snapshot(self) -> dict:
+        """
+        :returns: dict with the stats of every operation and service, safe to serialize to json
+        """
+        with self._lock:
+            return {
+                "operations": {name: stats.to_dict() for name, stats in sorted(self._operations.items())},
+                "services": {name: stats.to_dict() for name, stats in sorted(self._services.items())},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self._services.clear()
+
+
+"""
+    Registry of the whole process, every client records to it
+"""
+default_registry = MetricsRegistry()
+
+
+'''
+    Instrumentation
+'''
+_call_depth = threading.local()
+
+
+def _timed(method, operation: str, registry: MetricsRegistry):
+    """
+    Wrap a service method to time it, and trace it when tracing is enabled. Calls made by an instrumented method
+    to other instrumented methods are not recorded again. Paged results are recorded once per page, when the page
+    is fetched.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_call_depth, "value", 0)
+        if depth:
+            return method(*args, **kwargs)
+        _call_depth.value = 1
+        start = time.monotonic()
+        failed = True
+        try:
+            with tracing.span(operation):
+                result = method(*args, **kwargs)
+            failed = False
+        finally:
+            _call_depth.value = 0
+            if failed:
+                registry.observe_call(operation, time.monotonic() - start, failed)
+        if isinstance(result, Paged):
+            result._get_next = _timed(result._get_next, operation, registry)
+        else:
+            registry.observe_call(operation, time.monotonic() - start)
+        return result
+    return wrapper
+
+
+def _content_length(headers) -> int:
+    try:
+        return int(headers.get("Content-Length") or headers.get("content-length") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _body_length(body) -> int:
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    return 0
+
+
+def instrument_batch_client(batch_client, registry: MetricsRegistry):
+    """
+    Time every operation of a BatchServiceClient and count its HTTP responses
+    """
+    for group_name, group in list(vars(batch_client).items()):
+        if group_name.startswith("_") or not hasattr(group, "_client"):
+            continue
+        for name in dir(group):
+            method = getattr(group, name)
+            if name.startswith("_") or not callable(method):
+                continue
+            setattr(group, name, _timed(method, "batch.{0}.{1}".format(group_name, name), registry))
+
+    def response_hook(response, *_, **__):
+        # urllib3 keeps the responses it retried in the history of the retry object
+        history = getattr(getattr(response.raw, "retries", None), "history", None) or ()
+        registry.observe_response(
+            "batch",
+            response.status_code,
+            bytes_sent=_body_length(response.request.body),
+            bytes_received=_content_length(response.headers),
+            retries=len(history),
+            throttled=sum(1 for attempt in history if attempt.status in THROTTLING_STATUS_CODES))
+
+    batch_client.config.hooks.append(response_hook)
+    return batch_client
+
+
+def instrument_blob_client(blob_client, registry: MetricsRegistry):
+    """
+    Time every method of a storage BlobService and count its HTTP responses
+    """
+    for name in dir(blob_client):
+        method = getattr(blob_client, name)
+        if name.startswith("_") or name.startswith(("generate_", "make_")) or name in BLOB_CLIENT_LOCAL_METHODS \
+                or not callable(method):
+            continue
+        setattr(blob_client, name, _timed(method, "blob.{0}".format(name), registry))
+
+    sent = threading.local()
+
+    def request_callback(request):
+        sent.value = _body_length(request.body)
+
+    def response_callback(response):
+        registry.observe_response(
+            "blob",
+            response.status,
+            bytes_sent=getattr(sent, "value", 0),
+            bytes_received=_body_length(response.body) or _content_length(response.headers))
+
+    def retry_callback(_):
+        registry.observe_retry("blob")
+
+    blob_client.request_callback = request_callback
+    blob_client.response_callback = response_callback
+    blob_client.retry_callback = retry_callback
+    return blob_client
+
+
+'''
+    Exporters
+'''
+class JsonExporter:
+    def export(self, snapshot: dict) -> str:
+        return json.dumps(snapshot, indent=2, sort_keys=True)
+
+
+class PrometheusExporter:
+    """
+    Prometheus text exposition format
+    """
+    prefix = "aztk"
+
+    @staticmethod
+    def escape_label_value(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def export(self, snapshot: dict) -> str:
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append("# HELP {0}_{1} {2}".format(self.prefix, name, help_text))
+            lines.append("# TYPE {0}_{1} {2}".format(self.prefix, name, metric_type))
+            for suffix, labels, value in samples:
+                label_text = ",".join(
+                    '{0}="{1}"'.format(key, self.escape_label_value(value)) for key, value in labels)
+                lines.append("{0}_{1}{2}{{{3}}} {4}".format(self.prefix, name, suffix, label_text, value))
+
+        operations = snapshot["operations"]
+        histogram_samples = []
+        for operation, stats in operations.items():
+            for bound, count in stats["histogram"].items():
+                histogram_samples.append(("_bucket", [("operation", operation), ("le", bound)], count))
+            histogram_samples.append(("_sum", [("operation", operation)], stats["total_seconds"]))
+            histogram_samples.append(("_count", [("operation", operation)], stats["count"]))
+        metric("operation_duration_seconds", "histogram", "Duration of the service calls", histogram_samples)
+        metric("operation_errors_total", "counter", "Service calls that raised",
+               [("", [("operation", operation)], stats["errors"]) for operation, stats in operations.items()])
+
+        services = snapshot["services"]
+        for name, help_text in (("requests", "HTTP responses received"),
+                                ("retries", "Requests retried"),
+                                ("throttled", "Throttling responses received"),
+                                ("bytes_sent", "Bytes of request bodies sent"),
+                                ("bytes_received", "Bytes of response bodies received")):
+            metric(name + "_total", "counter", help_text,
+                   [("", [("service", service)], stats[name]) for service, stats in services.items()])
+        metric("responses_total", "counter", "HTTP responses received by status code", [
+            ("", [("service", service), ("code", code)], count)
+            for service, stats in services.items() for code, count in stats["status_codes"].items()])
+
+        return "\n".join(lines) + "\n"
+
+
+class TextExporter:
+    """
+    Human readable summary
+    """
+    def export(self, snapshot: dict) -> str:
+        print_format = '{:<46}| {:>6}| {:>6}| {:>10}| {:>10}'
+        lines = [print_format.format("Operation", "Calls", "Errors", "Total (s)", "Max (s)"), "-" * 86]
+        for operation, stats in snapshot["operations"].items():
+            lines.append(print_format.format(operation, stats["count"], stats["errors"],
+                                             "{:.3f}".format(stats["total_seconds"]),
+                                             "{:.3f}".format(stats["max_seconds"])))
+        lines.append("")
+        for service, stats in snapshot["services"].items():
+            lines.append("{0}: {1} requests, {2} retries, {3} throttled, {4} bytes sent, {5} bytes received".format(
+                service, stats["requests"], stats["retries"], stats["throttled"],
+                stats["bytes_sent"], stats["bytes_received"]))
+        return "\n".join(lines)
+
+
+exporters = {
+    "json": JsonExporter(),
+    "prometheus": PrometheusExporter(),
+    "text": TextExporter(),
+}
+
+
+def register_exporter(name: str, exporter):
+    """
+    Make an exporter available to export(). An exporter is any object with an export(snapshot) -> str method
+    """
+    exporters[name] = exporter
+
+
+def export(snapshot: dict, format: str = "json") -> str:
+    return exporters[format].export(snapshot)
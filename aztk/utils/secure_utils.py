@@ -1,10 +1,11 @@
-from Crypto.PublicKey import RSA
-from Crypto.Random import get_random_bytes
-from Crypto.Cipher import AES, PKCS1_OAEP
-
 def encrypt_password(ssh_pub_key, password):
     if not password:
         return [None, None, None, None]
+    # Imported here so commands that don't encrypt anything don't pay for loading Crypto
+    from Crypto.PublicKey import RSA
+    from Crypto.Random import get_random_bytes
+    from Crypto.Cipher import AES, PKCS1_OAEP
+
     recipient_key = RSA.import_key(ssh_pub_key)
     session_key = get_random_bytes(16)
 
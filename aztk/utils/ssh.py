@@ -5,94 +5,223 @@ import asyncio
 import io
 import os
 import select
+import socket
 import socketserver as SocketServer
 import sys
+import time
 from concurrent.futures import ThreadPoolExecutor
 
 import paramiko
 
-from . import helpers
+from aztk import models
+from . import constants, helpers
+
+
+def load_private_key(pkey):
+    """
+    Parse a private key once so it can be shared by the connections to many nodes
+    :param pkey: the private key as a string, an already parsed key or None
+    """
+    if pkey is None or isinstance(pkey, paramiko.PKey):
+        return pkey
+    return paramiko.RSAKey.from_private_key(file_obj=io.StringIO(pkey))
 
 
 def connect(hostname,
             port=22,
             username=None,
             password=None,
-            pkey=None):
-
-    client = paramiko.SSHClient()
-
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-    if pkey:
-        ssh_key = paramiko.RSAKey.from_private_key(file_obj=io.StringIO(pkey))
-    else:
-        ssh_key = None
-
-    client.connect(
-        hostname,
-        port=port,
-        username=username,
-        password=password,
-        pkey=ssh_key
-    )
-
-    return client
-
-
-def node_exec_command(command, container_name, username, hostname, port, ssh_key=None, password=None):
-    client = connect(hostname=hostname, port=port, username=username, password=password, pkey=ssh_key)
-    docker_exec = 'sudo docker exec 2>&1 -t {0} /bin/bash -c \'set -e; set -o pipefail; {1}; wait\''.format(container_name, command)
-    stdin, stdout, stderr = client.exec_command(docker_exec, get_pty=True)
-    [print(line.decode('utf-8')) for line in stdout.read().splitlines()]
-    client.close()
-
-
-async def clus_exec_command(command, container_name, username, nodes, ports=None, ssh_key=None, password=None):
-    await asyncio.wait(
-        [asyncio.get_event_loop().run_in_executor(ThreadPoolExecutor(),
-                                                  node_exec_command,
-                                                  command,
-                                                  container_name,
-                                                  username,
-                                                  node.ip_address,
-                                                  node.port,
-                                                  ssh_key,
-                                                  password) for node in nodes]
-    )
-
-
-def node_copy(container_name, source_path, destination_path, username, hostname, port, ssh_key=None, password=None):
-    client = connect(hostname=hostname, port=port, username=username, password=password, pkey=ssh_key)
-    sftp_client = client.open_sftp()
-
+            pkey=None,
+            timeout=None,
+            retries=0):
+    """
+    :param timeout: seconds to wait for the TCP connection, the SSH banner and the authentication
+    :param retries: number of times to retry when connecting fails for a reason other than authentication
+    """
+    ssh_key = load_private_key(pkey)
+
+    for attempt in range(retries + 1):
+        client = paramiko.SSHClient()
+
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+        try:
+            client.connect(
+                hostname,
+                port=port,
+                username=username,
+                password=password,
+                pkey=ssh_key,
+                timeout=timeout,
+                banner_timeout=timeout,
+                auth_timeout=timeout
+            )
+            return client
+        except paramiko.AuthenticationException:
+            client.close()
+            raise
+        except (OSError, EOFError, paramiko.SSHException):
+            client.close()
+            if attempt == retries:
+                raise
+            time.sleep(constants.SSH_CONNECT_RETRY_INTERVAL * 2 ** attempt)
+
+
+async def fan_out(func, nodes, max_concurrency: int = constants.SSH_MAX_CONCURRENCY):
+    """
+    Run func(node) for all the nodes on a single pool of at most max_concurrency threads, so no more than
+    max_concurrency SSH connections are open at once however large the cluster is
+    :returns: list of the results, or of the exceptions raised, in the order of the nodes
+    """
+    if not nodes:
+        return []
+    loop = asyncio.get_event_loop()
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(nodes))) as executor:
+        return await asyncio.gather(
+            *[loop.run_in_executor(executor, func, node) for node in nodes], return_exceptions=True)
+
+
+def __ssh_logs(nodes, results):
+    """
+    Turn the exceptions raised for the nodes which couldn't be reached into SSHLogs with the error
+    """
+    return [
+        models.SSHLog(output="", node_id=node_id, error=str(result) or type(result).__name__)
+        if isinstance(result, Exception) else result for (node_id, _), result in zip(nodes, results)
+    ]
+
+
+def __remaining(deadline):
+    """
+    Seconds left before the deadline, None when there is no deadline
+    """
+    return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+
+def __deadline(command_timeout):
+    return None if command_timeout is None else time.monotonic() + command_timeout
+
+
+def __exit_status(channel, deadline):
+    if not channel.status_event.wait(__remaining(deadline)):
+        raise socket.timeout()
+    return channel.recv_exit_status()
+
+
+def __timed_out(command_timeout):
+    return "Timed out after {0} seconds".format(command_timeout)
+
+
+def node_exec_command(command, container_name, username, hostname, port, ssh_key=None, password=None,
+                      timeout=constants.SSH_CONNECT_TIMEOUT, node_id=None, output_callback=None,
+                      command_timeout=constants.SSH_COMMAND_TIMEOUT):
+    """
+    Run a command in a container of a node, the output is read line by line as the command writes it
+    :param output_callback: function(node_id, line) called with every line of the output
+    :param command_timeout: seconds the command may run once connected, None to wait for it forever
+    :returns: aztk.models.SSHLog, with an error if the command timed out
+    """
+    start = time.monotonic()
+    client = connect(hostname=hostname, port=port, username=username, password=password, pkey=ssh_key,
+                     timeout=timeout, retries=constants.SSH_CONNECT_RETRIES)
+    deadline = __deadline(command_timeout)
+    output = []
     try:
-        # put the file in /tmp on the host
-        tmp_file = '/tmp/' + os.path.basename(source_path)
-        sftp_client.put(source_path, tmp_file)
-        # move to correct destination on container
-        docker_command = 'sudo docker cp {0} {1}:{2}'.format(tmp_file, container_name, destination_path)
-        _, stdout, _ = client.exec_command(docker_command, get_pty=True)
-        [print(line.decode('utf-8')) for line in stdout.read().splitlines()]
-        # clean up
-        sftp_client.remove(tmp_file)
-    except (IOError, PermissionError) as e:
-        print(e)
-
-    client.close()
-
+        docker_exec = 'sudo docker exec 2>&1 -t {0} /bin/bash -c \'set -e; set -o pipefail; {1}; wait\''.format(container_name, command)
+        channel = client.get_transport().open_session()
+        channel.get_pty()
+        channel.exec_command(docker_exec)
+        channel.settimeout(__remaining(deadline))
+        for line in channel.makefile("rb"):
+            line = line.decode("utf-8", errors="replace").rstrip("\r\n")
+            output.append(line)
+            if output_callback:
+                output_callback(node_id, line)
+            channel.settimeout(__remaining(deadline))
+        exit_code = __exit_status(channel, deadline)
+    except socket.timeout:
+        return models.SSHLog(output="\n".join(output), node_id=node_id, duration=time.monotonic() - start,
+                             error=__timed_out(command_timeout))
+    finally:
+        client.close()
+    return models.SSHLog(output="\n".join(output), node_id=node_id, exit_code=exit_code,
+                         duration=time.monotonic() - start)
+
+
+async def clus_exec_command(command, container_name, username, nodes, ports=None, ssh_key=None, password=None,
+                            max_concurrency: int = constants.SSH_MAX_CONCURRENCY,
+                            timeout=constants.SSH_CONNECT_TIMEOUT, output_callback=None,
+                            command_timeout=constants.SSH_COMMAND_TIMEOUT):
+    """
+    Run a command in a container of all the nodes
+    :param nodes: list of (node id, aztk.models.RemoteLogin)
+    :param output_callback: function(node_id, line) called with every line of the output of every node as it is
+        written, from many threads
+    :param command_timeout: seconds the command may run on a node once connected
+    :returns: list of aztk.models.SSHLog in the order of the nodes, nodes which couldn't be reached or where the
+        command timed out have an error
+    """
+    pkey = load_private_key(ssh_key)
+    results = await fan_out(
+        lambda node: node_exec_command(command, container_name, username, node[1].ip_address, node[1].port, pkey,
+                                       password, timeout, node[0], output_callback, command_timeout),
+        nodes,
+        max_concurrency)
+    return __ssh_logs(nodes, results)
+
+
+def node_copy(container_name, source_path, destination_path, username, hostname, port, ssh_key=None, password=None,
+              timeout=constants.SSH_CONNECT_TIMEOUT, node_id=None, command_timeout=constants.SSH_COMMAND_TIMEOUT):
+    """
+    Copy a file to a container of a node
+    :param command_timeout: seconds the copy may take once connected, None to wait for it forever
+    :returns: aztk.models.SSHLog with the output of docker cp, with an error if the copy timed out
+    """
+    start = time.monotonic()
+    client = connect(hostname=hostname, port=port, username=username, password=password, pkey=ssh_key,
+                     timeout=timeout, retries=constants.SSH_CONNECT_RETRIES)
+    deadline = __deadline(command_timeout)
+    try:
+        sftp_client = client.open_sftp()
+        try:
+            # put the file in /tmp on the host
+            tmp_file = '/tmp/' + os.path.basename(source_path)
+            sftp_client.get_channel().settimeout(__remaining(deadline))
+            sftp_client.put(source_path, tmp_file)
+            # move to correct destination on container
+            docker_command = 'sudo docker cp {0} {1}:{2}'.format(tmp_file, container_name, destination_path)
+            _, stdout, _ = client.exec_command(docker_command, get_pty=True, timeout=__remaining(deadline))
+            output = stdout.read().decode('utf-8', errors='replace')
+            exit_code = __exit_status(stdout.channel, deadline)
+            # clean up
+            sftp_client.get_channel().settimeout(__remaining(deadline))
+            sftp_client.remove(tmp_file)
+        finally:
+            sftp_client.close()
+    except socket.timeout:
+        return models.SSHLog(output="", node_id=node_id, duration=time.monotonic() - start,
+                             error=__timed_out(command_timeout))
+    finally:
+        client.close()
     #TODO: progress bar
-
-async def clus_copy(container_name, username, nodes, source_path, destination_path, ssh_key=None, password=None):
-    await asyncio.gather(
-        *[asyncio.get_event_loop().run_in_executor(ThreadPoolExecutor(),
-                                                   node_copy,
-                                                   container_name,
-                                                   source_path,
-                                                   destination_path,
-                                                   username,
-                                                   node.ip_address,
-                                                   node.port,
-                                                   ssh_key,
-                                                   password) for node in nodes
-        ])
+    return models.SSHLog(output=output.replace('\r\n', '\n').rstrip('\n'), node_id=node_id, exit_code=exit_code,
+                         duration=time.monotonic() - start)
+
+
+async def clus_copy(container_name, username, nodes, source_path, destination_path, ssh_key=None, password=None,
+                    max_concurrency: int = constants.SSH_MAX_CONCURRENCY, timeout=constants.SSH_CONNECT_TIMEOUT,
+                    command_timeout=constants.SSH_COMMAND_TIMEOUT):
+    """
+    Copy a file to a container of all the nodes
+    :param nodes: list of (node id, aztk.models.RemoteLogin)
+    :param command_timeout: seconds the copy may take on a node once connected
+    :returns: list of aztk.models.SSHLog in the order of the nodes, nodes which couldn't be reached or where the
+        copy timed out have an error
+    """
+    pkey = load_private_key(ssh_key)
+    results = await fan_out(
+        lambda node: node_copy(container_name, source_path, destination_path, username, node[1].ip_address,
+                               node[1].port, pkey, password, timeout, node[0], command_timeout),
+        nodes,
+        max_concurrency)
+    return __ssh_logs(nodes, results)
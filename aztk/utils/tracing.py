@@ -0,0 +1,185 @@
+"""
+    Lightweight tracing of the phases of an operation.
+    Spans are only recorded once tracing is enabled, otherwise span() and traced() cost a single check.
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Span:
+    """
+    A timed phase of an operation
+    """
+    __slots__ = ("name", "parent", "children", "attributes", "start", "end", "thread_id")
+
+    def __init__(self, name: str, parent=None, attributes: dict = None):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.attributes = attributes or {}
+        self.thread_id = threading.get_ident()
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class Tracer:
+    """
+    Record nested spans. The current span is tracked per thread, spans started by other threads are recorded as
+    children of the span given as parent or as new roots.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.roots = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.roots = []
+            self._origin = time.perf_counter()
+
+    @property
+    def current_span(self) -> Span:
+        return getattr(self._local, "span", None)
+
+    @contextlib.contextmanager
+    def activate(self, span: Span):
+        """
+        Make span the current span of this thread for the enclosed block
+        """
+        previous = self.current_span
+        self._local.span = span
+        try:
+            yield span
+        finally:
+            self._local.span = previous
+
+    @contextlib.contextmanager
+    def span(self, name: str, parent: Span = None, **attributes):
+        if not self.enabled:
+            yield None
+            return
+        parent = parent or self.current_span
+        span = Span(name, parent, attributes)
+        with self._lock:
+            (parent.children if parent else self.roots).append(span)
+        previous = self.current_span
+        self._local.span = span
+        try:
+            yield span
+        except Exception as e:
+            span.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            span.end = time.perf_counter()
+            self._local.span = previous
+
+    def format_tree(self) -> str:
+        """
+        :returns: the recorded spans as an indented tree with their wall time
+        """
+        lines = []
+
+        def add(span, depth):
+            attributes = " ".join("{0}={1}".format(key, value) for key, value in sorted(span.attributes.items()))
+            lines.append("{0:>10.3f}s  {1}{2}{3}".format(
+                span.duration, "  " * depth, span.name, "  [" + attributes + "]" if attributes else ""))
+            for child in sorted(span.children, key=lambda child: child.start):
+                add(child, depth + 1)
+
+        for root in self.roots:
+            add(root, 0)
+        return "\n".join(lines)
+
+    def to_chrome_trace(self) -> dict:
+        """
+        :returns: the recorded spans in the Chrome trace event format, to open in chrome://tracing or Perfetto
+        """
+        events = []
+        pid = os.getpid()
+
+        def add(span):
+            events.append({
+                "name": span.name,
+                "ph": "X",
+                "ts": (span.start - self._origin) * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {key: str(value) for key, value in span.attributes.items()},
+            })
+            for child in span.children:
+                add(child)
+
+        for root in self.roots:
+            add(root)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str):
+        with open(path, "w", encoding="UTF-8") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+"""
+    Tracer of the whole process
+"""
+tracer = Tracer()
+
+
+def span(name: str, parent: Span = None, **attributes):
+    """
+    Context manager timing the enclosed block as a child of the current span
+    """
+    return tracer.span(name, parent, **attributes)
+
+
+def traced(name: str = None):
+    """
+    Decorator timing every call of the function as a span
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span() -> Span:
+    return tracer.current_span
+
+
+def propagate(func):
+    """
+    Bind func to the current span so the spans it starts from another thread, e.g. in a ThreadPoolExecutor,
+    are nested under the span of the caller
+    """
+    parent = tracer.current_span
+    if parent is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with tracer.activate(parent):
+            return func(*args, **kwargs)
+    return wrapper
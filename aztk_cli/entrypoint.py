@@ -31,12 +31,20 @@ def main():
 
     parse_common_args(args)
 
+    if args.profile:
+        aztk.utils.tracing.tracer.enable()
+
     try:
         run_software(args)
     except batch_error.BatchErrorException as e:
         utils.print_batch_exception(e)
     except aztk.error.AztkError as e:
         log.error(str(e))
+    finally:
+        if args.profile:
+            utils.print_profile(args.profile)
+        if args.metrics:
+            utils.print_metrics(args.metrics_format)
 
 
 def setup_common_args(parser: argparse.ArgumentParser):
@@ -44,6 +52,13 @@ def setup_common_args(parser: argparse.ArgumentParser):
                         version=aztk.version.__version__)
     parser.add_argument("--verbose", action='store_true',
                         help="Enable verbose logging.")
+    parser.add_argument("--profile", metavar="<file>",
+                        help="Trace the phases of the command, print them as a tree and "
+                             "write them to <file> in the Chrome trace event format.")
+    parser.add_argument("--metrics", action='store_true',
+                        help="Print the Batch and Storage calls made by the command once it is done.")
+    parser.add_argument("--metrics-format", default="text", choices=sorted(aztk.utils.metrics.exporters),
+                        help="Format of the metrics printed by --metrics. Defaults to text.")
 
 
 def parse_common_args(args: NamedTuple):
@@ -1,8 +1,9 @@
 import argparse
+import sys
 import typing
 import aztk
 
-from aztk_cli import utils, config
+from aztk_cli import config, log, utils
 
 def setup_parser(parser: argparse.ArgumentParser):
     parser.add_argument('--id',
@@ -10,18 +11,47 @@ def setup_parser(parser: argparse.ArgumentParser):
                         required=True,
                         help='The unique id of your spark cluster')
     parser.add_argument('--name',
-                        dest='app_name',
-                        required=True,
-                        help='The unique id of your job name')
+                        dest='app_names',
+                        action='append',
+                        help='The unique id of your job name. With --tail it can be given many times, \
+                              or omitted to follow all the applications of the cluster')
+
+    parser.add_argument('--all', dest='all', action='store_true',
+                        help='Download the logs of all the applications of the cluster to the --output directory')
 
     parser.add_argument('--tail', dest='tail', action='store_true')
+    parser.add_argument('--output', dest='output', required=False,
+                        help='Path of the file to write the log to instead of the console, \
+                              or of the directory to download the logs to with --all')
+    parser.add_argument('--tail-bytes', dest='tail_bytes', type=int, required=False,
+                        help='Only get the last TAIL_BYTES bytes of the log, can\'t be used with --tail or --all')
 
 
 def execute(args: typing.NamedTuple):
+    if args.tail_bytes is not None and (args.tail or args.all):
+        raise aztk.error.AztkError("--tail-bytes can't be used with --tail or --all")
+
     spark_client = aztk.spark.Client(config.load_aztk_secrets())
 
-    if args.tail:
-        utils.stream_logs(client=spark_client, cluster_id=args.cluster_id, application_name=args.app_name)
-    else:
-        app_logs = spark_client.get_application_log(cluster_id=args.cluster_id, application_name=args.app_name)
-        print(app_logs.log)
+    if args.all:
+        logs = spark_client.get_all_application_logs(args.cluster_id, args.output or ".")
+        log.info("Downloaded the logs of %d applications to %s", len(logs), args.output or ".")
+        return
+
+    if not args.tail and (not args.app_names or len(args.app_names) > 1):
+        raise aztk.error.AztkError(
+            "Give a single --name, use --tail to follow many applications or --all to download all their logs")
+
+    output = open(args.output, "w", encoding="UTF-8") if args.output else sys.stdout
+    try:
+        if args.tail:
+            utils.stream_logs(client=spark_client, cluster_id=args.cluster_id, application_names=args.app_names,
+                              output=output)
+        else:
+            for chunk in spark_client.stream_application_log(
+                    cluster_id=args.cluster_id, application_name=args.app_names[0], tail_bytes=args.tail_bytes):
+                output.write(chunk)
+            output.flush()
+    finally:
+        if args.output:
+            output.close()
@@ -1,7 +1,8 @@
 import argparse
+import sys
 import typing
 import aztk.spark
-from aztk_cli import config
+from aztk_cli import config, utils
 
 
 def setup_parser(parser: argparse.ArgumentParser):
@@ -15,12 +16,20 @@ def setup_parser(parser: argparse.ArgumentParser):
                         help='the path the file will be copied to on each node in the cluster.'\
                              'Note that this must include the file name.')
 
+    parser.add_argument('--max-concurrency', dest='max_concurrency', type=int,
+                        default=aztk.utils.constants.SSH_MAX_CONCURRENCY,
+                        help='The maximum number of nodes connected to at the same time')
+
 
 def execute(args: typing.NamedTuple):
     spark_client = aztk.spark.Client(config.load_aztk_secrets())
 
-    spark_client.cluster_copy(
+    results = spark_client.cluster_copy(
         cluster_id=args.cluster_id,
         source_path=args.source_path,
-        destination_path=args.dest_path
+        destination_path=args.dest_path,
+        max_concurrency=args.max_concurrency
     )
+    utils.print_node_results_summary(results, "File copied")
+    if any(result.failed for result in results):
+        sys.exit(1)
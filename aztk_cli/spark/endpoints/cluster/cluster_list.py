@@ -11,5 +11,5 @@ def setup_parser(_: argparse.ArgumentParser):
 
 def execute(_: typing.NamedTuple):
     spark_client = aztk.spark.Client(config.load_aztk_secrets())
-    clusters = spark_client.list_clusters()
+    clusters = spark_client.list_clusters(with_node_counts=True)
     utils.print_clusters(clusters)
@@ -1,4 +1,5 @@
 import argparse
+import sys
 import typing
 import aztk.spark
 from aztk_cli import utils, config
@@ -10,8 +11,14 @@ def setup_parser(parser: argparse.ArgumentParser):
                         help='The unique id of your spark cluster')
     parser.add_argument('command',
                         help='The command to run on your spark cluster')
+    parser.add_argument('--max-concurrency', dest='max_concurrency', type=int,
+                        default=aztk.utils.constants.SSH_MAX_CONCURRENCY,
+                        help='The maximum number of nodes connected to at the same time')
 
 def execute(args: typing.NamedTuple):
     spark_client = aztk.spark.Client(config.load_aztk_secrets())
-    result = spark_client.cluster_run(args.cluster_id, args.command)
-    #TODO: pretty print result
+    results = spark_client.cluster_run(args.cluster_id, args.command, max_concurrency=args.max_concurrency,
+                                       output_callback=utils.node_output_printer())
+    utils.print_node_results_summary(results, "Command run")
+    if any(result.failed for result in results):
+        sys.exit(1)
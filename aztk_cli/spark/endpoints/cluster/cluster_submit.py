@@ -136,8 +136,9 @@ def execute(args: typing.NamedTuple):
             executor_cores=args.executor_cores,
             max_retry_count=args.max_retry_count
         ),
-        wait=False
+        wait=False,
+        progress_callback=utils.upload_progress()
     )
 
     if args.wait:
-        utils.stream_logs(client=spark_client, cluster_id=args.cluster_id, application_name=args.name)
+        utils.stream_logs(client=spark_client, cluster_id=args.cluster_id, application_names=[args.name])
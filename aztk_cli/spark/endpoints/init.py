@@ -1,7 +1,6 @@
 import os
 import argparse
 import typing
-from distutils.dir_util import copy_tree
 import aztk.utils.constants as constants
 
 
@@ -34,6 +33,7 @@ def create_directory(dest_path: str, docker_repo: str):
     config_src_path = constants.INIT_DIRECTORY_SOURCE
     config_dest_path = dest_path
 
+    from distutils.dir_util import copy_tree
     copy_tree(config_src_path, config_dest_path, update=1)
 
     secrets_template_path = os.path.join(dest_path, 'secrets.yaml.template')
@@ -1,7 +1,7 @@
 import argparse
 import typing
 import aztk.spark
-from aztk_cli import utils, config
+from aztk_cli import config, log, utils
 
 def setup_parser(parser: argparse.ArgumentParser):
     parser.add_argument('--id',
@@ -9,12 +9,32 @@ def setup_parser(parser: argparse.ArgumentParser):
                         required=True,
                         help='The unique id of your AZTK job')
     parser.add_argument('--name',
-                        dest='app_name',
-                        required=True,
-                        help='The unique id of your job name')
+                        dest='app_names',
+                        action='append',
+                        help='The unique id of your job name. With --tail it can be given many times, \
+                              or omitted to follow all the applications of the job')
+    parser.add_argument('--all', dest='all', action='store_true',
+                        help='Download the logs of all the applications of the job to the --output directory')
+    parser.add_argument('--output', dest='output', required=False,
+                        help='Path of the directory to download the logs to with --all')
+    parser.add_argument('--tail', dest='tail', action='store_true',
+                        help='Print the logs as they are written until the applications completed')
 
 
 def execute(args: typing.NamedTuple):
     spark_client = aztk.spark.Client(config.load_aztk_secrets())
-    app_logs = spark_client.get_job_application_log(args.job_id, args.app_name)
+
+    if args.all:
+        logs = spark_client.get_all_job_application_logs(args.job_id, args.output or ".")
+        log.info("Downloaded the logs of %d applications to %s", len(logs), args.output or ".")
+        return
+
+    if args.tail:
+        utils.stream_logs(client=spark_client, cluster_id=args.job_id, application_names=args.app_names, job=True)
+        return
+
+    if not args.app_names or len(args.app_names) > 1:
+        raise aztk.error.AztkError(
+            "Give a single --name, use --tail to follow many applications or --all to download all their logs")
+    app_logs = spark_client.get_job_application_log(args.job_id, args.app_names[0])
     print(app_logs.log)
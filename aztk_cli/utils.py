@@ -7,7 +7,7 @@ from subprocess import call
 from typing import List
 import azure.batch.models as batch_models
 from aztk import error, utils
-from aztk.utils import get_ssh_key, helpers
+from aztk.utils import get_ssh_key, helpers, metrics, tracing
 from aztk.models import ClusterConfiguration
 from aztk.spark import models
 from . import log
@@ -53,13 +53,14 @@ def print_cluster(client, cluster: models.Cluster):
 
     if not cluster.nodes:
         return
+    remote_login_settings = client.get_remote_login_settings_for_cluster(cluster.id)
     for node in cluster.nodes:
-        remote_login_settings = client.get_remote_login_settings(cluster.id, node.id)
+        node_login_settings = remote_login_settings.get(node.id)
         log.info(
             print_format.format(
                 node.id,
                 node.state.value,
-                '{}:{}'.format(remote_login_settings.ip_address, remote_login_settings.port),
+                '{}:{}'.format(node_login_settings.ip_address, node_login_settings.port) if node_login_settings else '-',
                 "*" if node.is_dedicated else '',
                 '*' if node.id == cluster.master_node_id else '')
         )
@@ -94,36 +95,55 @@ def __pretty_low_pri_node_count(cluster: models.Cluster)-> str:
         return '{}'.format(cluster.current_low_pri_nodes)
 
 def print_clusters(clusters: List[models.Cluster]):
-    print_format = '{:<34}| {:<10}| {:<20}| {:<7}'
-    print_format_underline = '{:-<34}|{:-<11}|{:-<21}|{:-<7}'
+    print_format = '{:<34}| {:<10}| {:<20}| {:<7}| {:<5}| {:<8}| {:<9}| {:<7}'
+    print_format_underline = '{:-<34}|{:-<11}|{:-<21}|{:-<8}|{:-<6}|{:-<9}|{:-<10}|{:-<7}'
 
-    log.info(print_format.format('Cluster', 'State', 'VM Size', 'Nodes'))
-    log.info(print_format_underline.format('', '', '', ''))
+    log.info(print_format.format('Cluster', 'State', 'VM Size', 'Nodes', 'Idle', 'Running', 'Starting', 'Failed'))
+    log.info(print_format_underline.format('', '', '', '', '', '', '', ''))
     for cluster in clusters:
         node_count = __pretty_node_count(cluster)
+        counts = cluster.node_counts
 
         log.info(
             print_format.format(
                 cluster.id,
                 cluster.visible_state,
                 cluster.vm_size,
-                node_count
+                node_count,
+                counts.idle if counts else '-',
+                counts.running if counts else '-',
+                counts.starting if counts else '-',
+                counts.failed if counts else '-',
             )
         )
 
-def stream_logs(client, cluster_id, application_name):
-    current_bytes = 0
-    while True:
-        app_logs = client.get_application_log(
-            cluster_id=cluster_id,
-            application_name=application_name,
-            tail=True,
-            current_bytes=current_bytes)
-        print(app_logs.log, end="")
-        if app_logs.application_state == 'completed':
-            break
-        current_bytes = app_logs.total_bytes
-        time.sleep(3)
+def stream_logs(client, cluster_id, application_names=None, output=None, job: bool = False):
+    """
+    Print the logs of the applications of a cluster or job as they are written until they all completed.
+    When following more than one application the lines of their logs are interleaved, each prefixed with the name
+    of its application.
+    :param application_names: applications to follow, None to follow all the applications
+    """
+    if job:
+        logs = client.follow_job_application_logs(cluster_id, application_names)
+    else:
+        logs = client.follow_application_logs(cluster_id, application_names)
+
+    if application_names and len(application_names) == 1:
+        for _, text in logs:
+            print(text, end="", file=output, flush=True)
+        return
+
+    partial_lines = {}
+    for application_name, text in logs:
+        lines = (partial_lines.pop(application_name, "") + text).split("\n")
+        if lines[-1]:
+            partial_lines[application_name] = lines[-1]
+        for line in lines[:-1]:
+            print("[{0}] {1}".format(application_name, line), file=output)
+        (output or sys.stdout).flush()
+    for application_name, line in partial_lines.items():
+        print("[{0}] {1}".format(application_name, line), file=output, flush=True)
 
 def ssh_in_master(
         client,
@@ -271,9 +291,7 @@ def print_job(client, job: models.Job):
 def node_state_count(cluster: models.Cluster):
     states = {}
     for state in batch_models.ComputeNodeState:
-        states[state] = 0
-    for node in cluster.nodes:
-        states[node.state] += 1
+        states[state] = len(cluster.nodes_by_state.get(state, []))
     return states
 
 
@@ -430,3 +448,68 @@ def print_cluster_conf(cluster_conf: ClusterConfiguration, wait: bool):
 def log_property(label: str, value: str):
     label += ":"
     log.info("{0:30} {1}".format(label, value))
+
+
+def upload_progress(step: int = 10):
+    """
+    progress_callback logging the progress of uploads every step percents
+    """
+    reported = [-step]
+
+    def callback(uploaded: int, total: int):
+        percent = 100 * uploaded // total if total else 100
+        if percent - reported[0] >= step:
+            reported[0] = percent - percent % step
+            log.info("Uploading files: %3d%% (%.1f/%.1f MB)", percent, uploaded / 2**20, total / 2**20)
+    return callback
+
+
+def node_output_printer():
+    """
+    output_callback of cluster_run printing every line prefixed with the id of its node
+    """
+    lock = threading.Lock()
+
+    def callback(node_id: str, line: str):
+        with lock:
+            print("[{0}] {1}".format(node_id, line), flush=True)
+    return callback
+
+
+def print_node_results_summary(results, action: str):
+    """
+    Print how many nodes an action succeeded on and a table of the nodes it failed on
+    :param results: list of aztk.models.SSHLog
+    :param action: what was done on the nodes, e.g. "Command run"
+    """
+    failed = [result for result in results if result.failed]
+    log.info("")
+    log.info("%s on %d nodes: %d succeeded, %d failed", action, len(results), len(results) - len(failed), len(failed))
+    if not failed:
+        return
+
+    print_format = '{:<36}| {:^9} | {:>9} | {}'
+    print_format_underline = '{:-<36}|{:-<11}|{:-<11}|{:-<20}'
+    log.info(print_format.format("Failed nodes", "Exit Code", "Duration", "Error"))
+    log.info(print_format_underline.format('', '', '', ''))
+    for result in sorted(failed, key=lambda result: result.node_id):
+        log.info(
+            print_format.format(
+                result.node_id,
+                result.exit_code if result.exit_code is not None else "-",
+                "{0:.1f}s".format(result.duration) if result.duration is not None else "-",
+                result.error or ""
+            )
+        )
+
+
+def print_metrics(format: str = "text"):
+    log.info("")
+    log.info(metrics.export(metrics.default_registry.snapshot(), format))
+
+
+def print_profile(path: str):
+    log.info("")
+    log.info(tracing.tracer.format_tree())
+    tracing.tracer.write_chrome_trace(path)
+    log.info("Trace written to %s, open it in chrome://tracing", path)
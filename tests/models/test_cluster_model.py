@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+import azure.batch.models as batch_models
+import aztk.spark
+from aztk.models import Cluster, Node
+
+
+def make_pool(master_node_id=None):
+    return SimpleNamespace(
+        id="cluster",
+        vm_size="standard_a2",
+        state=batch_models.PoolState.active,
+        allocation_state=batch_models.AllocationState.steady,
+        current_dedicated_nodes=2,
+        current_low_priority_nodes=1,
+        target_dedicated_nodes=2,
+        target_low_priority_nodes=1,
+        metadata=[SimpleNamespace(name="_spark_master_node", value=master_node_id)] if master_node_id else None)
+
+
+def make_nodes():
+    states = [batch_models.ComputeNodeState.idle, batch_models.ComputeNodeState.running,
+              batch_models.ComputeNodeState.idle]
+    for i, state in enumerate(states):
+        yield SimpleNamespace(id="node-{0}".format(i), state=state, ip_address="10.0.0.{0}".format(i),
+                              is_dedicated=i < 2, affinity_id="affinity-{0}".format(i))
+
+
+def test_nodes_can_be_iterated_more_than_once():
+    cluster = Cluster(make_pool(), make_nodes())
+    assert [node.id for node in cluster.nodes] == ["node-0", "node-1", "node-2"]
+    assert [node.id for node in cluster.nodes] == ["node-0", "node-1", "node-2"]
+    assert all(isinstance(node, Node) for node in cluster.nodes)
+
+
+def test_node_indexes():
+    cluster = aztk.spark.models.Cluster(make_pool(master_node_id="node-1"), make_nodes())
+    assert cluster.get_node("node-2").ip == "10.0.0.2"
+    assert cluster.get_node("node-2").ip_address == "10.0.0.2"
+    assert cluster.get_node("missing") is None
+    assert len(cluster.nodes_by_state[batch_models.ComputeNodeState.idle]) == 2
+    assert cluster.master_node.affinity_id == "affinity-1"
+    assert cluster.dedicated_node_count == 2
+    assert cluster.low_pri_node_count == 1
+
+
+def test_cluster_without_nodes():
+    cluster = Cluster(make_pool())
+    assert cluster.nodes == []
+    assert cluster.master_node is None
+
+
+def test_node_has_no_dict():
+    assert not hasattr(Node("node"), "__dict__")
+
+
+def test_node_counts_from_nodes():
+    from aztk.models import NodeCounts
+    nodes = list(make_nodes()) + [
+        SimpleNamespace(id="node-3", state=batch_models.ComputeNodeState.start_task_failed, is_dedicated=False),
+        SimpleNamespace(id="node-4", state=batch_models.ComputeNodeState.waiting_for_start_task, is_dedicated=True),
+    ]
+    counts = NodeCounts.from_nodes("cluster", nodes)
+    assert (counts.idle, counts.running, counts.starting, counts.failed, counts.total) == (2, 1, 1, 1, 5)
+    assert counts.dedicated[batch_models.ComputeNodeState.idle] == 1
+    assert counts.low_priority[batch_models.ComputeNodeState.idle] == 1
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+import time
+import aztk.spark
+from aztk.spark import async_client
+
+
+class FakeClient:
+    def __init__(self, secrets_config):
+        self.batch_client = None
+        self.blob_client = None
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def get_cluster(self, cluster_id):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return cluster_id
+
+
+def test_async_client_is_exported():
+    assert aztk.spark.AsyncClient is async_client.AsyncClient
+
+
+def test_concurrency_is_bounded(monkeypatch):
+    monkeypatch.setattr(async_client, "Client", FakeClient)
+    client = async_client.AsyncClient(None, max_concurrency=4)
+
+    async def get_all():
+        return await asyncio.gather(*[client.get_cluster("cluster-{}".format(i)) for i in range(20)])
+
+    loop = asyncio.new_event_loop()
+    try:
+        clusters = loop.run_until_complete(get_all())
+    finally:
+        loop.close()
+        client.close()
+
+    assert clusters == ["cluster-{}".format(i) for i in range(20)]
+    assert client.client.max_running == 4
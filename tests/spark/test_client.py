@@ -0,0 +1,160 @@
+import threading
+import time
+from types import SimpleNamespace
+import aztk.spark
+from aztk.internal.cache import TTLCache
+from aztk.error import AztkError
+
+
+def make_client():
+    # Skip __init__, it would build real Batch and Storage clients
+    return aztk.spark.Client.__new__(aztk.spark.Client)
+
+
+def test_create_clusters_in_parallel_isolates_failures():
+    client = make_client()
+
+    def create_cluster(cluster_conf, wait=False):
+        if cluster_conf.cluster_id == "bad":
+            raise AztkError("cannot create")
+        return cluster_conf.cluster_id
+
+    client.create_cluster = create_cluster
+    confs = [aztk.spark.models.ClusterConfiguration(cluster_id=cluster_id) for cluster_id in ["a", "bad", "c"]]
+
+    results = client.create_clusters_in_parallel(confs)
+
+    assert [result.cluster_id for result in results] == ["a", "bad", "c"]
+    assert [result.succeeded for result in results] == [True, False, True]
+    assert results[0].cluster == "a"
+    assert isinstance(results[1].error, AztkError)
+
+
+def test_create_clusters_in_parallel_is_bounded():
+    client = make_client()
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def create_cluster(cluster_conf, wait=False):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    client.create_cluster = create_cluster
+    confs = [aztk.spark.models.ClusterConfiguration(cluster_id=str(i)) for i in range(12)]
+
+    results = client.create_clusters_in_parallel(confs, max_workers=3)
+
+    assert all(result.succeeded for result in results)
+    assert running[1] == 3
+
+
+class FakeComputeNodes:
+    def __init__(self, node_ids):
+        self.node_ids = node_ids
+        self.calls = 0
+
+    def list(self, pool_id, options=None):
+        return [SimpleNamespace(id=node_id) for node_id in self.node_ids]
+
+    def get_remote_login_settings(self, pool_id, node_id):
+        self.calls += 1
+        return SimpleNamespace(remote_login_ip_address="10.0.0.1", remote_login_port=int(node_id))
+
+
+def test_remote_login_settings_for_cluster_are_fetched_once():
+    client = make_client()
+    client._remote_login_settings_cache = TTLCache(ttl=60)
+    compute_nodes = FakeComputeNodes([str(port) for port in range(50000, 50020)])
+    client.batch_client = SimpleNamespace(compute_node=compute_nodes)
+
+    settings = client.get_remote_login_settings_for_cluster("cluster")
+    assert client.get_remote_login_settings_for_cluster("cluster") is settings
+
+    assert compute_nodes.calls == 20
+    assert settings["50003"].ip_address == "10.0.0.1"
+    assert settings["50003"].port == "50003"
+
+
+def test_submit_all_applications_resolves_master_once(monkeypatch):
+    from aztk.spark.helpers import submit
+    client = make_client()
+    added = []
+    calls = {"get_cluster": 0}
+
+    def get_cluster(cluster_id):
+        calls["get_cluster"] += 1
+        return SimpleNamespace(master_node_id="master")
+
+    client.get_cluster = get_cluster
+    client.batch_client = SimpleNamespace(
+        compute_node=SimpleNamespace(get=lambda **kwargs: SimpleNamespace(affinity_id="affinity")))
+    client.blob_client = None
+    monkeypatch.setattr(submit.artifacts, "ArtifactStore",
+                        lambda blob_client: SimpleNamespace(upload_all=lambda paths, progress_callback: []))
+    monkeypatch.setattr(submit, "generate_task",
+                        lambda spark_client, cluster_id, application: SimpleNamespace(id=application.name))
+    monkeypatch.setattr(submit.helpers, "add_task_collection",
+                        lambda job_id, tasks, batch_client: added.extend(tasks))
+
+    applications = [aztk.spark.models.ApplicationConfiguration(name=str(i)) for i in range(20)]
+    client.submit_all_applications("cluster", applications)
+
+    assert calls["get_cluster"] == 1
+    assert sorted(task.id for task in added) == sorted(str(i) for i in range(20))
+    assert all(task.affinity_info.affinity_id == "affinity" for task in added)
+
+
+def test_list_clusters_with_node_counts():
+    import azure.batch.models as batch_models
+    client = make_client()
+    metadata = [SimpleNamespace(name="_aztk_software", value="spark"),
+                SimpleNamespace(name="_aztk_mode", value="cluster")]
+    pools = [SimpleNamespace(id=pool_id, vm_size="standard_a2", metadata=metadata,
+                             state=batch_models.PoolState.active,
+                             allocation_state=batch_models.AllocationState.steady,
+                             current_dedicated_nodes=2, current_low_priority_nodes=0,
+                             target_dedicated_nodes=2, target_low_priority_nodes=0)
+             for pool_id in ["a", "b"]]
+    states = {"a": [batch_models.ComputeNodeState.idle, batch_models.ComputeNodeState.running],
+              "b": [batch_models.ComputeNodeState.start_task_failed, batch_models.ComputeNodeState.starting]}
+    listed = []
+
+    def list_nodes(pool_id, options=None):
+        listed.append(options.select)
+        return [SimpleNamespace(id=str(i), state=state, is_dedicated=True) for i, state in enumerate(states[pool_id])]
+
+    client.batch_client = SimpleNamespace(pool=SimpleNamespace(list=lambda: pools),
+                                          compute_node=SimpleNamespace(list=list_nodes))
+
+    clusters = client.list_clusters(with_node_counts=True)
+
+    assert [(cluster.node_counts.idle, cluster.node_counts.running) for cluster in clusters] == [(1, 1), (0, 0)]
+    assert [(cluster.node_counts.starting, cluster.node_counts.failed) for cluster in clusters] == [(0, 0), (1, 1)]
+    assert listed == ["id,state,isDedicated"] * 2
+
+
+def test_poll_masters_lists_only_the_polled_pools():
+    import azure.batch.models as batch_models
+    from aztk.spark.utils import util
+    listed = []
+
+    def list_pools(options):
+        listed.append(options)
+        metadata = [batch_models.MetadataItem(name=aztk.utils.constants.MASTER_NODE_METADATA_KEY, value="master")]
+        return [SimpleNamespace(id="a", metadata=metadata), SimpleNamespace(id="b", metadata=None)]
+
+    client = SimpleNamespace(batch_client=SimpleNamespace(
+        pool=SimpleNamespace(list=list_pools),
+        compute_node=SimpleNamespace(
+            get=lambda *_: SimpleNamespace(state=batch_models.ComputeNodeState.idle))))
+
+    results = util.poll_masters(client, ["a", "b", "missing"])
+
+    assert [options.filter for options in listed] == ["id eq 'a' or id eq 'b' or id eq 'missing'"]
+    assert results["a"] is True
+    assert results["b"] is None
+    assert isinstance(results["missing"], AztkError)
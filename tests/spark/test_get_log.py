@@ -0,0 +1,176 @@
+from types import SimpleNamespace
+import pytest
+import azure.batch.models as batch_models
+from aztk import error
+from aztk.spark.helpers import get_log
+
+
+class FakeBlobClient:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.downloaded = 0
+
+    def get_blob_properties(self, container_name, blob_name):
+        return SimpleNamespace(properties=SimpleNamespace(content_length=len(self.content)))
+
+    def get_blob_to_bytes(self, container_name, blob_name, start_range=None):
+        self.downloaded += len(self.content) - start_range
+        return SimpleNamespace(content=self.content[start_range:])
+
+
+def test_log_from_storage_only_downloads_new_bytes():
+    task = SimpleNamespace(state=batch_models.TaskState.running, execution_info=SimpleNamespace(exit_code=None))
+    blob_client = FakeBlobClient("first line\nsecond line é\n".encode())
+
+    log = get_log.get_log_from_storage(blob_client, "cluster", "app", task, tail=True, current_bytes=11)
+
+    assert log.log == "second line é\n"
+    assert log.total_bytes == len(blob_client.content)
+    assert blob_client.downloaded == len(blob_client.content) - 11
+
+    log = get_log.get_log_from_storage(blob_client, "cluster", "app", task, tail=True, current_bytes=log.total_bytes)
+    assert log.log == ""
+
+
+def test_stream_log_from_storage_in_ranges(monkeypatch):
+    content = "é" * 1000 + "end\n"
+    blob_client = SimpleNamespace(
+        get_blob_properties=lambda container_name, blob_name: SimpleNamespace(
+            properties=SimpleNamespace(content_length=len(content.encode()))),
+        get_blob_to_bytes=lambda container_name, blob_name, start_range, end_range: SimpleNamespace(
+            content=content.encode()[start_range:end_range + 1]))
+    task = SimpleNamespace(state=batch_models.TaskState.completed)
+    batch_client = SimpleNamespace(task=SimpleNamespace(get=lambda cluster_id, application_name: task))
+    # the node of the task is gone
+    monkeypatch.setattr(get_log, "__check_task_node_exist", lambda *_: False)
+
+    chunks = list(get_log.stream_log(batch_client, blob_client, "cluster", "app", chunk_size=7))
+
+    assert len(chunks) > 100
+    assert "".join(chunks) == content
+    assert "".join(get_log.stream_log(batch_client, blob_client, "cluster", "app", tail_bytes=4)) == "end\n"
+
+
+class FakeBatchError(batch_models.BatchErrorException):
+    def __init__(self, status_code):
+        self.response = SimpleNamespace(status_code=status_code)
+
+
+def test_log_follower_interleaves_logs_with_few_calls():
+    node_log = b"line 1\nline 2\n"
+    states = {"running": batch_models.TaskState.running, "gone": batch_models.TaskState.completed}
+    calls = []
+
+    def list_tasks(job_id, task_list_options):
+        calls.append("list")
+        return [SimpleNamespace(id=name, state=state) for name, state in states.items()] + [
+            SimpleNamespace(id="job-manager", state=batch_models.TaskState.running)]
+
+    def get_from_task(job_id, task_id, file_path, options):
+        calls.append("get " + task_id)
+        if task_id == "gone":
+            raise FakeBatchError(404)
+        start, end = (int(i) for i in options.ocp_range[len("bytes="):].split("-"))
+        if start >= len(node_log):
+            raise FakeBatchError(416)
+        return iter([node_log[start:end + 1]])
+
+    batch_client = SimpleNamespace(
+        task=SimpleNamespace(list=list_tasks), file=SimpleNamespace(get_from_task=get_from_task))
+    blob_client = SimpleNamespace(
+        get_blob_properties=lambda container_name, blob_name: SimpleNamespace(
+            properties=SimpleNamespace(content_length=len(node_log))),
+        get_blob_to_bytes=lambda container_name, blob_name, start_range, end_range: SimpleNamespace(
+            content=node_log[start_range:end_range + 1]))
+    follower = get_log.LogFollower(batch_client, blob_client, "job", exclude=["job-manager"], min_interval=0,
+                                   max_interval=0, state_refresh_interval=0)
+
+    assert sorted(follower.poll()) == [("gone", "line 1\nline 2\n"), ("running", "line 1\nline 2\n")]
+    assert follower.poll() == []
+    assert not follower.done
+
+    states["running"] = batch_models.TaskState.completed
+    assert list(follower.follow()) == []
+    assert follower.done
+    # the node is never looked up and the log of the gone task is only requested from the node once
+    assert calls.count("get gone") == 1
+    assert "job-manager" not in follower.logs
+
+
+def test_download_logs_skips_complete_logs(tmpdir):
+    states = {
+        "done": batch_models.TaskState.completed,
+        "gone": batch_models.TaskState.completed,
+        "running": batch_models.TaskState.running,
+        "waiting": batch_models.TaskState.active,
+    }
+    downloads = []
+
+    def get_from_task(job_id, task_id, file_path):
+        downloads.append(task_id)
+        if task_id == "gone":
+            raise FakeBatchError(404)
+        return iter([task_id.encode(), b" log\n"])
+
+    def get_blob_to_stream(container_name, blob_name, stream):
+        downloads.append(blob_name)
+        stream.write(b"shipped log\n")
+
+    batch_client = SimpleNamespace(
+        task=SimpleNamespace(list=lambda job_id, task_list_options: [
+            SimpleNamespace(id=name, state=state) for name, state in states.items()]),
+        file=SimpleNamespace(get_from_task=get_from_task))
+    blob_client = SimpleNamespace(get_blob_to_stream=get_blob_to_stream)
+
+    paths = get_log.download_logs(batch_client, blob_client, "cluster", str(tmpdir))
+
+    assert sorted(paths) == ["done", "gone", "running"]
+    assert tmpdir.join("done.log").read() == "done log\n"
+    assert tmpdir.join("gone.log").read() == "shipped log\n"
+    assert tmpdir.join("running.log.partial").read() == "running log\n"
+
+    states["running"] = batch_models.TaskState.completed
+    downloads.clear()
+    paths = get_log.download_logs(batch_client, blob_client, "cluster", str(tmpdir))
+
+    assert downloads == ["running"]
+    assert sorted(tmpdir.listdir()) == sorted(tmpdir.join(name + ".log") for name in ["done", "gone", "running"])
+
+
+def test_log_follower_rejects_unknown_applications():
+    batch_client = SimpleNamespace(task=SimpleNamespace(
+        list=lambda job_id, task_list_options: [SimpleNamespace(id="app", state=batch_models.TaskState.running)]))
+    follower = get_log.LogFollower(batch_client, None, "cluster", ["app", "typo"])
+
+    with pytest.raises(error.AztkError, match="typo"):
+        follower.poll()
+
+
+def test_log_follower_sleeps_while_applications_wait_to_run(monkeypatch):
+    states = [batch_models.TaskState.active] * 3 + [batch_models.TaskState.completed]
+    reads = []
+    sleeps = []
+
+    def get_from_task(job_id, task_id, file_path, options):
+        reads.append(task_id)
+        raise FakeBatchError(416)
+
+    batch_client = SimpleNamespace(
+        task=SimpleNamespace(list=lambda job_id, task_list_options: [SimpleNamespace(id="app", state=states.pop(0))]),
+        file=SimpleNamespace(get_from_task=get_from_task))
+    follower = get_log.LogFollower(batch_client, None, "cluster", ["app"], min_interval=1, max_interval=1,
+                                   state_refresh_interval=1)
+    now = [0]
+    monkeypatch.setattr(get_log.time, "monotonic", lambda: now[0])
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        assert len(sleeps) < 10, "the follower loops without sleeping"
+        now[0] += seconds
+
+    monkeypatch.setattr(get_log.time, "sleep", sleep)
+
+    assert list(follower.follow()) == []
+    # one tick per state refresh while the application waits, the log is only read once it completed
+    assert sleeps == [1, 1, 1]
+    assert reads == ["app"]
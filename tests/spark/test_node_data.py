@@ -0,0 +1,26 @@
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import aztk.spark
+from aztk.internal.cluster_data import NodeData
+
+
+def build(index):
+    cluster_config = aztk.spark.models.ClusterConfiguration(
+        cluster_id="cluster-{0}".format(index),
+        custom_scripts=[
+            aztk.spark.models.CustomScript(
+                name="script",
+                script=aztk.spark.models.File("script.sh", io.StringIO("echo {0}".format(index))),
+                run_on="all-nodes")
+        ])
+    return NodeData(cluster_config).add_core().done().getvalue()
+
+
+def test_node_data_built_concurrently_in_memory():
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        contents = list(executor.map(build, range(16)))
+
+    for index, content in enumerate(contents):
+        with zipfile.ZipFile(io.BytesIO(content)) as zipf:
+            assert zipf.read("custom-scripts/0_script.sh") == "echo {0}".format(index).encode()
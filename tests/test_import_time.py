@@ -0,0 +1,46 @@
+"""
+    Import time of the CLI. Run this file directly to benchmark it:
+    python tests/test_import_time.py
+"""
+import json
+import os
+import subprocess
+import sys
+
+# Modules only some commands need, they must be imported by those commands
+LAZY_MODULES = ["paramiko", "Crypto", "distutils", "azure.mgmt", "azure.common.credentials", "aztk.utils.ssh",
+                "asyncio"]
+
+# Seconds, well above the measured time so the test is not flaky on slow machines
+IMPORT_TIME_BUDGET = 1.5
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import aztk_cli.entrypoint
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure_import():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, "-c", MEASURE], cwd=root)
+    return json.loads(output.decode("utf-8"))
+
+
+def benchmark(runs: int = 5) -> float:
+    return min(measure_import()["seconds"] for _ in range(runs))
+
+
+def test_cli_does_not_import_lazy_modules():
+    modules = measure_import()["modules"]
+    loaded = [module for module in LAZY_MODULES if module in modules]
+    assert loaded == []
+
+
+def test_cli_import_time_budget():
+    assert benchmark(runs=3) < IMPORT_TIME_BUDGET
+
+
+if __name__ == "__main__":
+    print("aztk_cli.entrypoint imported in {0:.3f}s (best of 5)".format(benchmark()))
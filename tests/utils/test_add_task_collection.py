@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+import pytest
+import azure.batch.models as batch_models
+import azure.batch.models.batch_error as batch_error
+from aztk.error import AztkError
+from aztk.utils import helpers
+
+
+class FakeTasks:
+    def __init__(self, max_chunk=100, server_errors=(), client_errors=()):
+        self.max_chunk = max_chunk
+        self.server_errors = set(server_errors)
+        self.client_errors = set(client_errors)
+        self.calls = []
+
+    def add_collection(self, job_id, value):
+        if len(value) > self.max_chunk:
+            exception = batch_error.BatchErrorException.__new__(batch_error.BatchErrorException)
+            exception.error = SimpleNamespace(code="RequestBodyTooLarge")
+            raise exception
+        self.calls.append([task.id for task in value])
+        results = []
+        for task in value:
+            status = batch_models.TaskAddStatus.success
+            if task.id in self.server_errors:
+                self.server_errors.remove(task.id)
+                status = batch_models.TaskAddStatus.server_error
+            elif task.id in self.client_errors:
+                status = batch_models.TaskAddStatus.client_error
+            results.append(batch_models.TaskAddResult(status=status, task_id=task.id))
+        return SimpleNamespace(value=results)
+
+
+def make_tasks(count):
+    return [batch_models.TaskAddParameter(id="task-{0}".format(i), command_line="true") for i in range(count)]
+
+
+def test_tasks_are_added_in_chunks_of_100():
+    tasks = FakeTasks()
+    helpers.add_task_collection("job", make_tasks(250), SimpleNamespace(task=tasks))
+    assert [len(call) for call in tasks.calls] == [100, 100, 50]
+
+
+def test_chunk_too_large_is_split():
+    tasks = FakeTasks(max_chunk=30)
+    helpers.add_task_collection("job", make_tasks(100), SimpleNamespace(task=tasks))
+    assert sum(len(call) for call in tasks.calls) == 100
+    assert all(len(call) <= 30 for call in tasks.calls)
+
+
+def test_server_errors_are_retried():
+    tasks = FakeTasks(server_errors=["task-3"])
+    helpers.add_task_collection("job", make_tasks(5), SimpleNamespace(task=tasks))
+    assert tasks.calls[-1] == ["task-3"]
+
+
+def test_client_errors_are_reported():
+    tasks = FakeTasks(client_errors=["task-1"])
+    with pytest.raises(AztkError) as e:
+        helpers.add_task_collection("job", make_tasks(3), SimpleNamespace(task=tasks))
+    assert "task-1" in str(e.value)
@@ -0,0 +1,119 @@
+import os
+import uuid
+from azure.common import AzureHttpError
+from azure.storage.blob import BlockBlobService
+from aztk.internal import artifacts
+from aztk.internal.cache import DiskCache
+
+
+class FakeBlobClient(BlockBlobService):
+    def __init__(self):
+        super().__init__(account_name="account" + uuid.uuid4().hex[:8], account_key="a2V5")
+        self.blobs = {}
+        self.uploads = []
+        self.containers = []
+
+    def exists(self, container_name, blob_name=None, timeout=None):
+        return (container_name, blob_name) in self.blobs
+
+    def create_container(self, container_name, metadata=None, public_access=None, fail_on_exist=False, timeout=None):
+        self.containers.append(container_name)
+        return True
+
+    def delete_container(self, container_name, fail_not_exist=False, lease_id=None, if_modified_since=None,
+                         if_unmodified_since=None, timeout=None):
+        self.containers.remove(container_name)
+        self.blobs = {key: blob for key, blob in self.blobs.items() if key[0] != container_name}
+
+    def create_blob_from_path(self, container_name, blob_name, file_path, progress_callback=None, **kwargs):
+        if container_name not in self.containers:
+            raise AzureHttpError("ErrorCode: ContainerNotFound", 404)
+        self.uploads.append(blob_name)
+        with open(file_path, "rb") as f:
+            self.blobs[(container_name, blob_name)] = f.read()
+        if progress_callback:
+            size = len(self.blobs[(container_name, blob_name)])
+            progress_callback(size, size)
+
+
+def test_identical_files_are_uploaded_once(tmpdir, monkeypatch):
+    monkeypatch.setattr(artifacts, "file_hash_cache", DiskCache("file-hashes", ttl=60, directory=str(tmpdir)))
+    first = tmpdir.join("app.jar")
+    first.write("content")
+    second = tmpdir.mkdir("other").join("dependency.jar")
+    second.write("content")
+    blob_client = FakeBlobClient()
+    store = artifacts.ArtifactStore(blob_client)
+
+    first_file = store.upload_resource_file(str(first))
+    second_file = store.upload_resource_file(str(second))
+
+    assert len(blob_client.uploads) == 1
+    assert blob_client.uploads[0].startswith("artifacts/")
+    assert first_file.file_path == "app.jar"
+    assert second_file.file_path == "dependency.jar"
+    assert blob_client.uploads[0] in second_file.blob_source
+
+
+def test_artifacts_are_shared_between_stores(tmpdir, monkeypatch):
+    monkeypatch.setattr(artifacts, "file_hash_cache", DiskCache("file-hashes", ttl=60, directory=str(tmpdir)))
+    path = tmpdir.join("app.py")
+    path.write("print('hello')")
+    blob_client = FakeBlobClient()
+
+    artifacts.ArtifactStore(blob_client).upload(str(path))
+    artifacts.ArtifactStore(blob_client).upload(str(path))
+
+    assert len(blob_client.uploads) == 1
+
+
+def test_files_are_uploaded_in_one_batch(tmpdir, monkeypatch):
+    monkeypatch.setattr(artifacts, "file_hash_cache", DiskCache("file-hashes", ttl=60, directory=str(tmpdir)))
+    paths = []
+    for i in range(12):
+        path = tmpdir.join("dependency{0}.jar".format(i))
+        path.write("x" * (i + 1))
+        paths.append(str(path))
+    blob_client = FakeBlobClient()
+    progress = []
+
+    blobs = artifacts.ArtifactStore(blob_client).upload_all(paths, lambda uploaded, total: progress.append(
+        (uploaded, total)))
+
+    assert [blob.dest for blob in blobs] == [os.path.basename(path) for path in paths]
+    assert len(blob_client.uploads) == 12
+    assert len(blob_client.containers) <= 1
+    assert max(progress) == (78, 78)
+
+
+def test_container_deleted_by_another_process_is_created_again(tmpdir, monkeypatch):
+    monkeypatch.setattr(artifacts, "file_hash_cache", DiskCache("file-hashes", ttl=60, directory=str(tmpdir)))
+    first = tmpdir.join("app.jar")
+    first.write("first")
+    second = tmpdir.join("dependency.jar")
+    second.write("second")
+    blob_client = FakeBlobClient()
+    store = artifacts.ArtifactStore(blob_client)
+    store.upload(str(first))
+
+    # deleted behind the back of this process, which remembers it created the container
+    blob_client.delete_container(store.CONTAINER)
+    store.upload(str(second))
+
+    assert blob_client.containers == [store.CONTAINER]
+    assert len(blob_client.uploads) == 2
+
+
+def test_hash_is_cached_until_file_changes(tmpdir, monkeypatch):
+    cache = DiskCache("file-hashes", ttl=60, directory=str(tmpdir))
+    monkeypatch.setattr(artifacts, "file_hash_cache", cache)
+    path = tmpdir.join("app.py")
+    path.write("first")
+    digest = artifacts.file_sha256(str(path))
+
+    assert len(cache._entries) == 1
+    assert artifacts.file_sha256(str(path)) == digest
+
+    path.write("second version")
+    assert artifacts.file_sha256(str(path)) != digest
+    assert len(cache._entries) == 2
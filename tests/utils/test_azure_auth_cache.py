@@ -0,0 +1,153 @@
+import threading
+import time
+from types import SimpleNamespace
+import azure.common.credentials
+import pytest
+from aztk.internal.cache import DiskCache, TTLCache
+from aztk.utils import azure_api, constants
+
+
+def test_resolved_values_are_cached():
+    store = TTLCache(ttl=60)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return "https://account.region.batch.azure.com/"
+
+    assert azure_api.cached_resolve("endpoint", fetch, store=store) == "https://account.region.batch.azure.com/"
+    assert azure_api.cached_resolve("endpoint", fetch, store=store) == "https://account.region.batch.azure.com/"
+    assert len(calls) == 1
+
+
+def test_old_values_are_refreshed_in_background(monkeypatch):
+    monkeypatch.setattr(constants, "AUTH_CACHE_REFRESH_AFTER", 0)
+    store = TTLCache(ttl=60)
+    store.set("key", {"value": "old", "time": time.time() - 10})
+    refreshed = threading.Event()
+
+    def fetch():
+        refreshed.set()
+        return "new"
+
+    assert azure_api.cached_resolve("key", fetch, store=store) == "old"
+    assert refreshed.wait(5)
+    for _ in range(100):
+        if store.get("key")["value"] == "new":
+            break
+        time.sleep(0.01)
+    assert store.get("key")["value"] == "new"
+
+
+def test_tokens_are_shared_between_processes(tmpdir, monkeypatch):
+    fetched = []
+
+    class FakeServicePrincipalCredentials:
+        def __init__(self, client_id, secret, tenant, resource):
+            fetched.append(resource)
+            self.token = {"access_token": "token-{0}".format(len(fetched)), "expires_at": time.time() + 3600}
+
+    monkeypatch.setattr(azure.common.credentials, "ServicePrincipalCredentials", FakeServicePrincipalCredentials)
+    service_principal = SimpleNamespace(client_id="client", credential="secret", tenant_id="tenant")
+
+    first = azure_api.make_service_principal_credentials(
+        service_principal, azure_api.BATCH_RESOURCE, DiskCache("auth", 60, directory=str(tmpdir), private=True))
+    # a new cache instance reads the file, like another process would
+    second = azure_api.make_service_principal_credentials(
+        service_principal, azure_api.BATCH_RESOURCE, DiskCache("auth", 60, directory=str(tmpdir), private=True))
+
+    assert fetched == [azure_api.BATCH_RESOURCE]
+    assert second.signed_session().headers["Authorization"] == "Bearer token-1"
+    assert (tmpdir.join("auth.json").stat().mode & 0o777) == 0o600
+
+    second.token["expires_at"] = time.time()
+    second.store.invalidate()
+    assert second.signed_session().headers["Authorization"] == "Bearer token-2"
+    assert first.token["access_token"] == "token-1"
+
+
+def test_private_cache_directory_is_tightened(tmpdir):
+    directory = tmpdir.mkdir("cache")
+    directory.chmod(0o755)
+    DiskCache("auth", 60, directory=str(directory), private=True).set("key", "value")
+
+    assert (directory.stat().mode & 0o777) == 0o700
+
+
+def test_rejected_token_is_replaced_once(tmpdir, monkeypatch):
+    import io
+    import requests
+
+    class FakeServicePrincipalCredentials:
+        tokens = ["revoked", "new"]
+
+        def __init__(self, client_id, secret, tenant, resource):
+            self.token = {"access_token": self.tokens.pop(0), "expires_at": time.time() + 3600}
+
+    class BatchAdapter(requests.adapters.BaseAdapter):
+        authorizations = []
+
+        def send(self, request, **kwargs):
+            self.authorizations.append(request.headers["Authorization"])
+            response = requests.Response()
+            response.status_code = 200 if request.headers["Authorization"] == "Bearer new" else 401
+            response.raw = io.BytesIO(b"")
+            response.request = request
+            response.connection = self
+            return response
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(azure.common.credentials, "ServicePrincipalCredentials", FakeServicePrincipalCredentials)
+    service_principal = SimpleNamespace(client_id="client", credential="secret", tenant_id="tenant")
+    store = DiskCache("auth", 60, directory=str(tmpdir), private=True)
+    credentials = azure_api.make_service_principal_credentials(service_principal, azure_api.BATCH_RESOURCE, store)
+    session = credentials.signed_session()
+    session.mount("https://", BatchAdapter())
+    credentials.signed_session(session)
+
+    assert session.get("https://account.region.batch.azure.com/pools").status_code == 200
+    assert BatchAdapter.authorizations == ["Bearer revoked", "Bearer new"]
+    assert DiskCache("auth", 60, directory=str(tmpdir)).get(credentials._key)["access_token"] == "new"
+    assert len(session.hooks["response"]) == 1
+
+
+def test_rejected_storage_key_is_replaced_once(monkeypatch):
+    import base64
+    from azure.common import AzureHttpError
+    from azure.storage.blob import BlockBlobService
+    from azure.storage.common._http import HTTPResponse
+
+    old_key, new_key = (base64.b64encode(key).decode() for key in (b"old", b"new"))
+    service_principal = SimpleNamespace(client_id="client", storage_account_resource_id="storage")
+    store = TTLCache(ttl=60)
+    store.set(azure_api._storage_key_cache_key(service_principal), {"value": old_key, "time": time.time()})
+    resolved = []
+
+    def resolve_storage_account_key(service_principal, store):
+        assert store.get(azure_api._storage_key_cache_key(service_principal)) is None
+        resolved.append(new_key)
+        return new_key
+
+    monkeypatch.setattr(azure_api, "resolve_storage_account_key", resolve_storage_account_key)
+    blob_client = azure_api.retry_with_new_storage_key(
+        BlockBlobService(account_name="account", account_key=old_key), service_principal, store)
+    sent_with = []
+    valid_keys = [new_key]
+
+    def perform_request(request):
+        sent_with.append(blob_client.authentication.account_key)
+        return HTTPResponse(201 if sent_with[-1] in valid_keys else 403, "", {}, b"")
+
+    blob_client._httpclient.perform_request = perform_request
+    assert blob_client.create_container("container", fail_on_exist=True)
+    assert sent_with == [old_key, new_key]
+    assert resolved == [new_key]
+
+    # a key which is rejected again is looked up only once per request
+    valid_keys.clear()
+    monkeypatch.setattr(azure_api, "resolve_storage_account_key", lambda *_: resolved.append(old_key) or old_key)
+    with pytest.raises(AzureHttpError):
+        blob_client.create_container("other", fail_on_exist=True)
+    assert resolved == [new_key, old_key]
@@ -0,0 +1,47 @@
+from aztk.internal.cache import DiskCache, TTLCache
+
+
+def test_entries_expire():
+    cache = TTLCache(ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=-1)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+
+def test_tuple_keys_and_invalidation():
+    cache = TTLCache(ttl=60)
+    cache.set(("account", "Canonical"), 1)
+    cache.set(("account", "Other"), 2)
+    cache.invalidate(("account", "Canonical"))
+    assert cache.get(("account", "Canonical")) is None
+    assert cache.get(("account", "Other")) == 2
+    cache.invalidate()
+    assert cache.get(("account", "Other")) is None
+
+
+def test_get_or_set_only_computes_once():
+    cache = TTLCache(ttl=60)
+    calls = []
+    for _ in range(3):
+        assert cache.get_or_set("key", lambda: calls.append(1) or "value") == "value"
+    assert len(calls) == 1
+
+
+def test_disk_cache_is_shared_between_instances(tmpdir):
+    DiskCache("test", ttl=60, directory=str(tmpdir)).set(("a", "b"), {"sku": "16.04"})
+    assert DiskCache("test", ttl=60, directory=str(tmpdir)).get(("a", "b")) == {"sku": "16.04"}
+
+
+def test_disk_cache_invalidation_is_persisted(tmpdir):
+    DiskCache("test", ttl=60, directory=str(tmpdir)).set("a", 1)
+    DiskCache("test", ttl=60, directory=str(tmpdir)).invalidate()
+    assert DiskCache("test", ttl=60, directory=str(tmpdir)).get("a") is None
+
+
+def test_disk_cache_ignores_corrupted_file(tmpdir):
+    tmpdir.join("test.json").write("not json")
+    cache = DiskCache("test", ttl=60, directory=str(tmpdir))
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert DiskCache("test", ttl=60, directory=str(tmpdir)).get("a") == 1
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+import azure.common
+import pytest
+from aztk.node_scripts.core.log_shipper import LogShipper
+
+
+class FakeAppendBlobClient:
+    def __init__(self, lose_response_at: int = None):
+        self.lose_response_at = lose_response_at
+        self.blobs = {}
+        self.appends = 0
+
+    def create_container(self, container_name, fail_on_exist=True):
+        return True
+
+    def create_blob(self, container_name, blob_name):
+        self.blobs[blob_name] = b""
+
+    def append_block(self, container_name, blob_name, block, appendpos_condition=None):
+        if appendpos_condition != len(self.blobs[blob_name]):
+            raise azure.common.AzureHttpError("The append position condition specified was not met.", 412)
+        self.blobs[blob_name] += block
+        self.appends += 1
+        if self.appends == self.lose_response_at:
+            raise ConnectionError("connection reset")
+
+    def get_blob_properties(self, container_name, blob_name):
+        return SimpleNamespace(properties=SimpleNamespace(content_length=len(self.blobs[blob_name])))
+
+    def delete_blob(self, container_name, blob_name):
+        del self.blobs[blob_name]
+
+
+def test_ship_resyncs_after_a_lost_append(tmpdir):
+    log = tmpdir.join("output.log")
+    blob_client = FakeAppendBlobClient(lose_response_at=1)
+    shipper = LogShipper(blob_client, "logs", "app/output.log", str(log))
+    blob_client.create_blob("logs", "app/output.log")
+
+    log.write("hello ")
+    with pytest.raises(ConnectionError):
+        shipper.ship()
+    assert shipper.offset == 0
+
+    log.write("hello world")
+    shipper.ship()
+
+    assert blob_client.blobs["app/output.log"] == b"hello world"
+    assert shipper.offset == len(b"hello world")
+
+
+def test_stop_ships_the_end_of_the_log(tmpdir):
+    log = tmpdir.join("output.log")
+    blob_client = FakeAppendBlobClient()
+    shipper = LogShipper(blob_client, "logs", "app/output.log", str(log), interval=60)
+    shipper.start()
+
+    log.write("first line\nlast line\n")
+    shipper.stop()
+
+    assert not shipper.is_alive()
+    assert blob_client.blobs["app/output.log"] == b"first line\nlast line\n"
+
+
+def test_delete_removes_the_append_blob(tmpdir):
+    blob_client = FakeAppendBlobClient()
+    shipper = LogShipper(blob_client, "logs", "app/output.log", str(tmpdir.join("output.log")))
+    shipper.start()
+    shipper.stop()
+
+    shipper.delete()
+
+    assert "app/output.log" not in blob_client.blobs
@@ -0,0 +1,89 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import azure.batch.batch_auth as batch_auth
+import azure.batch.batch_service_client as batch
+from aztk.utils import metrics
+
+
+class BatchHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/pools?"):
+            body = {"value": [{"id": "pool-1"}], "odata.nextLink": "http://{0}:{1}/pools?page=2".format(
+                *self.server.server_address)} if "page=2" not in self.path else {"value": [{"id": "pool-2"}]}
+        else:
+            body = {"id": "pool-1", "vmSize": "standard_a2"}
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *_):
+        pass
+
+
+def make_batch_client(registry):
+    server = HTTPServer(("127.0.0.1", 0), BatchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    credentials = batch_auth.SharedKeyCredentials("account", "YWNjb3VudGtleQ==")
+    client = batch.BatchServiceClient(credentials, base_url="http://{0}:{1}".format(*server.server_address))
+    return metrics.instrument_batch_client(client, registry), server
+
+
+def test_batch_calls_are_recorded():
+    registry = metrics.MetricsRegistry()
+    client, server = make_batch_client(registry)
+    try:
+        assert client.pool.get("pool-1").vm_size == "standard_a2"
+        assert [pool.id for pool in client.pool.list()] == ["pool-1", "pool-2"]
+    finally:
+        server.shutdown()
+
+    snapshot = registry.snapshot()
+    assert snapshot["operations"]["batch.pool.get"]["count"] == 1
+    assert snapshot["operations"]["batch.pool.list"]["count"] == 2
+    assert snapshot["operations"]["batch.pool.get"]["histogram"]["+Inf"] == 1
+    assert snapshot["services"]["batch"]["requests"] == 3
+    assert snapshot["services"]["batch"]["status_codes"] == {"200": 3}
+    assert snapshot["services"]["batch"]["bytes_received"] > 0
+
+
+def test_registry_records_to_parent():
+    parent = metrics.MetricsRegistry()
+    registry = metrics.MetricsRegistry(parent=parent, buckets=(1, 10))
+    registry.observe_call("blob.get_blob_to_text", 2)
+    registry.observe_call("blob.get_blob_to_text", 20, failed=True)
+    registry.observe_response("blob", 503)
+    registry.observe_retry("blob")
+
+    for snapshot in (registry.snapshot(), parent.snapshot()):
+        stats = snapshot["operations"]["blob.get_blob_to_text"]
+        assert (stats["count"], stats["errors"], stats["max_seconds"]) == (2, 1, 20)
+        assert snapshot["services"]["blob"]["throttled"] == 1
+        assert snapshot["services"]["blob"]["retries"] == 1
+    assert registry.snapshot()["operations"]["blob.get_blob_to_text"]["histogram"] == {"1": 0, "10": 1, "+Inf": 2}
+
+
+def test_exporters():
+    registry = metrics.MetricsRegistry(buckets=(1,))
+    registry.observe_call("batch.pool.get", 0.5)
+    registry.observe_response("batch", 200, bytes_received=10)
+    snapshot = registry.snapshot()
+
+    assert json.loads(metrics.export(snapshot, "json")) == snapshot
+    prometheus = metrics.export(snapshot, "prometheus")
+    assert 'aztk_operation_duration_seconds_bucket{operation="batch.pool.get",le="1"} 1' in prometheus
+    assert 'aztk_bytes_received_total{service="batch"} 10' in prometheus
+    assert 'aztk_responses_total{service="batch",code="200"} 1' in prometheus
+
+
+def test_prometheus_label_values_are_escaped():
+    registry = metrics.MetricsRegistry(buckets=(1,))
+    registry.observe_call('custom "op"\\path\nnext', 0.5)
+
+    prometheus = metrics.export(registry.snapshot(), "prometheus")
+
+    assert 'aztk_operation_errors_total{operation="custom \\"op\\"\\\\path\\nnext"} 0' in prometheus
+    assert all(line.startswith(("# ", "aztk_")) for line in prometheus.splitlines())
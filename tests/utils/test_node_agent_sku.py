@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+import azure.batch.models as batch_models
+from aztk.internal.cache import DiskCache
+from aztk.utils import helpers
+
+
+class FakeAccount:
+    def __init__(self):
+        self.calls = 0
+
+    def list_node_agent_skus(self):
+        self.calls += 1
+        return [
+            SimpleNamespace(
+                id="batch.node.ubuntu 16.04",
+                verified_image_references=[
+                    batch_models.ImageReference("Canonical", "UbuntuServer", "16.04-LTS", "latest"),
+                    batch_models.ImageReference("Canonical", "UbuntuServer", "14.04.5-LTS", "latest"),
+                ])
+        ]
+
+
+def test_resolution_is_cached(tmpdir, monkeypatch):
+    monkeypatch.setattr(helpers, "node_agent_sku_cache", DiskCache("skus", ttl=60, directory=str(tmpdir)))
+    account = FakeAccount()
+    batch_client = SimpleNamespace(account=account, config=SimpleNamespace(base_url="https://account"))
+
+    for _ in range(3):
+        sku, image_ref = helpers.select_latest_verified_vm_image_with_node_agent_sku(
+            "Canonical", "UbuntuServer", "16.04", batch_client)
+        assert sku == "batch.node.ubuntu 16.04"
+        assert image_ref.sku == "16.04-LTS"
+    assert account.calls == 1
+
+    helpers.invalidate_node_agent_sku_cache()
+    helpers.select_latest_verified_vm_image_with_node_agent_sku("Canonical", "UbuntuServer", "16.04", batch_client)
+    assert account.calls == 2
@@ -0,0 +1,58 @@
+import zipfile
+from aztk.internal.cache import DiskCache
+from aztk.internal.cluster_data import node_scripts_bundle
+from aztk.internal.cluster_data.node_scripts_bundle import NodeScriptsBundle
+
+
+class FakeBlobClient:
+    account_name = "bundle-account"
+    MAX_SINGLE_PUT_SIZE = 64 * 1024 * 1024
+
+    def __init__(self):
+        self.uploads = []
+
+    def exists(self, container_name, blob_name=None):
+        return False
+
+    def create_container(self, container_name, fail_on_exist=False):
+        return True
+
+    def create_blob_from_path(self, container_name, blob_name, file_path, **kwargs):
+        self.uploads.append(blob_name)
+
+
+def make_bundle(tmpdir):
+    return NodeScriptsBundle(source_path=str(tmpdir.join("aztk")), cache_directory=str(tmpdir.join("cache")))
+
+
+def test_bundle_is_built_and_uploaded_once(tmpdir, monkeypatch):
+    monkeypatch.setattr(node_scripts_bundle, "node_scripts_digest_cache",
+                        DiskCache("node-scripts", ttl=60, directory=str(tmpdir)))
+    tmpdir.mkdir("aztk").mkdir("node_scripts").join("setup_node.sh").write("echo setup\r\n")
+    tmpdir.join("aztk", "node_scripts", "setup_node.pyc").write("compiled")
+    blob_client = FakeBlobClient()
+
+    first = make_bundle(tmpdir)
+    blob_data = first.upload(blob_client)
+    second = make_bundle(tmpdir)
+    second.upload(blob_client)
+
+    assert blob_client.uploads == ["{0}.zip".format(first.digest)]
+    assert blob_data.container == NodeScriptsBundle.CONTAINER
+    assert blob_data.dest == NodeScriptsBundle.FILE_NAME
+    assert second.digest == first.digest
+    with zipfile.ZipFile(first.build()) as zipf:
+        assert zipf.namelist() == ["aztk/node_scripts/setup_node.sh"]
+        assert zipf.read("aztk/node_scripts/setup_node.sh") == b"echo setup\n"
+
+
+def test_digest_changes_with_the_scripts(tmpdir, monkeypatch):
+    monkeypatch.setattr(node_scripts_bundle, "node_scripts_digest_cache",
+                        DiskCache("node-scripts", ttl=60, directory=str(tmpdir)))
+    script = tmpdir.mkdir("aztk").join("submit.py")
+    script.write("print('v1')")
+    digest = make_bundle(tmpdir).digest
+
+    script.write("print('version 2')")
+
+    assert make_bundle(tmpdir).digest != digest
@@ -0,0 +1,66 @@
+import importlib
+import threading
+import pytest
+
+NODE_ENVIRONMENT = {
+    "AZ_BATCH_ACCOUNT_NAME": "account",
+    "BATCH_ACCOUNT_KEY": "a2V5",
+    "BATCH_SERVICE_URL": "https://account.region.batch.azure.com",
+    "SP_TENANT_ID": "",
+    "SP_CLIENT_ID": "",
+    "SP_CREDENTIAL": "",
+    "SP_BATCH_RESOURCE_ID": "",
+    "SP_STORAGE_RESOURCE_ID": "",
+    "AZ_BATCH_POOL_ID": "cluster",
+    "AZ_BATCH_NODE_ID": "node",
+    "AZ_BATCH_NODE_IS_DEDICATED": "true",
+    "SPARK_WEB_UI_PORT": "8080",
+    "SPARK_WORKER_UI_PORT": "8081",
+    "SPARK_JOB_UI_PORT": "4040",
+    "STORAGE_ACCOUNT_NAME": "account",
+    "STORAGE_ACCOUNT_KEY": "a2V5",
+    "STORAGE_ACCOUNT_SUFFIX": "core.windows.net",
+}
+
+
+@pytest.fixture
+def config(tmpdir, monkeypatch):
+    for name, value in NODE_ENVIRONMENT.items():
+        monkeypatch.setenv(name, value)
+    # the node scripts read their configuration from the environment when they are imported
+    config = importlib.import_module("aztk.node_scripts.core.config")
+    monkeypatch.setattr(config, "resolved_config_path", str(tmpdir.join(".resolved-config.json")))
+    return config
+
+
+def test_resolved_values_round_trip(config):
+    config.save_resolved_config("/batch/account", "https://account.region.batch.azure.com/")
+    config.save_resolved_config("/storage/account", "key")
+
+    assert config.read_resolved_config() == {
+        "/batch/account": "https://account.region.batch.azure.com/",
+        "/storage/account": "key",
+    }
+
+
+def test_missing_or_corrupt_config_is_empty(config, tmpdir):
+    assert config.read_resolved_config() == {}
+
+    tmpdir.join(".resolved-config.json").write("{not json")
+    assert config.read_resolved_config() == {}
+
+    config.save_resolved_config("/storage/account", "key")
+    assert config.read_resolved_config() == {"/storage/account": "key"}
+
+
+def test_concurrent_saves_keep_every_value(config, tmpdir):
+    threads = [
+        threading.Thread(target=config.save_resolved_config, args=("key-{0}".format(i), str(i))) for i in range(16)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert config.read_resolved_config() == {"key-{0}".format(i): str(i) for i in range(16)}
+    assert [path.basename for path in tmpdir.listdir(lambda path: path.ext == ".tmp")] == []
@@ -0,0 +1,96 @@
+import json
+from azure.common import AzureHttpError
+import azure.storage.blob.models as blob_models
+import pytest
+from aztk.internal.cache import DiskCache
+from aztk.utils import constants, helpers
+
+
+class FakeBlobClient:
+    account_name = "account"
+    MAX_SINGLE_PUT_SIZE = 10
+    MAX_BLOCK_SIZE = 4
+
+    def __init__(self, fail_at_block: int = None):
+        self.fail_at_block = fail_at_block
+        self.uncommitted = {}
+        self.blobs = {}
+        self.put_blocks = []
+        self.deleted = False
+
+    def put_block(self, container_name, blob_name, block, block_id):
+        if len(self.put_blocks) == self.fail_at_block:
+            self.fail_at_block = None
+            raise ConnectionError("connection reset")
+        self.put_blocks.append(block_id)
+        self.uncommitted[block_id] = block
+
+    def get_block_list(self, container_name, blob_name, block_list_type=None):
+        if self.deleted:
+            raise AzureHttpError("ErrorCode: BlobNotFound", 404)
+        block_list = blob_models.BlobBlockList()
+        block_list.uncommitted_blocks = [blob_models.BlobBlock(block_id) for block_id in self.uncommitted]
+        return block_list
+
+    def put_block_list(self, container_name, blob_name, block_list):
+        self.blobs[blob_name] = b"".join(self.uncommitted[block.id] for block in block_list)
+        self.uncommitted = {}
+
+
+def test_interrupted_upload_only_uploads_missing_blocks(tmpdir, monkeypatch):
+    monkeypatch.setattr(helpers, "upload_state_cache", DiskCache("uploads", ttl=60, directory=str(tmpdir)))
+    path = tmpdir.join("assembly.jar")
+    path.write(b"0123456789abcdefghij", mode="wb")
+    blob_client = FakeBlobClient(fail_at_block=3)
+
+    with pytest.raises(ConnectionError):
+        helpers.upload_blob_resumable("container", "assembly.jar", str(path), blob_client, max_connections=1)
+    assert len(blob_client.put_blocks) == 4
+
+    progress = []
+    helpers.upload_blob_resumable("container", "assembly.jar", str(path), blob_client, max_connections=1,
+                                  progress_callback=lambda current, total: progress.append((current, total)))
+
+    assert len(blob_client.put_blocks) == 5
+    assert blob_client.blobs["assembly.jar"] == b"0123456789abcdefghij"
+    assert progress[-1] == (20, 20)
+    assert helpers.upload_state_cache._entries == {}
+
+
+def test_uploaded_blocks_are_saved_every_few_blocks(tmpdir, monkeypatch):
+    monkeypatch.setattr(constants, "RESUMABLE_UPLOAD_STATE_SAVE_EVERY", 2)
+    upload_state_cache = DiskCache("uploads", ttl=60, directory=str(tmpdir))
+    saved = []
+    set_state = upload_state_cache.set
+    monkeypatch.setattr(upload_state_cache, "set", lambda key, value: saved.append(value) or set_state(key, value))
+    monkeypatch.setattr(helpers, "upload_state_cache", upload_state_cache)
+    path = tmpdir.join("assembly.jar")
+    path.write(b"0123456789abcdefghij", mode="wb")
+    blob_client = FakeBlobClient(fail_at_block=3)
+
+    with pytest.raises(ConnectionError):
+        helpers.upload_blob_resumable("container", "assembly.jar", str(path), blob_client, max_connections=1)
+
+    # saved every second block, then once more when the upload failed
+    assert [len(blocks) for blocks in saved] == [2, 4, 4]
+    [(_, blocks)] = json.loads(tmpdir.join("uploads.json").read()).values()
+    assert blocks == saved[-1]
+
+
+def test_upload_starts_over_when_the_blob_was_deleted(tmpdir, monkeypatch):
+    monkeypatch.setattr(helpers, "upload_state_cache", DiskCache("uploads", ttl=60, directory=str(tmpdir)))
+    path = tmpdir.join("assembly.jar")
+    path.write(b"0123456789abcdefghij", mode="wb")
+    blob_client = FakeBlobClient(fail_at_block=3)
+
+    with pytest.raises(ConnectionError):
+        helpers.upload_blob_resumable("container", "assembly.jar", str(path), blob_client, max_connections=1)
+    # deleted with its uncommitted blocks, e.g. with the container of the cluster
+    blob_client.deleted = True
+    blob_client.uncommitted = {}
+    blob_client.put_blocks = []
+
+    helpers.upload_blob_resumable("container", "assembly.jar", str(path), blob_client, max_connections=1)
+
+    assert len(blob_client.put_blocks) == 5
+    assert blob_client.blobs["assembly.jar"] == b"0123456789abcdefghij"
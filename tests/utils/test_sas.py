@@ -0,0 +1,32 @@
+from azure.storage.blob import BlobPermissions, BlockBlobService
+from aztk.internal.sas import SasProvider
+
+
+def test_container_sas_is_signed_once_per_container_and_permission():
+    blob_client = BlockBlobService(account_name="account", account_key="a2V5")
+    signed = []
+    generate = blob_client.generate_container_shared_access_signature
+
+    def generate_container_shared_access_signature(container_name, **kwargs):
+        signed.append(container_name)
+        return generate(container_name, **kwargs)
+
+    blob_client.generate_container_shared_access_signature = generate_container_shared_access_signature
+    provider = SasProvider()
+
+    urls = [provider.blob_url(blob_client, "cluster", "app/file{0}.jar".format(i)) for i in range(100)]
+    provider.blob_url(blob_client, "cluster", "app/output.log", permission=BlobPermissions.WRITE)
+    provider.blob_url(blob_client, "other-cluster", "app/file.jar")
+
+    assert signed == ["cluster", "cluster", "other-cluster"]
+    assert len(set(urls)) == 100
+    assert all(url.split("?")[1] == urls[0].split("?")[1] for url in urls)
+
+
+def test_resource_files_only_get_container_tokens_when_asked():
+    from aztk.internal.cluster_data import BlobData
+    blob_client = BlockBlobService(account_name="account", account_key="a2V5")
+    blob_data = BlobData(blob_client, "cluster", "cluster/config.yaml")
+
+    assert "sr=b" in blob_data.to_resource_file().blob_source
+    assert "sr=c" in blob_data.to_resource_file(container_token=True).blob_source
@@ -0,0 +1,216 @@
+"""
+    SSH fan-out of cluster run against a local sshd stand-in. Run this file directly to benchmark it:
+    PYTHONPATH=. python tests/utils/test_ssh_fan_out.py
+"""
+import io
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import paramiko
+
+from aztk.utils import constants, helpers, ssh
+
+
+class StandInServer(paramiko.ServerInterface):
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_pty_request(self, *_):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        def run():
+            # answer once the client got the reply to its exec request
+            time.sleep(max(self.latency, 0.05))
+            channel.sendall(b"ok\r\n")
+            if b"hang" in command:
+                return
+            channel.sendall(b"done\r\n")
+            channel.send_exit_status(3 if b"exit 3" in command else 0)
+            channel.close()
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+
+class StandInSshd:
+    """
+    Local sshd which accepts any key and answers every command with two lines after `latency` seconds.
+    Commands containing 'exit 3' exit with status 3, commands containing 'hang' never exit after the first line.
+    The first `drop` connections are closed before the SSH banner is sent.
+    """
+
+    def __init__(self, latency: float = 0, drop: int = 0):
+        self.latency = latency
+        self.drop = drop
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(128)
+        self.port = self.socket.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with self.lock:
+            self.connections += 1
+            if self.connections <= self.drop:
+                conn.close()
+                return
+        transport = paramiko.Transport(conn)
+        try:
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=StandInServer(self.latency))
+            while transport.is_active():
+                time.sleep(0.01)
+        finally:
+            transport.close()
+
+    def nodes(self, count: int):
+        return [("node-{0}".format(i), SimpleNamespace(ip_address="127.0.0.1", port=self.port)) for i in range(count)]
+
+    def close(self):
+        self.socket.close()
+
+
+def private_key() -> str:
+    key = io.StringIO()
+    paramiko.RSAKey.generate(2048).write_private_key(key)
+    return key.getvalue()
+
+
+def run(sshd, count: int, max_concurrency: int, key: str, command: str = "ls", nodes=None, output_callback=None,
+        command_timeout=constants.SSH_COMMAND_TIMEOUT):
+    return helpers.run_coroutine(
+        ssh.clus_exec_command(command, "spark", "aztk", nodes or sshd.nodes(count), ssh_key=key,
+                              max_concurrency=max_concurrency, output_callback=output_callback,
+                              command_timeout=command_timeout))
+
+
+def test_fan_out_bounds_connections_and_parses_key_once(monkeypatch):
+    parsed = []
+    from_private_key = paramiko.RSAKey.from_private_key
+    monkeypatch.setattr(paramiko.RSAKey, "from_private_key",
+                        lambda *args, **kwargs: parsed.append(1) or from_private_key(*args, **kwargs))
+    lock = threading.Lock()
+    open_clients = set()
+    max_open_clients = []
+    connect, close = paramiko.SSHClient.connect, paramiko.SSHClient.close
+
+    def counted_connect(client, *args, **kwargs):
+        with lock:
+            open_clients.add(client)
+            max_open_clients.append(len(open_clients))
+        return connect(client, *args, **kwargs)
+
+    def counted_close(client):
+        with lock:
+            open_clients.discard(client)
+        return close(client)
+
+    monkeypatch.setattr(paramiko.SSHClient, "connect", counted_connect)
+    monkeypatch.setattr(paramiko.SSHClient, "close", counted_close)
+    sshd = StandInSshd(latency=0.05)
+    try:
+        results = run(sshd, count=12, max_concurrency=3, key=private_key())
+    finally:
+        sshd.close()
+
+    assert [result.node_id for result in results] == ["node-{0}".format(i) for i in range(12)]
+    assert not any(result.failed for result in results)
+    assert sshd.connections == 12
+    assert max(max_open_clients) == 3
+    assert len(parsed) == 1
+
+
+def test_fan_out_retries_transient_connect_failures(monkeypatch):
+    monkeypatch.setattr(constants, "SSH_CONNECT_RETRY_INTERVAL", 0)
+    sshd = StandInSshd(drop=2)
+    try:
+        results = run(sshd, count=1, max_concurrency=1, key=private_key())
+    finally:
+        sshd.close()
+
+    assert results[0].exit_code == 0
+    assert sshd.connections == 3
+
+
+def test_cluster_run_results(monkeypatch):
+    monkeypatch.setattr(constants, "SSH_CONNECT_RETRY_INTERVAL", 0)
+    sshd = StandInSshd()
+    closed_port = socket.socket()
+    closed_port.bind(("127.0.0.1", 0))
+    nodes = sshd.nodes(2) + [("unreachable", SimpleNamespace(ip_address="127.0.0.1",
+                                                             port=closed_port.getsockname()[1]))]
+    lines = []
+    try:
+        results = run(sshd, count=0, max_concurrency=4, key=private_key(), command="make; exit 3", nodes=nodes,
+                      output_callback=lambda node_id, line: lines.append((node_id, line)))
+    finally:
+        sshd.close()
+        closed_port.close()
+
+    assert [(result.node_id, result.exit_code, result.output) for result in results] == [
+        ("node-0", 3, "ok\ndone"), ("node-1", 3, "ok\ndone"), ("unreachable", None, "")]
+    assert all(result.failed for result in results)
+    assert results[0].duration > 0
+    assert results[2].error
+    assert sorted(lines) == [("node-0", "done"), ("node-0", "ok"), ("node-1", "done"), ("node-1", "ok")]
+
+
+def test_command_which_never_exits_times_out():
+    sshd = StandInSshd()
+    try:
+        start = time.monotonic()
+        results = run(sshd, count=2, max_concurrency=2, key=private_key(), command="hang", command_timeout=0.5)
+    finally:
+        sshd.close()
+
+    assert time.monotonic() - start < 10
+    assert [(result.node_id, result.exit_code, result.output) for result in results] == [
+        ("node-0", None, "ok"), ("node-1", None, "ok")]
+    assert all(result.error == "Timed out after 0.5 seconds" for result in results)
+
+
+def test_cluster_copy_returns_failures(monkeypatch, tmpdir):
+    monkeypatch.setattr(constants, "SSH_CONNECT_RETRY_INTERVAL", 0)
+    closed_port = socket.socket()
+    closed_port.bind(("127.0.0.1", 0))
+    nodes = [("unreachable", SimpleNamespace(ip_address="127.0.0.1", port=closed_port.getsockname()[1]))]
+    try:
+        results = helpers.run_coroutine(
+            ssh.clus_copy("spark", "aztk", nodes, str(tmpdir.join("file")), "/tmp/file", ssh_key=private_key()))
+    finally:
+        closed_port.close()
+
+    assert [(result.node_id, result.failed) for result in results] == [("unreachable", True)]
+    assert results[0].error
+
+
+if __name__ == "__main__":
+    key = private_key()
+    for max_concurrency in (8, 32, 128):
+        sshd = StandInSshd(latency=0.5)
+        start = time.perf_counter()
+        run(sshd, count=128, max_concurrency=max_concurrency, key=key)
+        print("128 nodes, max concurrency {0:>3}: {1:.2f}s".format(max_concurrency, time.perf_counter() - start))
+        sshd.close()
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from aztk.utils import tracing
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    tracer = tracing.Tracer()
+    tracer.enable()
+    monkeypatch.setattr(tracing, "tracer", tracer)
+    return tracer
+
+
+def test_disabled_tracer_records_nothing(monkeypatch):
+    tracer = tracing.Tracer()
+    monkeypatch.setattr(tracing, "tracer", tracer)
+    with tracing.span("phase") as span:
+        assert span is None
+    assert tracer.roots == []
+
+
+def test_spans_are_nested(tracer):
+    @tracing.traced("inner")
+    def inner():
+        pass
+
+    with tracing.span("outer", cluster_id="cluster"):
+        inner()
+        inner()
+
+    assert [span.name for span in tracer.roots] == ["outer"]
+    assert [span.name for span in tracer.roots[0].children] == ["inner", "inner"]
+    assert "outer  [cluster_id=cluster]" in tracer.format_tree()
+
+
+def test_propagate_nests_spans_from_worker_threads(tracer):
+    def work(i):
+        with tracing.span("work"):
+            return i
+
+    with tracing.span("submit"):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            assert list(executor.map(tracing.propagate(work), range(8))) == list(range(8))
+
+    assert len(tracer.roots) == 1
+    assert len(tracer.roots[0].children) == 8
+
+
+def test_chrome_trace(tracer):
+    with pytest.raises(ValueError):
+        with tracing.span("failing"):
+            raise ValueError()
+
+    events = tracer.to_chrome_trace()["traceEvents"]
+    assert len(events) == 1
+    assert events[0]["ph"] == "X"
+    assert events[0]["args"] == {"error": "ValueError"}
+    assert events[0]["dur"] >= 0
@@ -0,0 +1,50 @@
+import pytest
+from aztk.error import AztkError, WaitTimeoutError
+from aztk.utils.helpers import Waiter
+
+
+def test_polls_all_targets_together():
+    calls = []
+    remaining = {"a": 1, "b": 3, "c": 2}
+
+    def poll(pending):
+        calls.append(set(pending))
+        results = {}
+        for target in pending:
+            remaining[target] -= 1
+            results[target] = True if remaining[target] == 0 else None
+        return results
+
+    waiter = Waiter(["a", "b", "c"], poll, initial_interval=0)
+    assert waiter.wait() == {}
+    assert calls == [{"a", "b", "c"}, {"b", "c"}, {"b"}]
+
+
+def test_fail_fast_raises_first_failure():
+    def poll(pending):
+        return {"a": None, "b": AztkError("b failed")}
+
+    with pytest.raises(AztkError, match="b failed"):
+        Waiter(["a", "b"], poll, initial_interval=0).wait()
+
+
+def test_failures_are_collected_without_fail_fast():
+    def poll(pending):
+        return {"a": True, "b": AztkError("b failed")}
+
+    failures = Waiter(["a", "b"], poll, fail_fast=False, initial_interval=0).wait()
+    assert list(failures) == ["b"]
+
+
+def test_global_deadline():
+    waiter = Waiter(["a"], lambda pending: {"a": None}, timeout=0, initial_interval=0)
+    with pytest.raises(WaitTimeoutError, match="a"):
+        waiter.wait()
+
+
+def test_backoff_is_capped_and_jittered():
+    waiter = Waiter(["a"], None, initial_interval=1, max_interval=4, backoff_factor=2, jitter=0.25)
+    delays = [waiter.next_delay() for _ in range(5)]
+    assert 0.75 <= delays[0] <= 1.25
+    assert 1.5 <= delays[1] <= 2.5
+    assert all(3 <= delay <= 5 for delay in delays[2:])